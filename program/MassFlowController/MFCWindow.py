@@ -2,11 +2,13 @@ import csv
 import os
 import sys
 import time
-from queue import Queue
-from PyQt5.QtCore import QThread, pyqtSignal, QMutex, Qt, QTime
+from PyQt5.QtCore import pyqtSignal, QMutex, Qt, QTime
 from PyQt5.QtWidgets import (QMessageBox, QDialog, QTableWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox,
                              QDialogButtonBox, QTableWidgetItem, QFileDialog, QHeaderView, QTimeEdit)
 from program.MassFlowController.mfcdev import MFCComm
+from program.SerialDev.commandQueue import CommandQueue, PRIORITY_CONTROL, PRIORITY_SETPOINT, PRIORITY_BACKGROUND
+from program.SerialDev.serialEngine import EngineBridge
+from program.SerialDev.telemetry import SnapshotBuffer, TelemetryRecord
 
 BASE_DIR = os.path.dirname(os.path.realpath(sys.argv[0]))
 mfc_config_path = os.path.join(BASE_DIR, 'config', 'mfc_config')
@@ -167,78 +169,253 @@ class MFCInputData:
         self.addr = addr
 
 
-class MFCOutputData:
-    def __init__(self, pv=None, sv=None, ctrl_mode=None, switch_state=None, unit=None, full_scale=None):
-        self.pv = pv
-        self.sv = sv
-        self.ctrl_mode = ctrl_mode
-        self.switch_state = switch_state
-        self.unit = unit
-        self.fs = full_scale
+class MFCOutputData(TelemetryRecord):
+    """一台流量计一次读取的状态，timestamp为读取时刻（time.time()）"""
+    __slots__ = ('pv', 'sv', 'ctrl_mode', 'switch_state', 'unit', 'fs', 'timestamp')
 
+    def __init__(self, pv=None, sv=None, ctrl_mode=None, switch_state=None, unit=None, full_scale=None,
+                 timestamp=None):
+        super().__init__(pv=pv, sv=sv, ctrl_mode=ctrl_mode, switch_state=switch_state, unit=unit, fs=full_scale,
+                         timestamp=time.time() if timestamp is None else timestamp)
 
-class MFCWorker(QThread):
-    result_signal = pyqtSignal([list])
 
-    def __init__(self, portName, baudRate):
+class MFCWorker(EngineBridge):
+    result_signal = pyqtSignal(object)
+    presence_signal = pyqtSignal([list])
+    ack_signal = pyqtSignal(dict)
+    # 各类写命令的默认优先级
+    priorities = {'switch': PRIORITY_CONTROL, 'switch_group': PRIORITY_CONTROL, 'sv': PRIORITY_SETPOINT,
+                  'refresh_meta': PRIORITY_BACKGROUND}
+
+    def __init__(self, portName, baudRate, batchRead=True, broadcast=False, multiCoil=False, port=None,
+                 transport=None):
         super().__init__()
-        self.mfc_comm = MFCComm(portName=portName, baudRate=baudRate)
+        self.mfc_comm = MFCComm(portName=portName, baudRate=baudRate, broadcast=broadcast, multiCoil=multiCoil,
+                                port=port, transport=transport)
+        # 由串口引擎调度轮询，见EngineBridge
+        self.transport = transport
+        # 批量读取模式：每台设备一帧03+一帧01，替代逐项读取的六次收发
+        self.batch_read = batchRead
         self.start_time = time.time()
         self.stop = False
-        self.data_queue = Queue()
+        self.data_queue = CommandQueue()
         self.mutex = QMutex()
-        self.result = [None for _ in range(16)]
-
-    def run(self):
+        # 设备状态快照，发送给界面的是不可变的元组快照
+        self.snapshot = SnapshotBuffer(16)
+        # 设备在线表：只轮询在线设备，离线地址按指数退避重新探测
+        self.probe_interval_min = 1
+        self.probe_interval_max = 60
+        self.presence = [meta is not None for meta in self.mfc_comm.meta]
+        self.probe_interval = [self.probe_interval_min for _ in range(16)]
+        self.next_probe = [0 for _ in range(16)]
+        # 在线设备连续读取失败达到该次数才判为离线，偶发的超时或校验错误不清空元数据和最近状态
+        self.absent_threshold = 3
+        self.failures = [0 for _ in range(16)]
+        # 按设备自适应的轮询周期（s）：选中设备、即将切换设定值或流量未稳定的设备快速轮询，空闲设备慢速轮询
+        self.poll_fast = 0.25
+        self.poll_normal = 1
+        self.poll_idle = 3
+        self.step_lead = 3  # 距离程序下一步不足该秒数时快速轮询
+        self.deviation_ratio = 0.02  # |PV-SV|超过满量程的该比例时视为未稳定
+        self.selected = None
+        self.step_times = [[] for _ in range(16)]
+        self.poll_interval = [self.poll_normal for _ in range(16)]
+        self.next_poll = [0 for _ in range(16)]
+        # 写命令应答延迟统计，超过slow_ack（s）的命令才打印
+        self.slow_ack = 0.5
+        self.ack_count = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+
+    def poll(self):
+        """由串口引擎在收发线程中调用：发送待处理的写命令，读取到期的设备，返回距下一台设备轮询的秒数"""
         try:
-            while True:
-                while True:
-                    if self.data_queue.empty():
-                        break
-                    task = self.data_queue.get()
-                    self.write_comm(task)
-                result = self.read_comm()
-                if result:
-                    self.result_signal.emit(result)
-                if self.stop:
-                    self.mfc_comm.DisConnect()
-                    self.mfc_comm = None
-                    break
-                self.sleep(1)
+            self.data_queue.drain(self.handle_command)
+            result = self.read_comm()
+            if result:
+                self.result_signal.emit(result)
+                self.presence_signal.emit(list(self.presence))
         except Exception as e:
             print(f'An error occurred when emit mfc data: {e}')
+        return self.time_to_next_poll()
+
+    def shutdown(self):
+        if self.mfc_comm:
+            self.mfc_comm.DisConnect()
+            self.mfc_comm = None
 
     def read_comm(self):
+        """读取到期的设备，本轮没有设备到期时返回None"""
         if self.mfc_comm:
             try:
+                polled = False
                 for i in range(16):
-                    sv = self.mfc_comm.read_sv(id=i)
-                    if sv is not None:
-                        pv = self.mfc_comm.read_pv(id=i)
-                        cmode = self.mfc_comm.read_switch_single(id=i, addr=3)
-                        switch_state = self.mfc_comm.read_switch_vctrl(id=i)
-                        unit = self.mfc_comm.read_unit(id=i)
-                        fs = self.mfc_comm.read_fs(id=i)
-                        if None in [sv, pv, cmode, switch_state, unit, fs]:
-                            self.result[i] = None
-                        else:
-                            self.result[i] = MFCOutputData(pv=pv, sv=sv, ctrl_mode=cmode, switch_state=switch_state, unit=unit, full_scale=fs)
-                return self.result
+                    # 离线设备未到重新探测时间、在线设备未到轮询时间则跳过
+                    if time.monotonic() < self.due_time(i):
+                        continue
+                    # 每次设备收发之间先发送待处理的写命令
+                    self.data_queue.drain(self.handle_command)
+                    output = self.read_device(i)
+                    polled = True
+                    if output is None:
+                        self.mark_absent(i)
+                    else:
+                        self.mark_present(i)
+                        self.snapshot.write(i, output)
+                        self.schedule_poll(i, output)
+                return self.snapshot.publish() if polled else None
             except Exception as e:
                 print(f'An error occurred when read mfc parameter: {e}')
 
+    def read_device(self, id):
+        if self.batch_read:
+            output = self.mfc_comm.read_batch(id=id)
+            if output is None:
+                return None
+            pv, sv, cmode, switch_state, unit, fs = output
+            return MFCOutputData(pv=pv, sv=sv, ctrl_mode=cmode, switch_state=switch_state, unit=unit, full_scale=fs)
+        meta = self.mfc_comm.get_meta(id=id)
+        if meta is None:
+            return None
+        sv = self.mfc_comm.read_sv(id=id)
+        if sv is None:
+            return None
+        pv = self.mfc_comm.read_pv(id=id)
+        cmode = self.mfc_comm.read_switch_single(id=id, addr=3)
+        switch_state = self.mfc_comm.read_switch_vctrl(id=id)
+        if None in [pv, cmode, switch_state]:
+            return None
+        return MFCOutputData(pv=pv, sv=sv, ctrl_mode=cmode, switch_state=switch_state, unit=meta.unit, full_scale=meta.fs)
+
+    def due_time(self, id):
+        return self.next_poll[id] if self.presence[id] else self.next_probe[id]
+
+    def time_to_next_poll(self):
+        return max(0, min(self.due_time(i) for i in range(16)) - time.monotonic())
+
+    def schedule_poll(self, id, output):
+        interval = self.poll_rate(id, output)
+        self.poll_interval[id] = interval
+        self.next_poll[id] = time.monotonic() + interval
+
+    def poll_rate(self, id, output):
+        """根据选中状态、程序步和PV/SV偏差确定设备的轮询周期"""
+        if id == self.selected or self.step_imminent(id):
+            return self.poll_fast
+        fs = output.fs or 0
+        if output.pv is not None and output.sv is not None and abs(output.pv - output.sv) > self.deviation_ratio * fs:
+            return self.poll_fast
+        if not output.sv:
+            return self.poll_idle
+        return self.poll_normal
+
+    def step_imminent(self, id):
+        steps = self.step_times[id]
+        now = time.monotonic()
+        # 丢弃已经过去的程序步
+        while steps and steps[0] < now - self.step_lead:
+            steps.pop(0)
+        return bool(steps) and steps[0] - now <= self.step_lead
+
+    def set_selected(self, id):
+        """界面选中的设备，快速轮询以刷新曲线"""
+        self.selected = id
+        if id is not None and 0 <= id < 16:
+            self.next_poll[id] = 0
+            self.wake()
+
+    def set_step_times(self, id, times):
+        """设置设备程序步的时刻（time.monotonic()时间），临近时提高轮询频率"""
+        self.step_times[id] = sorted(times)
+
+    def mark_present(self, id):
+        self.presence[id] = True
+        self.failures[id] = 0
+        self.probe_interval[id] = self.probe_interval_min
+
+    def mark_absent(self, id):
+        self.failures[id] += 1
+        if self.presence[id] and self.failures[id] < self.absent_threshold:
+            # 保留元数据和上一次的状态，尽快重试
+            self.next_poll[id] = time.monotonic() + self.poll_fast
+            return
+        if self.presence[id]:
+            # 设备掉线后使元数据缓存失效，重新出现时重新读取满量程和单位
+            self.mfc_comm.invalidate_meta(id)
+            self.presence[id] = False
+            self.probe_interval[id] = self.probe_interval_min
+        else:
+            self.probe_interval[id] = min(self.probe_interval[id] * 2, self.probe_interval_max)
+        self.next_probe[id] = time.monotonic() + self.probe_interval[id]
+        self.snapshot.write(id, None)
+
+    def handle_command(self, command):
+        task = command.payload
+        ok = self.write_comm(task)
+        latency = command.acknowledge(ok is not None)
+        # 写入后尽快读回设备状态
+        ids = task['data'].id if isinstance(task['data'].id, list) else [task['data'].id]
+        for i in ids:
+            if i is not None:
+                self.next_poll[i] = 0
+        ack = {'type': task['type'], 'id': task['data'].id, 'addr': task['data'].addr, 'value': task['data'].value,
+               'ok': command.ok, 'latency': latency}
+        self.ack_count += 1
+        self.ack_total += latency
+        self.ack_max = max(self.ack_max, latency)
+        if latency > self.slow_ack:
+            print(f"mfc {task['type']} id={task['data'].id} slow ack in {latency * 1000:.1f} ms")
+        self.ack_signal.emit(ack)
+
+    def ack_stats(self):
+        return {'count': self.ack_count, 'latency_avg': self.ack_total / self.ack_count if self.ack_count else 0.0,
+                'latency_max': self.ack_max}
+
     def write_comm(self, task):
+        """执行写命令，返回设备应答，失败时返回None"""
         try:
+            if task['type'] == 'refresh_meta':
+                self.mfc_comm.invalidate_meta(task['data'].id)
+                # 手动刷新时立即重新探测离线地址
+                ids = range(16) if task['data'].id is None else [task['data'].id]
+                for i in ids:
+                    self.probe_interval[i] = self.probe_interval_min
+                    self.next_probe[i] = 0
+                return True
             if task['type'] == 'sv':
-                self.mfc_comm.write_sv(value=task['data'].value, id=task['data'].id)
+                return self.mfc_comm.write_sv(value=task['data'].value, id=task['data'].id)
             if task['type'] == 'switch':
-                self.mfc_comm.write_switch(value=task['data'].value, id=task['data'].id, addr=task['data'].addr)
+                return self.mfc_comm.write_switch(value=task['data'].value, id=task['data'].id, addr=task['data'].addr)
+            if task['type'] == 'switch_group':
+                results = self.mfc_comm.write_switch_group(task['data'].id, task['data'].addr, task['data'].value)
+                failed = [i for i, result in results.items() if result is None]
+                if failed:
+                    print(f'mfc group write failed on {failed}')
+                    return None
+                return results
         except Exception as e:
             print(f'An error occurred when write mfc parameter: {e}')
-
-    def write_data(self, datatype, data):
-        self.data_queue.put({'type': datatype, 'data': data})
-
-    def stop_run(self):
-        self.stop = True
+        return None
+
+    def write_data(self, datatype, data, priority=None):
+        """写命令入队，控制命令优先于设定值写入，均在下一次设备收发之前发送"""
+        if priority is None:
+            priority = self.priorities.get(datatype, PRIORITY_SETPOINT)
+        command = self.data_queue.put({'type': datatype, 'data': data}, priority)
+        self.wake()
+        return command
+
+    def write_group(self, addr, value, ids=None, priority=None):
+        """
+        分组写线圈（如全部关阀），ids为None时发送给当前在线的全部设备，
+        不在离线地址上等待超时（在线表已去抖，连续读取失败才判为离线）。
+        一条命令在一次出队中连续发送完毕，中间不插入轮询
+        """
+        if ids is None:
+            ids = [i for i in range(16) if self.presence[i]]
+        return self.write_data('switch_group', MFCInputData(value=value, id=list(ids), addr=addr), priority)
+
+    def refresh_meta(self, id=None):
+        """手动刷新设备元数据缓存，id为None时刷新全部设备"""
+        self.write_data('refresh_meta', MFCInputData(id=id))
 
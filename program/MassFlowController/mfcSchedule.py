@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from program.MassFlowController.MFCWindow import MFCInputData
+
+
+class ScheduleStep:
+    """程序中的一步：启动后due秒将设备id的设定值写为value"""
+    __slots__ = ('due', 'seq', 'id', 'value', 'ramp')
+
+    def __init__(self, due, seq, id, value, ramp=False):
+        self.due = due
+        self.seq = seq
+        self.id = id
+        self.value = value
+        self.ramp = ramp  # 是否为斜坡插值产生的中间点
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+def compile_schedules(schedules, ramp=False, rampResolution=1.0):
+    """
+    将各设备的程序 {时间(s): 设定值} 编译为按时间排序的堆。
+    ramp为True时在相邻两个设定点之间按rampResolution秒线性插值
+    """
+    counter = itertools.count()
+    heap = []
+    for id, schedule in enumerate(schedules):
+        points = sorted((float(t), float(v)) for t, v in schedule.items())
+        for i, (t, value) in enumerate(points):
+            heap.append(ScheduleStep(t, next(counter), id, value))
+            if not ramp or i + 1 >= len(points):
+                continue
+            t_next, value_next = points[i + 1]
+            n = int((t_next - t) / rampResolution)
+            for k in range(1, n):
+                tk = t + k * rampResolution
+                if tk >= t_next:
+                    break
+                vk = value + (value_next - value) * (tk - t) / (t_next - t)
+                heap.append(ScheduleStep(tk, next(counter), id, round(vk, 3), ramp=True))
+    heapq.heapify(heap)
+    return heap
+
+
+class MFCScheduleEngine(QThread):
+    """
+    流量计程序执行线程：所有设备的程序编译为一个时间堆，按time.monotonic()计时，不会因取整跳过步骤。
+    线程或串口卡顿后同一设备有多个步骤到期时，只写入最新的一个，过时的斜坡点不再补发
+    """
+    finished_signal = pyqtSignal()
+
+    def __init__(self, mfcWorker, schedules, ramp=False, rampResolution=1.0):
+        super().__init__()
+        self.mfc_worker = mfcWorker
+        self.heap = compile_schedules(schedules, ramp=ramp, rampResolution=rampResolution)
+        self.launch_time = None
+        self.stop_event = threading.Event()
+        self.max_late = 0
+
+    def step_times(self, launch):
+        """各设备设定点（不含斜坡中间点）的monotonic时刻"""
+        times = [[] for _ in range(16)]
+        for step in self.heap:
+            if not step.ramp and step.id < 16:
+                times[step.id].append(launch + step.due)
+        return times
+
+    def run(self):
+        self.launch_time = time.monotonic()
+        for id, times in enumerate(self.step_times(self.launch_time)):
+            self.mfc_worker.set_step_times(id, times)
+        try:
+            while self.heap and not self.stop_event.is_set():
+                elapsed = time.monotonic() - self.launch_time
+                wait = self.heap[0].due - elapsed
+                if wait > 0:
+                    self.stop_event.wait(wait)
+                    continue
+                # 取出全部到期的步骤，每台设备只保留最新的一个
+                due = {}
+                skipped = 0
+                while self.heap and self.heap[0].due <= elapsed:
+                    step = heapq.heappop(self.heap)
+                    skipped += step.id in due
+                    due[step.id] = step
+                if skipped:
+                    print(f'mfc schedule: skipped {skipped} overdue steps')
+                for step in due.values():
+                    late = elapsed - step.due
+                    self.max_late = max(self.max_late, late)
+                    self.write_step(step, late)
+        except Exception as e:
+            print(f'An error occurred when run mfc schedule: {e}')
+        self.finished_signal.emit()
+
+    def write_step(self, step, late):
+        if not step.ramp:
+            print(f'mfc schedule: dev {step.id} -> {step.value} at {step.due:.0f}s (late {late * 1000:.0f} ms)')
+        self.mfc_worker.write_data('sv', MFCInputData(value=step.value, id=step.id))
+
+    def stop_run(self):
+        self.stop_event.set()
@@ -0,0 +1,185 @@
+import math
+import random
+import threading
+import time
+
+from program.SerialDev import modbusCodec as codec
+from program.SerialDev.simPort import LoopbackSerial
+
+# 模拟流量计寄存器表，与mfcdev.MFCComm一致
+REG_PV = 0x10
+REG_SV = 0x11
+REG_FS = 0x30
+REG_ID = 0x33
+COIL_COUNT = 8
+
+
+class SimMFC:
+    """
+    单台模拟流量计：寄存器PV(0x10)、SV(0x11)、FS(0x30)、ID(0x33)，线圈0-7。
+    线圈0-2为关闭/阀控/清洗（互斥），线圈3为数字控制，线圈6为单位（0为mL/min）。
+    PV按一阶惯性跟随目标流量，时间常数tau秒
+    """
+    def __init__(self, fullScale=500, modelId=0x0101, tau=1.0, noise=0.0):
+        self.fs = fullScale
+        self.model_id = modelId
+        self.tau = tau
+        self.noise = noise
+        self.sv_raw = 0
+        self.pv_raw = 0.0
+        self.coils = [False] * COIL_COUNT
+        self.coils[0] = True  # 上电默认关闭
+        self.coils[3] = True
+        self.last_update = time.monotonic()
+
+    def target(self):
+        if self.coils[0]:
+            return 0
+        if self.coils[2]:
+            return 4095  # 清洗：阀门全开
+        if self.coils[1]:
+            return self.sv_raw
+        return 0
+
+    def update(self, now=None):
+        now = time.monotonic() if now is None else now
+        dt = max(0.0, now - self.last_update)
+        self.last_update = now
+        if self.tau <= 0:
+            self.pv_raw = float(self.target())
+        else:
+            self.pv_raw += (self.target() - self.pv_raw) * (1 - math.exp(-dt / self.tau))
+
+    def read_register(self, addr):
+        if addr == REG_PV:
+            raw = int(round(self.pv_raw + random.gauss(0, self.noise) if self.noise else self.pv_raw))
+            return min(max(raw, 0), 0xFFFF)
+        if addr == REG_SV:
+            return self.sv_raw
+        if addr == REG_FS:
+            return self.fs
+        if addr == REG_ID:
+            return self.model_id
+        return None
+
+    def write_register(self, addr, value):
+        if addr == REG_SV:
+            self.sv_raw = min(value, 4095)
+            return True
+        return False
+
+    def write_coil(self, addr, value):
+        if addr >= COIL_COUNT:
+            return False
+        if addr <= 2 and value:
+            # 关闭/阀控/清洗三种状态互斥
+            self.coils[0] = self.coils[1] = self.coils[2] = False
+        self.coils[addr] = bool(value)
+        return True
+
+
+class MFCSimBank:
+    """
+    模拟一条485总线上的多台流量计，按Modbus RTU处理请求帧并返回应答帧。
+    latency为从站应答延迟（s），dropRate为不应答的概率，ids为在线设备的站号
+    """
+    def __init__(self, count=16, ids=None, latency=0.005, dropRate=0.0, tau=1.0, fullScale=500):
+        ids = range(count) if ids is None else ids
+        self.devices = {id: SimMFC(fullScale=fullScale, tau=tau) for id in ids}
+        self.latency = latency
+        self.drop_rate = dropRate
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.dropped = 0
+
+    def handle(self, request):
+        """处理一帧请求，返回应答帧；广播、离线设备、丢帧或CRC错误时返回None"""
+        request = bytes(request)
+        self.frames += 1
+        if len(request) < 8 or not codec.check_crc(request):
+            return None
+        slave = request[0]
+        with self.lock:
+            now = time.monotonic()
+            if slave == 0 and 0 not in self.devices:
+                # 广播帧：所有设备执行，不应答
+                for device in self.devices.values():
+                    device.update(now)
+                    self.execute(device, request)
+                return None
+            device = self.devices.get(slave)
+            if device is None:
+                return None
+            if self.drop_rate and random.random() < self.drop_rate:
+                self.dropped += 1
+                return None
+            device.update(now)
+            return self.execute(device, request)
+
+    def execute(self, device, request):
+        slave, function = request[0], request[1]
+        addr = request[2] * 256 + request[3]
+        count = request[4] * 256 + request[5]
+        if function == codec.READ_HOLDING_REGISTERS:
+            values = [device.read_register(addr + i) for i in range(count)]
+            if None in values:
+                return self.exception(slave, function, 0x02)
+            data = b''.join(v.to_bytes(2, 'big') for v in values)
+            return codec.append_crc(bytes([slave, function, len(data)]) + data)
+        if function == codec.READ_COILS:
+            if addr + count > COIL_COUNT:
+                return self.exception(slave, function, 0x02)
+            packed = bytearray((count + 7) // 8)
+            for i in range(count):
+                if device.coils[addr + i]:
+                    packed[i // 8] |= 1 << (i % 8)
+            return codec.append_crc(bytes([slave, function, len(packed)]) + bytes(packed))
+        if function == codec.WRITE_SINGLE_REGISTER:
+            if not device.write_register(addr, count):
+                return self.exception(slave, function, 0x02)
+            return request
+        if function == codec.WRITE_SINGLE_COIL:
+            if count not in (0x0000, 0xFF00):
+                return self.exception(slave, function, 0x03)
+            if not device.write_coil(addr, count == 0xFF00):
+                return self.exception(slave, function, 0x02)
+            return request
+        if function == codec.WRITE_MULTIPLE_COILS:
+            if addr + count > COIL_COUNT:
+                return self.exception(slave, function, 0x02)
+            for i in range(count):
+                device.write_coil(addr + i, request[7 + i // 8] >> (i % 8) & 1)
+            return codec.append_crc(request[:6])
+        if function == codec.WRITE_MULTIPLE_REGISTERS:
+            for i in range(count):
+                if not device.write_register(addr + i, int.from_bytes(request[7 + 2 * i:9 + 2 * i], 'big')):
+                    return self.exception(slave, function, 0x02)
+            return codec.append_crc(request[:6])
+        return self.exception(slave, function, 0x01)
+
+    @staticmethod
+    def exception(slave, function, code):
+        return codec.append_crc(bytes([slave, function | 0x80, code]))
+
+
+if __name__ == "__main__":
+    # 基准：批量读取与逐项读取的总线耗时、分组关阀耗时
+    from program.MassFlowController.mfcdev import MFCComm
+
+    bank = MFCSimBank(count=16, ids=range(8), latency=0.005)
+    mfc = MFCComm(portName=None, baudRate=9600, port=LoopbackSerial(bank, baudrate=9600))
+
+    def bench(name, func, rounds=3):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        print(f'{name:<40}{(time.perf_counter() - start) / rounds * 1000:8.1f} ms')
+
+    live = [i for i in range(16) if mfc.meta[i] is not None]
+    print(f'live devices: {live}')
+    bench('batch read, live devices', lambda: [mfc.read_batch(i) for i in live])
+    bench('legacy read, live devices', lambda: [(mfc.read_sv(i), mfc.read_pv(i), mfc.read_switch_single(i, 3),
+                                                 mfc.read_switch_vctrl(i), mfc.read_unit(i), mfc.read_fs(i))
+                                                for i in live])
+    bench('close all, per device x16', lambda: [mfc.write_switch(True, i, 0) for i in range(16)], rounds=1)
+    bench('close all, group live', lambda: mfc.write_switch_group(live, 0, True))
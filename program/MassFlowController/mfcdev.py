@@ -1,20 +1,52 @@
-import struct
-import sys
-import time
-
 import serial
 
+from program.SerialDev import modbusCodec as codec
+from program.SerialDev.frameTransport import FrameTransport
+
 # factor = 500/4095
 
+class MFCMeta:
+    """设备静态信息：满量程、单位、换算系数和型号ID，连接后基本不变"""
+    def __init__(self, full_scale=None, unit=None, factor=None, model_id=None):
+        self.fs = full_scale
+        self.unit = unit
+        self.factor = factor
+        self.model_id = model_id
+
+
 class MFCComm:
+    # Modbus广播地址，从站执行但不应答
+    broadcast_id = 0
+    # 广播命令发出后留给从站执行的时间（s）
+    broadcast_turnaround = 0.02
+
     def __init__(self, portName, baudRate=9600, dataBits=serial.EIGHTBITS, parity=serial.PARITY_NONE,
-                 stopBits=serial.STOPBITS_TWO):
-        self.MyCom = serial.Serial(port=portName, baudrate=baudRate, bytesize=dataBits, parity=parity,
-                                   stopbits=stopBits, timeout=0.15, write_timeout=0.15)
+                 stopBits=serial.STOPBITS_TWO, broadcast=False, multiCoil=False, port=None, transport=None):
+        if transport is not None:
+            # 使用外部收发层（如serialEngine.EngineTransport），串口由引擎持有
+            self.transport = transport
+            self.MyCom = transport.MyCom
+        else:
+            if port is not None:
+                # 传入已打开的串口对象（如mfcSim.LoopbackSerial），用于无硬件测试
+                self.MyCom = port
+            else:
+                self.MyCom = serial.Serial(port=portName, baudrate=baudRate, bytesize=dataBits, parity=parity,
+                                           stopbits=stopBits, timeout=0.15, write_timeout=0.15)
+            self.transport = FrameTransport(self.MyCom)
+        self.last_error = None
+        # 分组命令的发送方式：本设备站号从0开始编址，地址0即为0号设备，默认不使用广播；
+        # 设备固件支持功能码0F时可打开multiCoil，一帧写入连续多个线圈
+        self.broadcast = broadcast
+        self.multi_coil = multiCoil
+        self.fss = [None for _ in range(16)]
+        self.factors = [None for _ in range(16)]
+        # 设备元数据缓存，连接时读取一次，设备掉线重连或手动刷新时才失效
+        self.meta = [None for _ in range(16)]
         try:
-            self.fss = [self.read_fs(i) for i in range(16)]
+            for i in range(16):
+                self.load_meta(i)
             print(f'fss: {self.fss}')
-            self.factors = [fs / 4095 if fs else None for fs in self.fss]
             print(f'factors: {self.factors}')
         except Exception as e:
             print(f'An error occurred when read mfc factors: {e}')
@@ -39,28 +71,15 @@ class MFCComm:
         """
         01 03 00 10 00 01 85 CF
         """
-        if self.MyCom is None:
-            return None
         if self.factors[id] is None:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 3
-        data[2] = 0
-        data[3] = 16
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(7)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            if buffer[3] == 255:
-                buffer[3] = 0
-                buffer[4] = 0
-            return round((buffer[3] * 256 + buffer[4]) * self.factors[id], 1)
-        return None
+        regs = self.read_registers(id, 0x10, 1)
+        if regs is None:
+            return None
+        raw = regs[0]
+        if raw >> 8 == 255:  # 负流量溢出按0处理
+            raw = 0
+        return round(raw * self.factors[id], 1)
 
     def write_sv(self, value, id):
         """
@@ -72,213 +91,187 @@ class MFCComm:
             value = int(value / self.factors[id])
         else:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 6
-        data[2] = 0
-        data[3] = 17
-        # 让b[0]始终为最低字节，对32位系统，int类型的value有四个字节,
-        # 按下面的方法可将b[0],b[1],b[2],b[3]对应value的最低字节，次低字节，次高字节，最高字节
-        if sys.byteorder == 'little':
-            b = struct.pack('<i', value)
-        else:
-            b = struct.pack('>i', value)
-        data[4] = b[1]
-        data[5] = b[0]
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(8)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return (buffer[4] * 256 + buffer[5]) * self.factors[id]
-        return None
+        result = self.request(codec.build_write_single_register(id, 0x11, value))
+        if result is None:
+            return None
+        return result[1] * self.factors[id]
 
     def read_sv(self, id):
-        if self.MyCom is None:
-            return None
         if self.factors[id] is None:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 3
-        data[2] = 0
-        data[3] = 17
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(7)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return round((buffer[3] * 256 + buffer[4]) * self.factors[id], 1)
-        return None
+        regs = self.read_registers(id, 0x11, 1)
+        if regs is None:
+            return None
+        return round(regs[0] * self.factors[id], 1)
 
     def read_id(self, id):
-        if self.MyCom is None:
+        regs = self.read_registers(id, 0x33, 1)
+        if regs is None:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 3
-        data[2] = 0
-        data[3] = 51
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(7)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return buffer[3] * 256 + buffer[4]
-        return None
+        return regs[0]
 
     def read_switch_single(self, id, addr):
-        if self.MyCom is None:
-            return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 1
-        data[2] = 0
-        data[3] = addr
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(6)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return buffer[3]
-        return None
+        return self.read_coils(id, addr, 1)
 
     def read_switch_vctrl(self, id):
-        if self.MyCom is None:
-            return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 1
-        data[2] = 0
-        data[3] = 0
-        data[4] = 0
-        data[5] = 3
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(6)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return buffer[3]
-        return None
+        return self.read_coils(id, 0, 3)
 
     def read_all_state(self, id):
-        if self.MyCom is None:
-            return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 1
-        data[2] = 0
-        data[3] = 0
-        data[4] = 0
-        data[5] = 8
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(6)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            print(f'all switch state: {buffer[3]}')
-            return buffer[3]
-        return None
+        state = self.read_coils(id, 0, 8)
+        if state is not None:
+            print(f'all switch state: {state}')
+        return state
 
     def write_switch(self, value: bool, id, addr):
-        if self.MyCom is None:
+        result = self.request(codec.build_write_single_coil(id, addr, value))
+        if result is None:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 5
-        data[2] = 0
-        data[3] = addr
-        if value:
-            b = 255
-        else:
-            b = 0
-        data[4] = b
-        data[5] = 0
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(8)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            return buffer[4] * 256 + buffer[5]
-        return None
+        return result[1]
+
+    def write_coils(self, id, addr, values):
+        """
+        功能码0F一帧写入从addr开始的连续线圈，成功返回写入的线圈数量
+        01 0F 00 00 00 04 01 0A XX XX
+        """
+        result = self.request(codec.build_write_multiple_coils(id, addr, values))
+        if result is None:
+            return None
+        return result[1]
+
+    def write_switch_group(self, ids, addr, values):
+        """
+        分组写线圈：values为单个bool，或从addr开始的连续线圈值列表。
+        打开广播时一帧发给全部设备（无应答）；否则逐台设备紧凑发送，
+        支持0F时每台设备一帧，不支持时每个线圈一帧05。
+        返回{设备号: 应答}，广播时应答为True，失败的设备应答为None
+        """
+        values = list(values) if isinstance(values, (list, tuple)) else [values]
+        ids = list(ids)
+        if self.broadcast:
+            for i, value in enumerate(values):
+                if len(values) > 1 and self.multi_coil:
+                    self.transport.send(codec.build_write_multiple_coils(self.broadcast_id, addr, values),
+                                        self.broadcast_turnaround)
+                    break
+                self.transport.send(codec.build_write_single_coil(self.broadcast_id, addr + i, value),
+                                    self.broadcast_turnaround)
+            return {id: True for id in ids}
+        results = {}
+        for id in ids:
+            if len(values) > 1 and self.multi_coil:
+                results[id] = self.write_coils(id, addr, values)
+                continue
+            result = True
+            for i, value in enumerate(values):
+                if self.write_switch(value=value, id=id, addr=addr + i) is None:
+                    result = None
+            results[id] = result
+        return results
 
     def read_unit(self, id):
-        if self.MyCom is None:
+        state = self.read_coils(id, 6, 1)
+        if state is None:
             return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 1
-        data[2] = 0
-        data[3] = 6
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
-        write_len = self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(6)
-        self.MyCom.readinto(buffer)
-        if self.CheckResult(buffer):
-            if buffer[3] == 0:
-                return 'mL/min'
-            else:
-                return 'L/min'
-        return None
+        if state == 0:
+            return 'mL/min'
+        else:
+            return 'L/min'
 
     def read_fs(self, id):
-        if self.MyCom is None:
-            return None
-        data = bytearray(8)
-        data[0] = id
-        data[1] = 3
-        data[2] = 0
-        data[3] = 48
-        data[4] = 0
-        data[5] = 1
-        data[6], data[7] = self.calc_crc16(data[:6])
         try:
-            write_len = self.MyCom.write(data)
-            time.sleep(0.05)
-
-            buffer = bytearray(7)
-            self.MyCom.readinto(buffer)
-            if self.CheckResult(buffer):
-                return round((buffer[3] * 256 + buffer[4]), 1)
+            regs = self.read_registers(id, 0x30, 1)
+            if regs is not None:
+                return round(regs[0], 1)
         except Exception as e:
             print(e)
         return None
 
-    def calc_crc16(self, data):
-        crc = 0xFFFF
-        for pos in data:
-            crc ^= pos
-            for i in range(8):
-                if (crc & 1) != 0:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        a = crc & 0xff
-        b = crc >> 8
-        return [a, b]
+    def load_meta(self, id):
+        """读取并缓存设备的满量程、单位和型号ID，设备无应答时返回None"""
+        fs = self.read_fs(id)
+        if not fs:
+            self.meta[id] = None
+            return None
+        unit = self.read_unit(id)
+        if unit is None:
+            self.meta[id] = None
+            return None
+        model_id = self.read_id(id)
+        self.fss[id] = fs
+        self.factors[id] = fs / 4095
+        self.meta[id] = MFCMeta(full_scale=fs, unit=unit, factor=self.factors[id], model_id=model_id)
+        return self.meta[id]
+
+    def get_meta(self, id):
+        """优先返回缓存的元数据，缓存失效时按需重新读取"""
+        if self.meta[id] is None:
+            return self.load_meta(id)
+        return self.meta[id]
+
+    def invalidate_meta(self, id=None):
+        """使指定设备（id为None时为全部设备）的元数据缓存失效"""
+        ids = range(16) if id is None else [id]
+        for i in ids:
+            self.meta[i] = None
+
+    def request(self, frame, parse=None):
+        """
+        发送一帧请求并解析应答，失败时记录结构化错误到last_error并返回None
+        """
+        if self.MyCom is None:
+            return None
+        response = self.transport.transact_modbus(frame)
+        if parse is None:
+            result = codec.parse_write_echo(response, frame)
+        else:
+            result = parse(response)
+        if isinstance(result, codec.ModbusError):
+            self.last_error = result
+            return None
+        return result
+
+    def read_registers(self, id, addr, count):
+        """
+        功能码03批量读取连续保持寄存器，返回寄存器值元组
+        01 03 00 10 00 21 XX XX
+        """
+        return self.request(codec.build_read_holding_registers(id, addr, count),
+                            lambda response: codec.parse_read_registers(response, id, count))
 
-    def CheckResult(self, result):
-        if result is not None and len(result) > 5:
-            b = self.calc_crc16(result[:-2])
-            return b[0] == result[-2] and b[1] == result[-1]
-        return False
+    def read_coils(self, id, addr, count):
+        """
+        功能码01批量读取连续线圈，返回按位排列的线圈状态（第addr个线圈为最低位）
+        01 01 00 00 00 08 XX XX
+        """
+        bits = self.request(codec.build_read_coils(id, addr, count),
+                            lambda response: codec.parse_read_bits(response, id, count))
+        if bits is None:
+            return None
+        return sum(1 << i for i, bit in enumerate(bits) if bit)
+
+    def read_batch(self, id):
+        """
+        批量读取一台设备的状态：一帧03读取PV(0x10)、SV(0x11)，一帧01读取线圈0-7，
+        满量程和单位取自元数据缓存，替代read_sv/read_pv/read_switch_single/read_switch_vctrl/read_unit/read_fs六次收发。
+        返回(pv, sv, ctrl_mode, switch_state, unit, fs)，设备无应答时返回None
+        """
+        meta = self.get_meta(id)
+        if meta is None:
+            return None
+        regs = self.read_registers(id, 0x10, 2)
+        if regs is None:
+            return None
+        coils = self.read_coils(id, 0, 8)
+        if coils is None:
+            return None
+        raw_pv = regs[0]
+        if raw_pv >> 8 == 255:  # 负流量溢出，与read_pv一致按0处理
+            raw_pv = 0
+        pv = round(raw_pv * meta.factor, 1)
+        sv = round(regs[1] * meta.factor, 1)
+        switch_state = coils & 0x07  # 线圈0-2：关闭/阀控/清洗
+        ctrl_mode = (coils >> 3) & 0x01  # 线圈3：数字/模拟控制
+        return pv, sv, ctrl_mode, switch_state, meta.unit, meta.fs
 
 if __name__ == "__main__":
     mfc = MFCComm(portName="COM3", baudRate=9600, dataBits=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopBits=serial.STOPBITS_TWO)
@@ -0,0 +1,140 @@
+import threading
+import time
+
+from PyQt5.QtCore import QThread
+
+from program.MicroscopeDev import toupcam
+
+
+class Frame:
+    """缓冲池中的一帧：data为预分配的24位图像缓冲区，timestamp为相机帧时间戳（us）"""
+    __slots__ = ('data', 'seq', 'width', 'height', 'timestamp', 'camera_seq', 'received', 'refs')
+
+    def __init__(self, size):
+        self.data = bytes(size)
+        self.seq = 0
+        self.width = 0
+        self.height = 0
+        self.timestamp = 0
+        self.camera_seq = 0
+        self.received = 0.0
+        self.refs = 0
+
+
+class FrameConsumer:
+    """一个取帧方（显示、录像、对焦等），各自记录取到的帧数和错过的帧数"""
+    def __init__(self, name):
+        self.name = name
+        self.last_seq = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def snapshot(self):
+        return {'frames': self.frames, 'dropped': self.dropped}
+
+
+class FrameGrabber(QThread):
+    """
+    相机取帧线程：收到TOUPCAM_EVENT_IMAGE通知后在本线程中PullImageV3到缓冲池的空闲缓冲区，
+    再把它发布为最新帧，界面线程不再执行取帧。
+    取帧方用acquire()取得最新帧（引用计数加一），用完后release()；被引用或正在发布的缓冲区不会被覆盖。
+    缓冲池没有空闲缓冲区时本帧取到备用缓冲区后丢弃，计入pool_dropped
+    """
+    def __init__(self, hcam, width, height, poolSize=4):
+        super().__init__()
+        self.hcam = hcam
+        self.width = width
+        self.height = height
+        size = toupcam.TDIBWIDTHBYTES(width * 24) * height
+        self.pool = [Frame(size) for _ in range(poolSize)]
+        self.scratch = Frame(size)
+        self.latest = None
+        self.seq = 0
+        self.consumers = {}
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        # 有新图像待取；连续多次通知只取一次（PullImage总是取最新的一帧）
+        self.pending = False
+        self.stop = False
+        self.pulled = 0
+        self.pool_dropped = 0
+        self.errors = 0
+
+    def notify(self):
+        """相机回调线程中调用：有新图像可取"""
+        with self.condition:
+            self.pending = True
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stop:
+                    self.condition.wait(0.5)
+                if self.stop:
+                    break
+                self.pending = False
+            self.pull()
+
+    def pull(self):
+        frame = self.free_frame()
+        target = frame or self.scratch
+        info = toupcam.ToupcamFrameInfoV3()
+        try:
+            self.hcam.PullImageV3(target.data, 0, 24, 0, info)
+        except toupcam.HRESULTException:
+            self.errors += 1
+            return
+        self.pulled += 1
+        if frame is None:
+            self.pool_dropped += 1
+            return
+        frame.width = info.width or self.width
+        frame.height = info.height or self.height
+        frame.timestamp = info.timestamp
+        frame.camera_seq = info.seq
+        frame.received = time.time()
+        with self.lock:
+            self.seq += 1
+            frame.seq = self.seq
+            self.latest = frame
+
+    def free_frame(self):
+        with self.lock:
+            for frame in self.pool:
+                if frame is not self.latest and frame.refs == 0:
+                    return frame
+        return None
+
+    def acquire(self, consumer, newOnly=True):
+        """
+        取得最新帧，用完后必须release()。newOnly为True时该取帧方已经取过最新帧则返回None；
+        两次取帧之间发布的帧计入该取帧方的dropped
+        """
+        with self.lock:
+            client = self.consumers.get(consumer)
+            if client is None:
+                client = self.consumers[consumer] = FrameConsumer(consumer)
+            frame = self.latest
+            if frame is None or (newOnly and frame.seq == client.last_seq):
+                return None
+            if client.last_seq and frame.seq > client.last_seq + 1:
+                client.dropped += frame.seq - client.last_seq - 1
+            client.last_seq = frame.seq
+            client.frames += 1
+            frame.refs += 1
+            return frame
+
+    def release(self, frame):
+        with self.lock:
+            frame.refs -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'published': self.seq, 'pulled': self.pulled, 'pool_dropped': self.pool_dropped,
+                    'errors': self.errors, 'consumers': {name: c.snapshot() for name, c in self.consumers.items()}}
+
+    def stop_run(self):
+        with self.condition:
+            self.stop = True
+            self.condition.notify()
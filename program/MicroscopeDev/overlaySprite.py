@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+
+class OverlaySprite:
+    """
+    预先缩放好的BGRA叠加图：透明边缘裁掉，颜色预乘alpha，并预先算好(255-alpha)，
+    每帧只需对覆盖区域做一次整数运算的原地混合。由界面线程创建，之后只在编码线程中调用blend()
+    """
+    def __init__(self, bgra, position):
+        x, y = position
+        alpha = bgra[:, :, 3]
+        rows = np.flatnonzero(alpha.any(axis=1))
+        cols = np.flatnonzero(alpha.any(axis=0))
+        self.work = None
+        if not len(rows):
+            self.height = self.width = 0
+            return
+        top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        bgra = bgra[top:bottom, left:right]
+        a = bgra[:, :, 3:4].astype(np.uint16)
+        self.premultiplied = bgra[:, :, :3].astype(np.uint16) * a + 127  # +127用于整除时四舍五入
+        self.inverse = 255 - a
+        self.x = x + left
+        self.y = y + top
+        self.height, self.width = bgra.shape[:2]
+
+    def blend(self, frame):
+        """原地叠加到BGR帧上，中间结果使用复用的uint16缓冲区"""
+        if not self.height:
+            return frame
+        h = min(self.height, frame.shape[0] - self.y)
+        w = min(self.width, frame.shape[1] - self.x)
+        if h <= 0 or w <= 0:
+            return frame
+        roi = frame[self.y:self.y + h, self.x:self.x + w]
+        if self.work is None or self.work.shape != roi.shape:
+            self.work = np.empty(roi.shape, dtype=np.uint16)
+        work = self.work
+        np.multiply(roi, self.inverse[:h, :w], out=work)
+        work += self.premultiplied[:h, :w]
+        work //= 255
+        roi[:] = work
+        return frame
+
+
+def build_overlay(images, frameWidth, top=30):
+    """
+    由曲线画布的RGBA图像生成叠加图：每张缩放到帧宽度的一半，从右上角依次向左排列。
+    画布为RGBA顺序，录像帧为BGR顺序，这里一并转换
+    """
+    sprites = []
+    for rgba in images:
+        scale = 0.5 * frameWidth / rgba.shape[1]
+        resized = cv2.resize(rgba, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        sprites.append(cv2.cvtColor(resized, cv2.COLOR_RGBA2BGRA))
+    height = max(sprite.shape[0] for sprite in sprites)
+    width = sum(sprite.shape[1] for sprite in sprites)
+    combined = np.zeros((height, width, 4), dtype=np.uint8)
+    x = 0
+    for sprite in sprites:
+        combined[:sprite.shape[0], x:x + sprite.shape[1]] = sprite
+        x += sprite.shape[1]
+    return OverlaySprite(combined, (max(frameWidth - width, 0), top))
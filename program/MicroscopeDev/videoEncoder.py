@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# 队列满时的处理方式
+DROP_OLDEST = 'drop_oldest'  # 丢弃最早的待编码帧，保证录像跟上实时画面
+DROP_NEWEST = 'drop_newest'  # 丢弃新到的帧
+BLOCK = 'block'  # 调用方最多等待blockTimeout秒，超时后丢弃新到的帧
+
+
+class VideoEncoder(threading.Thread):
+    """
+    独立线程中的视频编码：接口与cv2.VideoWriter一致（write/release/isOpened），
+    write()只把帧放入有界队列后立即返回，编码在本线程中完成。
+    transform不为None时在编码线程中先对帧做transform(frame)再写入（如画面合成）。
+    stats()给出队列深度、编码耗时和丢帧数
+    """
+    def __init__(self, path, fourcc, fps, frameSize, maxQueue=8, policy=DROP_OLDEST, blockTimeout=0.1,
+                 transform=None, name='video'):
+        super().__init__(name=f'VideoEncoder-{name}', daemon=True)
+        self.path = path
+        self.stream_name = name
+        self.writer = cv2.VideoWriter(path, fourcc, fps, frameSize)
+        self.max_queue = maxQueue
+        self.policy = policy
+        self.block_timeout = blockTimeout
+        self.transform = transform
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closing = False
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.encode_total = 0.0
+        self.encode_max = 0.0
+        self.start()
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        """帧入队，返回是否被接受；调用方在入队后不得再修改该帧"""
+        with self.condition:
+            if self.closing:
+                return False
+            if len(self.queue) >= self.max_queue:
+                if self.policy == DROP_OLDEST:
+                    self.queue.popleft()
+                    self.dropped += 1
+                elif self.policy == BLOCK:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self.queue) >= self.max_queue and not self.closing:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    if len(self.queue) >= self.max_queue:
+                        self.dropped += 1
+                        return False
+                else:
+                    self.dropped += 1
+                    return False
+            self.queue.append(frame)
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify_all()
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closing:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                frame = self.queue.popleft()
+                self.condition.notify_all()
+            start = time.perf_counter()
+            try:
+                if self.transform is not None:
+                    frame = self.transform(frame)
+                self.writer.write(frame)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f'An error occurred when encode {self.stream_name} frame: {e}')
+            elapsed = time.perf_counter() - start
+            self.encode_total += elapsed
+            self.encode_max = max(self.encode_max, elapsed)
+        self.writer.release()
+
+    def release(self):
+        """编码完队列中剩余的帧后关闭文件"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def stats(self):
+        with self.condition:
+            depth = len(self.queue)
+        return {
+            'depth': depth,
+            'max_depth': self.max_depth,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'encode_avg': self.encode_total / self.written if self.written else 0.0,
+            'encode_max': self.encode_max,
+        }
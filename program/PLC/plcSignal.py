@@ -1,13 +1,15 @@
-import time
-
 import serial
 
+from program.SerialDev import modbusCodec as codec
+from program.SerialDev.frameTransport import FrameTransport
+
 
 class PLCSignal:
     def __init__(self, port, baudrate=9600, dataBits=serial.EIGHTBITS, parity=serial.PARITY_NONE,
                  stopBits=serial.STOPBITS_ONE):
         self.MyCom = serial.Serial(port=port, baudrate=baudrate, bytesize=dataBits, parity=parity,
                                    stopbits=stopBits, timeout=0.15)
+        self.transport = FrameTransport(self.MyCom, exceptionLength=None)
 
     def IsConnect(self):
         if self.MyCom.isOpen():  # 判断串口是否成功打开
@@ -27,15 +29,8 @@ class PLCSignal:
     def write_signal(self, value):
         print(f'send signal')
         try:
-            data= bytearray(5)
-            data[0] = 11
-            data[1] = 3
-            data[2] = value
-            data[3], data[4] = self.calc_crc16(data[:3])
-            write_len = self.MyCom.write(data)
-            time.sleep(0.05)
-            buffer = bytearray(5)
-            self.MyCom.readinto(buffer)
+            data = codec.append_crc(bytes([11, 3, value]))
+            buffer = self.transport.transact(data, 5)
             if self.CheckResult(buffer):
                 return buffer[2]
             return None
@@ -51,22 +46,5 @@ class PLCSignal:
             return buffer[2]
         return None
 
-    def calc_crc16(self, data):
-        crc = 0xFFFF
-        for pos in data:
-            crc ^= pos
-            for i in range(8):
-                if (crc & 1) != 0:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        a = crc & 0xff
-        b = crc >> 8
-        return [a, b]
-
     def CheckResult(self, result):
-        if result is not None and len(result) == 5:
-            b = self.calc_crc16(result[:-2])
-            return b[0] == result[-2] and b[1] == result[-1]
-        return False
\ No newline at end of file
+        return result is not None and len(result) == 5 and codec.check_crc(result)
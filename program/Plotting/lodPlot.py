@@ -0,0 +1,177 @@
+import time
+
+import numpy as np
+
+from program.Plotting.ringPlot import RingChart
+
+# 每行：[桶起点x, 最小值点x, 最小值, 最大值点x, 最大值]
+COL_START, COL_XMIN, COL_YMIN, COL_XMAX, COL_YMAX = range(5)
+
+
+class LODLevel:
+    """金字塔的一层，按行追加，容量不足时加倍"""
+    def __init__(self, chunk=1024):
+        self.data = np.empty((chunk, 5))
+        self.n = 0
+
+    def append(self, row):
+        if self.n == len(self.data):
+            data = np.empty((2 * len(self.data), 5))
+            data[:self.n] = self.data
+            self.data = data
+        self.data[self.n] = row
+        self.n += 1
+
+    def starts(self):
+        return self.data[:self.n, COL_START]
+
+    def rows(self, lo, hi):
+        return self.data[lo:hi]
+
+
+class MinMaxPyramid:
+    """
+    保留极值的多级降采样：第0层为原始数据，第k层每个桶合并第k-1层的factor个桶，记录桶内最小值和最大值两个点。
+    追加时逐级合并，均摊O(1)；查询任意时间范围时选取点数不超过maxPoints的最细一层，
+    尖峰和跌落在任何缩放下都不会被抹掉，绘制点数与历史长度无关
+    """
+    def __init__(self, factor=4, depth=8, chunk=1024):
+        self.factor = factor
+        self.levels = [LODLevel(chunk) for _ in range(depth)]
+
+    def __len__(self):
+        return self.levels[0].n
+
+    def append(self, x, y):
+        self.levels[0].append((x, x, y, x, y))
+        for k in range(1, len(self.levels)):
+            prev = self.levels[k - 1]
+            if prev.n % self.factor:
+                break
+            rows = prev.rows(prev.n - self.factor, prev.n)
+            i = np.argmin(rows[:, COL_YMIN])
+            j = np.argmax(rows[:, COL_YMAX])
+            self.levels[k].append((rows[0, COL_START], rows[i, COL_XMIN], rows[i, COL_YMIN],
+                                   rows[j, COL_XMAX], rows[j, COL_YMAX]))
+
+    def render(self, k, lo, hi):
+        """第k层[lo, hi)的桶展开为按时间排序的点；范围到达该层末尾时补上尚未合并的低层数据"""
+        level = self.levels[k]
+        rows = level.rows(lo, hi)
+        if k == 0:
+            x, y = rows[:, COL_START], rows[:, COL_YMIN]
+        else:
+            x = rows[:, [COL_XMIN, COL_XMAX]].copy()
+            y = rows[:, [COL_YMIN, COL_YMAX]].copy()
+            swap = x[:, 0] > x[:, 1]
+            x[swap] = x[swap][:, ::-1]
+            y[swap] = y[swap][:, ::-1]
+            x, y = x.ravel(), y.ravel()
+        if k > 0 and hi >= level.n:
+            tail_x, tail_y = self.render(k - 1, level.n * self.factor, self.levels[k - 1].n)
+            x, y = np.concatenate((x, tail_x)), np.concatenate((y, tail_y))
+        return x, y
+
+    def query(self, x0, x1, maxPoints):
+        if not len(self):
+            return np.empty(0), np.empty(0)
+        for k, level in enumerate(self.levels):
+            starts = level.starts()
+            lo = max(np.searchsorted(starts, x0, 'right') - 1, 0)
+            hi = np.searchsorted(starts, x1, 'right')
+            points = (hi - lo) * (1 if k == 0 else 2)
+            if points <= maxPoints or k == len(self.levels) - 1:
+                return self.render(k, lo, hi)
+
+
+class HistoryChart(RingChart):
+    """
+    保留整次运行历史的实时曲线：数据存入MinMaxPyramid，每次刷新按当前可见范围和坐标轴像素宽度取点。
+    默认显示从运行开始到当前的全部历史，超出时间窗后向右扩展；
+    滚轮在曲线上缩放到最近一段（跟随最新数据），双击恢复全程显示
+    """
+    def __init__(self, canvas, ax, timeRange, fps, scrollStep=0.25, yMargin=1.4, yMin=0, minSpan=60,
+                 factor=4, depth=8):
+        super().__init__(canvas, ax, timeRange, fps, mode='history', scrollStep=scrollStep, yMargin=yMargin,
+                         yMin=yMin)
+        self.factor = factor
+        self.depth = depth
+        self.min_span = minSpan
+        self.start = self.ax.get_xlim()[0]
+        self.zoom_span = None
+        self.canvas.mpl_connect('scroll_event', self.on_scroll)
+        self.canvas.mpl_connect('button_press_event', self.on_press)
+
+    def add_series(self, key, line):
+        line.set_animated(True)
+        self.series[key] = (line, MinMaxPyramid(self.factor, self.depth))
+
+    def append(self, key, x, y):
+        if y is None:
+            return
+        self.series[key][1].append(x, y)
+        self.grow_ylim(y)
+
+    def set_visible(self, key, visible):
+        self.series[key][0].set_visible(visible)
+
+    def set_time_range(self, timeRange, start=None):
+        """修改时间窗长度；给出start时从start开始新的一次运行，清空历史"""
+        self.time_range = timeRange
+        if start is not None:
+            self.start = start
+            self.zoom_span = None
+            self.clear()
+        self.fit(time.time() if start is None else start)
+
+    def clear(self):
+        for key, (line, pyramid) in self.series.items():
+            self.series[key] = (line, MinMaxPyramid(self.factor, self.depth))
+            line.set_data([], [])
+
+    def fit(self, now):
+        """按当前模式重新计算时间窗：全程显示或跟随最新数据的缩放窗口"""
+        if self.zoom_span:
+            x_max = now + self.zoom_span * self.scroll_step
+            x_min = x_max - self.zoom_span
+        else:
+            x_min = self.start
+            x_max = max(self.start + self.time_range, now + self.time_range * self.scroll_step)
+        self.ax.set_xlim(x_min, x_max)
+        self.full_draw = True
+
+    def follow(self, now):
+        if now > self.ax.get_xlim()[1]:
+            self.fit(now)
+
+    def update_lines(self):
+        x0, x1 = self.ax.get_xlim()
+        max_points = max(int(self.ax.bbox.width) * 2, 100)
+        for line, pyramid in self.series.values():
+            if line.get_visible():
+                line.set_data(*pyramid.query(x0, x1, max_points))
+
+    def redraw(self, now=None):
+        if now is not None:
+            self.follow(now)
+        self.update_lines()
+        super().redraw()
+
+    def on_scroll(self, event):
+        if event.inaxes is not self.ax:
+            return
+        now = time.time()
+        x_min, x_max = self.ax.get_xlim()
+        span = (x_max - x_min) * (0.5 if event.button == 'up' else 2)
+        if span >= now - self.start + self.time_range * self.scroll_step:
+            self.zoom_span = None
+        else:
+            self.zoom_span = max(span, self.min_span)
+        self.fit(now)
+        self.redraw()
+
+    def on_press(self, event):
+        if event.inaxes is self.ax and event.dblclick and self.zoom_span:
+            self.zoom_span = None
+            self.fit(time.time())
+            self.redraw()
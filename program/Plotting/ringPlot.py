@@ -0,0 +1,167 @@
+import time
+
+import numpy as np
+from matplotlib.ticker import FuncFormatter
+
+
+class RingBuffer:
+    """
+    固定容量的(x, y)环形缓冲区。数据在长度为2倍容量的数组中写两份，
+    view()总能返回最近数据的连续视图，追加和取数据都不复制、不分配内存
+    """
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = max(int(capacity), 1)
+        self.x = np.zeros(2 * self.capacity, dtype=dtype)
+        self.y = np.zeros(2 * self.capacity, dtype=dtype)
+        self.start = 0
+        self.count = 0
+
+    def append(self, x, y):
+        if self.count < self.capacity:
+            i = self.count
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.x[i] = self.x[i + self.capacity] = x
+        self.y[i] = self.y[i + self.capacity] = y
+
+    def view(self):
+        return self.x[self.start:self.start + self.count], self.y[self.start:self.start + self.count]
+
+    def last(self):
+        if not self.count:
+            return None
+        i = (self.start + self.count - 1) % self.capacity
+        return self.x[i], self.y[i]
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+
+def time_formatter(fmt='%H:%M:%S'):
+    """时间戳刻度格式化，只在坐标轴重绘时对可见刻度调用，不再逐点重建刻度标签"""
+    return FuncFormatter(lambda ts, pos: time.strftime(fmt, time.localtime(ts)))
+
+
+class RingChart:
+    """
+    基于环形缓冲区和blit的实时曲线：
+    曲线设置为animated，背景（坐标轴、网格、刻度）缓存为位图，每次刷新只恢复背景并重绘可见曲线。
+    坐标范围变化（时间窗滚动一页、纵轴需要扩大）时才整图重绘并重新缓存背景。
+    mode为'scroll'时时间窗按scrollStep比例向前滚动，为'page'时超出后从当前时刻开始新的一页并清空曲线。
+    growY为False时纵轴不随数据自动扩大，由调用方用set_ylim()设置
+    """
+    def __init__(self, canvas, ax, timeRange, fps, mode='scroll', scrollStep=0.25, yMargin=1.4, yMin=0, growY=True):
+        self.canvas = canvas
+        self.ax = ax
+        self.time_range = timeRange
+        self.fps = fps
+        self.mode = mode
+        self.scroll_step = scrollStep
+        self.y_margin = yMargin
+        self.y_min = yMin
+        self.grow_y = growY
+        self.series = {}
+        self.background = None
+        self.full_draw = True
+        self.ax.xaxis.set_major_formatter(time_formatter())
+        now = time.time()
+        self.ax.set_xlim(now, now + self.time_range)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def capacity(self):
+        return int(self.time_range * self.fps) + 1
+
+    def add_series(self, key, line):
+        line.set_animated(True)
+        self.series[key] = (line, RingBuffer(self.capacity()))
+
+    def append(self, key, x, y):
+        line, ring = self.series[key]
+        if y is None:
+            return
+        ring.append(x, y)
+        # 隐藏的曲线不影响纵轴范围
+        if line.get_visible():
+            line.set_data(*ring.view())
+            self.grow_ylim(y)
+
+    def grow_ylim(self, y):
+        # 纵轴只扩大不缩小，扩大时需要整图重绘
+        if not self.grow_y:
+            return
+        y_top = self.ax.get_ylim()[1]
+        if y * self.y_margin > y_top or y < self.y_min:
+            self.ax.set_ylim(min(self.y_min, y), max(y_top, y * self.y_margin))
+            self.full_draw = True
+
+    def set_visible(self, key, visible):
+        line, ring = self.series[key]
+        if line.get_visible() != visible:
+            line.set_visible(visible)
+            if visible:
+                line.set_data(*ring.view())
+
+    def set_ylim(self, bottom, top):
+        if (bottom, top) != tuple(self.ax.get_ylim()):
+            self.ax.set_ylim(bottom, top)
+            self.full_draw = True
+
+    def set_time_range(self, timeRange, start=None):
+        """修改时间窗长度，环形缓冲区按新的容量重新分配，保留最近的数据"""
+        start = time.time() if start is None else start
+        self.time_range = timeRange
+        for key, (line, ring) in self.series.items():
+            new_ring = RingBuffer(self.capacity())
+            for x, y in zip(*ring.view()):
+                new_ring.append(x, y)
+            self.series[key] = (line, new_ring)
+            line.set_data(*new_ring.view())
+        self.ax.set_xlim(start, start + timeRange)
+        self.full_draw = True
+
+    def clear(self):
+        for line, ring in self.series.values():
+            ring.clear()
+            line.set_data([], [])
+
+    def follow(self, now):
+        """时间超出当前窗口时移动时间窗"""
+        x_min, x_max = self.ax.get_xlim()
+        if now <= x_max:
+            return
+        if self.mode == 'page':
+            self.clear()
+            self.ax.set_xlim(now, now + self.time_range)
+        else:
+            step = self.time_range * self.scroll_step
+            shift = step * np.ceil((now - x_max) / step)
+            self.ax.set_xlim(x_min + shift, x_max + shift)
+        self.full_draw = True
+
+    def on_draw(self, event):
+        # 整图重绘后缓存不含曲线的背景，并在其上画出曲线
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line, ring in self.series.values():
+            if line.get_visible():
+                self.ax.draw_artist(line)
+
+    def redraw(self, now=None):
+        if now is not None:
+            self.follow(now)
+        if self.full_draw or self.background is None:
+            self.full_draw = False
+            self.canvas.draw()
+            self.canvas.blit(self.ax.bbox)
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.ax.bbox)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# 默认匹配容差（s），不小于空闲流量计的轮询周期
+DEFAULT_TOLERANCE = 3.0
+
+
+def asof_indices(source, target, tolerance=DEFAULT_TOLERANCE, direction='nearest'):
+    """
+    对target中每个时刻，在已排序的source时刻中查找匹配的下标（searchsorted向量化实现）。
+    direction为'backward'取不晚于该时刻的最近一条，'forward'取不早于的最近一条，'nearest'取最近的一条；
+    没有匹配或时间差超过tolerance时下标为-1
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    n = len(source)
+    if not n:
+        return np.full(len(target), -1, dtype=np.int64)
+    if direction == 'backward':
+        index = np.searchsorted(source, target, side='right') - 1
+    elif direction == 'forward':
+        index = np.searchsorted(source, target, side='left')
+    elif direction == 'nearest':
+        right = np.clip(np.searchsorted(source, target, side='left'), 0, n - 1)
+        left = np.clip(right - 1, 0, n - 1)
+        index = np.where(np.abs(target - source[left]) <= np.abs(source[right] - target), left, right)
+    else:
+        raise ValueError(f'unknown direction: {direction}')
+    valid = (index >= 0) & (index < n)
+    index = np.where(valid, index, -1)
+    if tolerance is not None:
+        index[valid] = np.where(np.abs(source[index[valid]] - target[valid]) <= tolerance, index[valid], -1)
+    return index
+
+
+def take(values, index):
+    """按asof_indices的结果取值，未匹配处为NaN"""
+    if not len(values):
+        return np.full(len(index), np.nan)
+    out = np.asarray(values, dtype=np.float64)[np.clip(index, 0, None)]
+    out[index < 0] = np.nan
+    return out
+
+
+def sorted_stream(rows):
+    """保证记录按时间排序（正常写入时已有序，不再排序）"""
+    timestamps = rows['timestamp']
+    if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+        rows = rows[np.argsort(timestamps, kind='stable')]
+    return rows
+
+
+def time_base(temp, mfc, period=None):
+    """公共时间轴：默认使用温度记录的时刻，给出period（s）或没有温度记录时使用等间隔时间轴"""
+    if period is None and len(temp):
+        return np.asarray(temp['timestamp'], dtype=np.float64)
+    stamps = [s['timestamp'] for s in (temp, mfc) if len(s)]
+    if not stamps:
+        return np.empty(0)
+    start = min(s[0] for s in stamps)
+    end = max(s[-1] for s in stamps)
+    period = period or 1.0
+    return start + np.arange(int((end - start) // period) + 1) * period
+
+
+def align_telemetry(temp, mfc, tolerance=DEFAULT_TOLERANCE, direction='nearest', period=None):
+    """
+    将两个温区和每台记录到的流量计对齐到同一时间轴，生成一张宽表：
+    每行一个时刻，每个通道一列，超出容差没有匹配数据的单元为空（NaN）
+    """
+    temp = sorted_stream(temp)
+    mfc = sorted_stream(mfc)
+    base = time_base(temp, mfc, period)
+    columns = {
+        "绝对时间": base,
+        "相对时间(s)": np.round(base - base[0], 3) if len(base) else base,
+    }
+    index = asof_indices(temp['timestamp'], base, tolerance, direction)
+    for name, column in (("PV_ZoneA", 'pv_a'), ("SV_ZoneA", 'sv_a'), ("PV_ZoneB", 'pv_b'), ("SV_ZoneB", 'sv_b')):
+        columns[name] = take(temp[column], index)
+    for id in np.unique(mfc['id']):
+        rows = mfc[mfc['id'] == id]
+        index = asof_indices(rows['timestamp'], base, tolerance, direction)
+        columns[f"MFC{id}_PV"] = take(rows['pv'], index)
+        columns[f"MFC{id}_SV"] = take(rows['sv'], index)
+    return pd.DataFrame(columns)
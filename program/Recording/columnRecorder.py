@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class ColumnRecorder:
+    """
+    按列存储的采样记录：每个通道一个类型确定的预分配数组，容量不足时按块扩容（至少chunk行，
+    且不少于当前容量的一半），追加均摊O(1)，不再每个采样重新分配整个数组。
+    column()/columns()返回已记录部分的视图，不复制数据。
+    TelemetryStore用它作为各数据流的待写块：界面线程逐条append()，后台线程整块交换后按列写入文件
+    """
+    def __init__(self, columns, chunk=4096):
+        # columns: [(通道名, dtype), ...]
+        self.names = [name for name, _ in columns]
+        self.dtypes = dict(columns)
+        self.chunk = chunk
+        self.capacity = chunk
+        self.data = {name: np.empty(chunk, dtype=dtype) for name, dtype in columns}
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def reserve(self, rows):
+        """保证至少能容纳rows行"""
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, self.capacity + max(self.chunk, self.capacity // 2))
+        for name in self.names:
+            column = np.empty(capacity, dtype=self.dtypes[name])
+            column[:self.n] = self.data[name][:self.n]
+            self.data[name] = column
+        self.capacity = capacity
+
+    def append(self, *values, **named):
+        """追加一行，按列顺序或按通道名给出各通道的值"""
+        if self.n == self.capacity:
+            self.reserve(self.n + 1)
+        if values:
+            for name, value in zip(self.names, values):
+                self.data[name][self.n] = value
+        for name, value in named.items():
+            self.data[name][self.n] = value
+        self.n += 1
+
+    def column(self, name, start=0, stop=None):
+        stop = self.n if stop is None else min(stop, self.n)
+        return self.data[name][start:stop]
+
+    def columns(self, start=0, stop=None):
+        return {name: self.column(name, start, stop) for name in self.names}
+
+    def last(self, name):
+        return self.data[name][self.n - 1] if self.n else None
+
+    def clear(self, release=False):
+        """清空记录；release为True时释放已扩容的内存"""
+        self.n = 0
+        if release and self.capacity > self.chunk:
+            self.capacity = self.chunk
+            self.data = {name: np.empty(self.chunk, dtype=self.dtypes[name]) for name in self.names}
@@ -0,0 +1,128 @@
+import os
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QThread, pyqtSignal
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+
+from program.Recording.alignment import DEFAULT_TOLERANCE, align_telemetry
+from program.Recording.telemetryStore import read_stream
+
+EXCEL_MAX_ROWS = 1048575  # 不含标题行
+SHEET_NAME = '双区温度'
+
+
+def format_timestamps(timestamps):
+    """时间戳（s）整列转换为'YYYY-mm-dd HH:MM:SS.fff'字符串，不再逐行构造pd.Timestamp"""
+    if not len(timestamps):
+        return np.empty(0, dtype=str)
+    ms = np.round(np.asarray(timestamps, dtype=np.float64) * 1000).astype('datetime64[ms]')
+    return np.char.replace(np.datetime_as_string(ms, unit='ms'), 'T', ' ')
+
+
+def write_excel(df, path):
+    """openpyxl只写模式逐行流式写入，标题行带格式"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(SHEET_NAME)
+    worksheet.column_dimensions['A'].width = 25
+    worksheet.column_dimensions['B'].width = 15
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color='4F81BD', end_color='4F81BD', fill_type='solid')
+    header = []
+    for name in df.columns:
+        cell = WriteOnlyCell(worksheet, value=name)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal='center')
+        header.append(cell)
+    worksheet.append(header)
+    # 每列先整体转换为Python对象，未匹配的NaN写为空单元格
+    columns = []
+    for name in df.columns:
+        column = df[name].to_numpy(dtype=object)
+        column[pd.isna(column)] = None
+        columns.append(column.tolist())
+    for row in zip(*columns):
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def write_csv(df, path):
+    # utf-8-sig便于Excel直接打开中文表头
+    df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def write_parquet(df, path):
+    df.to_parquet(path, index=False)
+
+
+def write_feather(df, path):
+    df.to_feather(path)
+
+
+WRITERS = {'xlsx': write_excel, 'csv': write_csv, 'parquet': write_parquet, 'feather': write_feather}
+
+
+def build_export_frame(temp, mfc, tolerance=DEFAULT_TOLERANCE, period=None):
+    """对齐后的宽表，绝对时间转换为字符串"""
+    df = align_telemetry(temp, mfc, tolerance=tolerance, period=period)
+    df["绝对时间"] = format_timestamps(df["绝对时间"].to_numpy())
+    return df
+
+
+def export_telemetry(telemetryDir, saveDir, baseName, formats=('xlsx',), tolerance=DEFAULT_TOLERANCE, period=None):
+    """
+    导出一次记录的遥测数据（两个温区和全部流量计对齐到同一时间轴），返回({格式: 文件路径}, 行数)。
+    行数超过Excel上限时xlsx改为导出csv；parquet/feather需要安装pyarrow。没有任何记录时不生成文件
+    """
+    temp = read_stream(telemetryDir, 'temp')
+    mfc = read_stream(telemetryDir, 'mfc')
+    if not len(temp) and not len(mfc):
+        print(f'no telemetry recorded in {telemetryDir}, nothing to export')
+        return {}, 0
+    df = build_export_frame(temp, mfc, tolerance, period)
+    os.makedirs(saveDir, exist_ok=True)
+    formats = list(formats)
+    if 'xlsx' in formats and len(df) > EXCEL_MAX_ROWS:
+        print(f'{len(df)} rows exceed the Excel limit, exporting csv instead')
+        formats.remove('xlsx')
+        if 'csv' not in formats:
+            formats.append('csv')
+    paths = {}
+    for fmt in formats:
+        path = os.path.join(saveDir, f'{baseName}.{fmt}')
+        WRITERS[fmt](df, path)
+        paths[fmt] = path
+    return paths, len(df)
+
+
+class TelemetryExportWorker(QThread):
+    """后台导出线程，完成后发送done_signal：{'ok', 'paths', 'rows', 'seconds', 'error'}"""
+    done_signal = pyqtSignal(dict)
+
+    def __init__(self, telemetryDir, saveDir, baseName, formats=('xlsx',), tolerance=DEFAULT_TOLERANCE, period=None):
+        super().__init__()
+        self.telemetry_dir = telemetryDir
+        self.save_dir = saveDir
+        self.base_name = baseName
+        self.formats = formats
+        self.tolerance = tolerance
+        self.period = period
+
+    def run(self):
+        start = time.perf_counter()
+        result = {'ok': False, 'paths': {}, 'rows': 0, 'seconds': 0.0, 'error': ''}
+        try:
+            result['paths'], result['rows'] = export_telemetry(self.telemetry_dir, self.save_dir, self.base_name,
+                                                               self.formats, self.tolerance, self.period)
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+            print(f'导出异常：{e}')
+            print(traceback.format_exc())
+        result['seconds'] = time.perf_counter() - start
+        self.done_signal.emit(result)
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from program.Recording.columnRecorder import ColumnRecorder
+
+META_FILE = 'meta.json'
+
+
+def stream_dtype(columns):
+    return np.dtype([(name, dtype) for name, dtype in columns])
+
+
+def load_meta(directory):
+    with open(os.path.join(directory, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    return {name: stream_dtype(columns) for name, columns in meta['streams'].items()}
+
+
+def read_stream(directory, stream, dtype=None):
+    """
+    以内存映射方式读取一个数据流的全部完整记录（不复制），
+    断电或崩溃时文件末尾写了一半的记录会被忽略
+    """
+    dtype = load_meta(directory)[stream] if dtype is None else dtype
+    path = os.path.join(directory, f'{stream}.bin')
+    rows = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if not rows:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+
+
+class TelemetryStore:
+    """
+    只追加的磁盘遥测记录：每个数据流（如temp、mfc）一个定长记录的二进制文件，列定义写在meta.json中。
+    append()只把采样写入内存中的待写块，后台线程每flushInterval秒把待写块整体追加到文件，
+    每fsyncInterval秒fsync一次；内存中只保留尚未落盘的一小段数据，崩溃时最多丢失最后一个fsync周期
+    """
+    def __init__(self, directory, streams, flushInterval=1.0, fsyncInterval=5.0, chunk=1024):
+        # streams: {数据流名: [(列名, dtype), ...]}
+        self.directory = directory
+        self.flush_interval = flushInterval
+        self.fsync_interval = fsyncInterval
+        os.makedirs(directory, exist_ok=True)
+        self.dtypes = {name: stream_dtype(columns) for name, columns in streams.items()}
+        self.pending = {name: ColumnRecorder(columns, chunk) for name, columns in streams.items()}
+        self.spare = {name: ColumnRecorder(columns, chunk) for name, columns in streams.items()}
+        self.rows = {}
+        self.files = {}
+        self.write_meta(streams)
+        for name, dtype in self.dtypes.items():
+            path = os.path.join(directory, f'{name}.bin')
+            # 续写已有文件时先截掉末尾不完整的记录
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self.rows[name] = size // dtype.itemsize
+            self.files[name] = open(path, 'ab')
+            if size % dtype.itemsize:
+                self.files[name].truncate(self.rows[name] * dtype.itemsize)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.last_sync = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name='TelemetryStore', daemon=True)
+        self.thread.start()
+
+    def write_meta(self, streams):
+        path = os.path.join(self.directory, META_FILE)
+        if os.path.exists(path):
+            return
+        meta = {'version': 1, 'created': time.time(),
+                'streams': {name: [[column, np.dtype(dtype).str] for column, dtype in columns]
+                            for name, columns in streams.items()}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, stream, *values):
+        with self.lock:
+            self.pending[stream].append(*values)
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self.last_sync >= self.fsync_interval:
+                    self.sync()
+            except Exception as e:
+                print(f'An error occurred when writing telemetry: {e}')
+
+    def flush(self):
+        """把待写块追加到文件（只由后台线程或close()调用）"""
+        for name, dtype in self.dtypes.items():
+            with self.lock:
+                block = self.pending[name]
+                if not len(block):
+                    continue
+                self.pending[name], self.spare[name] = self.spare[name], block
+            rows = np.empty(len(block), dtype=dtype)
+            for column in dtype.names:
+                rows[column] = block.column(column)
+            self.files[name].write(rows.tobytes())
+            self.files[name].flush()
+            self.rows[name] += len(block)
+            block.clear()
+
+    def sync(self):
+        for f in self.files.values():
+            os.fsync(f.fileno())
+        self.last_sync = time.monotonic()
+
+    def row_count(self, stream):
+        """已写入文件的记录数"""
+        return self.rows[stream]
+
+    def read(self, stream):
+        return read_stream(self.directory, stream, self.dtypes[stream])
+
+    def close(self):
+        """停止后台线程，写完剩余数据并fsync"""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.flush()
+        self.sync()
+        for f in self.files.values():
+            f.close()
@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from program.SerialDev.commandQueue import PRIORITY_SETPOINT
+
+
+class ArbiterClient:
+    """共享总线的一个客户端（一个驱动），带优先级和独立的请求队列"""
+    def __init__(self, name, priority=PRIORITY_SETPOINT):
+        self.name = name
+        self.priority = priority
+        self.queue = deque()
+        self.last_served = 0
+        self.served = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def snapshot(self):
+        return {
+            'priority': self.priority,
+            'depth': len(self.queue),
+            'served': self.served,
+            'wait_avg': self.wait_total / self.served if self.served else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+
+class BusArbiter:
+    """
+    一条物理总线上的事务仲裁：每次选出下一条要发送的请求。
+    优先级数值小的客户端先发送；同优先级的客户端轮流发送；
+    任何请求等待超过max_wait秒后不论优先级优先发送，低优先级客户端不会被饿死
+    """
+    def __init__(self, maxWait=1.0):
+        self.max_wait = maxWait
+        self.clients = {}
+        self.counter = itertools.count(1)
+        self.event = asyncio.Event()
+
+    def register(self, name, priority=PRIORITY_SETPOINT):
+        client = self.clients.get(name)
+        if client is None:
+            client = ArbiterClient(name, priority)
+            self.clients[name] = client
+        else:
+            client.priority = priority
+        return client
+
+    def unregister(self, name):
+        client = self.clients.pop(name, None)
+        if client:
+            # 未发送的请求直接取消
+            for request in client.queue:
+                if not request.future.done():
+                    request.future.cancel()
+        return client
+
+    def put(self, request):
+        client = self.clients.get(request.client)
+        if client is None:
+            client = self.register(request.client)
+        client.queue.append(request)
+        self.event.set()
+
+    async def get(self):
+        while True:
+            request = self.pick()
+            if request is not None:
+                return request
+            self.event.clear()
+            await self.event.wait()
+
+    def pick(self):
+        candidates = [client for client in self.clients.values() if client.queue]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        starving = [client for client in candidates if now - client.queue[0].enqueued > self.max_wait]
+        if starving:
+            client = min(starving, key=lambda c: c.queue[0].enqueued)
+        else:
+            best = min(client.priority for client in candidates)
+            client = min((c for c in candidates if c.priority == best), key=lambda c: c.last_served)
+        request = client.queue.popleft()
+        client.last_served = next(self.counter)
+        wait = now - request.enqueued
+        client.served += 1
+        client.wait_total += wait
+        client.wait_max = max(client.wait_max, wait)
+        return request
+
+    def depth(self):
+        return sum(len(client.queue) for client in self.clients.values())
+
+    def stats(self):
+        return {name: client.snapshot() for name, client in self.clients.items()}
@@ -0,0 +1,90 @@
+import itertools
+import time
+from queue import PriorityQueue, Empty
+
+# 优先级数值越小越先发送
+PRIORITY_CONTROL = 0  # 阀门开关、运行/暂停/停止等控制命令
+PRIORITY_SETPOINT = 1  # 设定值写入
+PRIORITY_BACKGROUND = 2  # 刷新缓存等后台任务
+
+
+class Command:
+    """带优先级的写命令，记录入队时间，发送并收到应答后记录入队到应答的延迟"""
+    __slots__ = ('priority', 'seq', 'payload', 'enqueued', 'latency', 'ok')
+
+    def __init__(self, priority, seq, payload):
+        self.priority = priority
+        self.seq = seq
+        self.payload = payload
+        self.enqueued = time.perf_counter()
+        self.latency = None
+        self.ok = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def acknowledge(self, ok=True):
+        self.latency = time.perf_counter() - self.enqueued
+        self.ok = ok
+        return self.latency
+
+
+class CommandQueue:
+    """
+    轮询线程使用的优先写队列：同优先级按入队顺序发送。
+    轮询线程在每次设备收发之间调用drain()，空闲时调用wait()，写命令无需等待整轮读取结束
+    """
+    def __init__(self):
+        self.queue = PriorityQueue()
+        self.counter = itertools.count()
+
+    def put(self, payload, priority=PRIORITY_SETPOINT):
+        command = Command(priority, next(self.counter), payload)
+        self.queue.put(command)
+        return command
+
+    def empty(self):
+        return self.queue.empty()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def get_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            return None
+
+    def drain(self, handler, maxPriority=None):
+        """
+        依次处理队列中已有的命令，返回处理的条数。
+        给出maxPriority时只处理优先级不低于它（数值不大于它）的命令，其余留在队列中
+        """
+        count = 0
+        while True:
+            command = self.get_nowait()
+            if command is None:
+                return count
+            if maxPriority is not None and command.priority > maxPriority:
+                # 队列按优先级出队，剩余的命令都不满足条件，放回后结束（序号不变，顺序不受影响）
+                self.queue.put(command)
+                return count
+            handler(command)
+            count += 1
+
+    def wait(self, seconds, handler, stop=None):
+        """
+        空闲等待seconds秒，期间到达的命令立即处理。
+        stop为可调用对象，返回True时提前结束等待
+        """
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stop is not None and stop()):
+                return
+            try:
+                # 分段等待，便于及时响应停止标志
+                command = self.queue.get(timeout=min(remaining, 0.1))
+            except Empty:
+                continue
+            handler(command)
@@ -0,0 +1,94 @@
+import time
+
+from program.SerialDev.modbusCodec import response_length
+
+
+def char_time(baudRate, bitsPerChar=11):
+    """一个字符在线路上的传输时间（s），RTU每字符按1起始位+8数据位+校验/停止位共11位计"""
+    return bitsPerChar / float(baudRate)
+
+
+def frame_gap(baudRate):
+    """
+    Modbus RTU帧间隔t3.5（s）。
+    规范规定波特率高于19200时使用固定的1.75ms
+    """
+    if float(baudRate) > 19200:
+        return 0.00175
+    return 3.5 * char_time(baudRate)
+
+
+class FrameTransport:
+    """
+    串口帧收发层：写入请求后按预期应答长度读取，
+    一旦收齐立即返回，若首字节超时或字节间隔超过t3.5则认为帧结束，不再使用固定延时。
+    """
+    # 应答长度未知时最多读取的字节数（RTU帧上限256字节），实际以帧间隔判定结束
+    max_frame_length = 256
+
+    def __init__(self, serialPort, responseTimeout=None, exceptionLength=5, gapMargin=0.016):
+        self.MyCom = serialPort
+        self.response_timeout = responseTimeout if responseTimeout is not None else serialPort.timeout
+        # 异常应答（功能码最高位置1）的长度，Modbus为5字节；非Modbus协议传None关闭该判断
+        self.exception_length = exceptionLength
+        # USB转485适配器按批转发字节（FTDI默认延迟16ms），在t3.5之外留出余量，避免把一帧截成两段
+        self.gap = frame_gap(serialPort.baudrate) + gapMargin
+        self.last_duration = 0
+
+    def transact(self, request, responseLength):
+        """
+        发送请求帧并接收应答，返回收到的字节（bytearray）。
+        超时或帧间隔到期时返回已收到的部分，由调用方校验
+        """
+        start = time.perf_counter()
+        self.MyCom.reset_input_buffer()
+        self.MyCom.write(request)
+        buffer = self.receive(responseLength)
+        self.last_duration = time.perf_counter() - start
+        return buffer
+
+    def send(self, request, turnaround=0.0):
+        """
+        只发送不等待应答（广播帧），发送完成后等待帧间隔和从站处理时间turnaround，
+        保证下一帧不会在从站执行广播命令期间到达
+        """
+        start = time.perf_counter()
+        self.MyCom.reset_input_buffer()
+        self.MyCom.write(request)
+        self.MyCom.flush()
+        time.sleep(self.gap + turnaround)
+        self.last_duration = time.perf_counter() - start
+
+    def receive(self, responseLength):
+        if responseLength is None:
+            responseLength = self.max_frame_length
+        buffer = bytearray()
+        # 首字节前等待设备应答，可能需要整个应答超时；上一次收发已恢复时不再重新设置
+        self.set_timeouts(self.response_timeout, None)
+        head = self.MyCom.read(min(2, responseLength))
+        buffer += head
+        if len(head) < min(2, responseLength):
+            return buffer
+        remaining = responseLength - len(buffer)
+        if self.exception_length and buffer[1] & 0x80:
+            remaining = self.exception_length - len(buffer)
+        if remaining <= 0:
+            return buffer
+        # 帧已开始传输：剩余字节最多需要 remaining 个字符时间，字节间隔超过t3.5视为帧结束
+        self.set_timeouts(remaining * char_time(self.MyCom.baudrate) + self.gap, self.gap)
+        try:
+            buffer += self.MyCom.read(remaining)
+        finally:
+            self.set_timeouts(self.response_timeout, None)
+        return buffer
+
+    def set_timeouts(self, timeout, interByteTimeout):
+        """只在值变化时设置串口超时，pyserial每次设置都会重新配置串口"""
+        if self.MyCom.timeout != timeout:
+            self.MyCom.timeout = timeout
+        if self.MyCom.inter_byte_timeout != interByteTimeout:
+            self.MyCom.inter_byte_timeout = interByteTimeout
+
+    def transact_modbus(self, request):
+        """按功能码自动计算应答长度的Modbus RTU收发"""
+        return self.transact(request, response_length(request))
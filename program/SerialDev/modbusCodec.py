@@ -0,0 +1,234 @@
+import struct
+
+READ_COILS = 0x01
+READ_DISCRETE_INPUTS = 0x02
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_SINGLE_COIL = 0x05
+WRITE_SINGLE_REGISTER = 0x06
+WRITE_MULTIPLE_COILS = 0x0F
+WRITE_MULTIPLE_REGISTERS = 0x10
+
+EXCEPTION_MESSAGES = {
+    0x01: '非法功能码',
+    0x02: '非法数据地址',
+    0x03: '非法数据值',
+    0x04: '从站设备故障',
+    0x05: '确认',
+    0x06: '从站设备忙',
+    0x08: '存储奇偶性差错',
+    0x0A: '不可用网关路径',
+    0x0B: '网关目标设备响应失败',
+}
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _make_crc_table()
+
+_HEADER = struct.Struct('>BBHH')
+_CRC = struct.Struct('<H')
+
+
+def crc16(data):
+    """查表计算Modbus CRC16，返回16位整数（低字节在前发送）"""
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def calc_crc16(data):
+    """兼容旧接口，返回[低字节, 高字节]"""
+    crc = crc16(data)
+    return [crc & 0xff, crc >> 8]
+
+
+def append_crc(frame):
+    """在帧尾追加CRC，返回bytes"""
+    return bytes(frame) + _CRC.pack(crc16(frame))
+
+
+def check_crc(frame):
+    """校验帧尾CRC"""
+    if frame is None or len(frame) < 4:
+        return False
+    return crc16(frame[:-2]) == _CRC.unpack_from(frame, len(frame) - 2)[0]
+
+
+class ModbusError:
+    """
+    结构化的应答错误，解析函数在失败时返回该对象而不是抛出异常。
+    kind: 'timeout' 无应答, 'crc' 校验失败, 'exception' 从站异常应答, 'mismatch' 应答与请求不符
+    """
+    __slots__ = ('kind', 'slave', 'function', 'code', 'message')
+
+    def __init__(self, kind, slave=None, function=None, code=None, message=''):
+        self.kind = kind
+        self.slave = slave
+        self.function = function
+        self.code = code
+        self.message = message
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f'ModbusError(kind={self.kind!r}, slave={self.slave}, function={self.function}, code={self.code}, message={self.message!r})'
+
+
+# ---------- 请求帧构造 ----------
+
+def build_read_coils(slave, address, count):
+    return append_crc(_HEADER.pack(slave, READ_COILS, address, count))
+
+
+def build_read_holding_registers(slave, address, count):
+    return append_crc(_HEADER.pack(slave, READ_HOLDING_REGISTERS, address, count))
+
+
+def build_write_single_coil(slave, address, value):
+    return append_crc(_HEADER.pack(slave, WRITE_SINGLE_COIL, address, 0xFF00 if value else 0x0000))
+
+
+def build_write_single_register(slave, address, value):
+    return append_crc(_HEADER.pack(slave, WRITE_SINGLE_REGISTER, address, value & 0xFFFF))
+
+
+def build_write_multiple_coils(slave, address, values):
+    values = list(values)
+    packed = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            packed[i // 8] |= 1 << (i % 8)
+    frame = _HEADER.pack(slave, WRITE_MULTIPLE_COILS, address, len(values)) + bytes([len(packed)]) + bytes(packed)
+    return append_crc(frame)
+
+
+def build_write_multiple_registers(slave, address, values):
+    values = [v & 0xFFFF for v in values]
+    frame = (_HEADER.pack(slave, WRITE_MULTIPLE_REGISTERS, address, len(values)) + bytes([2 * len(values)])
+             + struct.pack(f'>{len(values)}H', *values))
+    return append_crc(frame)
+
+
+def response_length(request):
+    """
+    根据请求帧的功能码计算正常应答帧的字节数（含CRC），无法确定时返回None
+    FC01/02: 地址+功能码+字节数+N字节线圈+CRC
+    FC03/04: 地址+功能码+字节数+2N字节寄存器+CRC
+    FC05/06/0F/10: 回显地址和数量，共8字节
+    """
+    if request is None or len(request) < 6:
+        return None
+    function = request[1]
+    count = request[4] * 256 + request[5]
+    if function in (READ_COILS, READ_DISCRETE_INPUTS):
+        return 5 + (count + 7) // 8
+    if function in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+        return 5 + 2 * count
+    if function in (WRITE_SINGLE_COIL, WRITE_SINGLE_REGISTER, WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS):
+        return 8
+    return None
+
+
+# ---------- 应答帧解析 ----------
+
+def _check_response(response, slave, function):
+    if not response:
+        return ModbusError('timeout', slave, function, message='无应答')
+    if len(response) < 5 or not check_crc(response):
+        return ModbusError('crc', slave, function, message=f'CRC校验失败: {bytes(response).hex(" ")}')
+    if response[0] != slave:
+        return ModbusError('mismatch', slave, function, message=f'应答地址{response[0]}与请求不符')
+    if response[1] == function | 0x80:
+        code = response[2]
+        return ModbusError('exception', slave, function, code, EXCEPTION_MESSAGES.get(code, '未知异常'))
+    if response[1] != function:
+        return ModbusError('mismatch', slave, function, message=f'应答功能码{response[1]}与请求不符')
+    return None
+
+
+def parse_read_bits(response, slave, count, function=READ_COILS):
+    """解析FC01/02应答，返回长度为count的bool列表"""
+    error = _check_response(response, slave, function)
+    if error is not None:
+        return error
+    byte_count = (count + 7) // 8
+    if response[2] != byte_count or len(response) != 5 + byte_count:
+        return ModbusError('mismatch', slave, function, message='线圈字节数与请求不符')
+    return [bool(response[3 + i // 8] >> (i % 8) & 1) for i in range(count)]
+
+
+def parse_read_registers(response, slave, count, function=READ_HOLDING_REGISTERS):
+    """解析FC03/04应答，返回无符号16位寄存器值元组"""
+    error = _check_response(response, slave, function)
+    if error is not None:
+        return error
+    if response[2] != 2 * count or len(response) != 5 + 2 * count:
+        return ModbusError('mismatch', slave, function, message='寄存器字节数与请求不符')
+    return struct.unpack_from(f'>{count}H', response, 3)
+
+
+def parse_write_echo(response, request):
+    """解析FC05/06/0F/10应答，成功时返回回显的(地址, 值或数量)"""
+    slave, function = request[0], request[1]
+    error = _check_response(response, slave, function)
+    if error is not None:
+        return error
+    if len(response) != 8:
+        return ModbusError('mismatch', slave, function, message='写应答长度错误')
+    if response[2:6] != request[2:6]:
+        return ModbusError('mismatch', slave, function, message='写应答回显与请求不符')
+    return struct.unpack_from('>HH', response, 2)
+
+
+if __name__ == "__main__":
+    # 微基准：每帧编码/解码耗时
+    import timeit
+
+    def bench(name, stmt, number=20000):
+        t = timeit.timeit(stmt, number=number)
+        print(f'{name:<36}{t / number * 1e6:8.2f} us/frame')
+
+    def legacy_crc16(data):
+        crc = 0xFFFF
+        for pos in data:
+            crc ^= pos
+            for i in range(8):
+                if (crc & 1) != 0:
+                    crc >>= 1
+                    crc ^= 0xA001
+                else:
+                    crc >>= 1
+        return [crc & 0xff, crc >> 8]
+
+    request = build_read_holding_registers(1, 0x10, 33)
+    regs = bytes([1, 3, 66]) + bytes(range(66))
+    reply = append_crc(regs)
+    coils = append_crc(bytes([1, 1, 1, 0x4A]))
+    write = build_write_single_register(1, 0x11, 0x200)
+
+    bench('crc16 8B (bit loop, old)', lambda: legacy_crc16(request[:6]))
+    bench('crc16 8B (table)', lambda: crc16(request[:6]))
+    bench('crc16 71B (bit loop, old)', lambda: legacy_crc16(reply[:-2]))
+    bench('crc16 71B (table)', lambda: crc16(reply[:-2]))
+    bench('build FC03', lambda: build_read_holding_registers(1, 0x10, 33))
+    bench('build FC06', lambda: build_write_single_register(1, 0x11, 0x200))
+    bench('build FC0F x8', lambda: build_write_multiple_coils(1, 0, [1, 0, 0, 1, 0, 0, 0, 0]))
+    bench('build FC10 x4', lambda: build_write_multiple_registers(1, 0x10, [1, 2, 3, 4]))
+    bench('parse FC03 x33', lambda: parse_read_registers(reply, 1, 33))
+    bench('parse FC01 x8', lambda: parse_read_bits(coils, 1, 8))
+    bench('parse FC06 echo', lambda: parse_write_echo(write, write))
@@ -0,0 +1,462 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from PyQt5.QtCore import QObject
+
+from program.SerialDev.busArbiter import BusArbiter
+from program.SerialDev.commandQueue import PRIORITY_SETPOINT
+from program.SerialDev.frameTransport import FrameTransport
+from program.SerialDev.modbusCodec import response_length
+
+DEFAULT_CLIENT = 'default'
+
+
+class PortStats:
+    """单个串口的统计：请求数、超时数、取消数、总线占用时间和请求延迟（入队到完成）"""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.busy = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, busy, latency):
+        self.requests += 1
+        self.busy += busy
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+            'utilization': self.busy / elapsed,
+            'latency_avg': self.latency_total / self.requests if self.requests else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+
+class SerialRequest:
+    """一帧收发，或job不为None时为驱动的一次轮询作业（在收发线程中执行，期间独占该串口）"""
+    __slots__ = ('client', 'frame', 'response_length', 'send_only', 'turnaround', 'future', 'enqueued', 'job')
+
+    def __init__(self, frame, responseLength, future, sendOnly=False, turnaround=0.0, client=DEFAULT_CLIENT,
+                 job=None):
+        self.client = client
+        self.frame = frame
+        self.response_length = responseLength
+        self.send_only = sendOnly
+        self.turnaround = turnaround
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.job = job
+
+
+class SerialPortTask:
+    """
+    一个串口对应一个asyncio任务，由BusArbiter在多个客户端之间选出下一条请求。
+    阻塞的串口读写放在该口专用的单线程执行器中，不占用事件循环。
+    各客户端可有不同的串口参数（如停止位）和收发选项，切换客户端时先应用其串口参数
+    """
+    def __init__(self, engine, name, serialPort, **transportOptions):
+        self.engine = engine
+        self.name = name
+        self.MyCom = serialPort
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'serial-{name}',
+                                           initializer=self.bind_io_thread)
+        self.io_thread = None
+        self.arbiter = BusArbiter()
+        self.settings = {}
+        self.transport_options = {DEFAULT_CLIENT: transportOptions}
+        self.transports = {}
+        self.current_settings = None
+        self.stats = PortStats()
+        self.task = None
+
+    def add_client(self, client, priority=PRIORITY_SETPOINT, settings=None, **transportOptions):
+        self.arbiter.register(client, priority)
+        self.settings[client] = settings or {}
+        self.transport_options[client] = transportOptions
+        self.transports.pop(client, None)
+
+    def remove_client(self, client):
+        self.arbiter.unregister(client)
+        self.settings.pop(client, None)
+        self.transport_options.pop(client, None)
+        self.transports.pop(client, None)
+        return [name for name in self.arbiter.clients if name != DEFAULT_CLIENT]
+
+    def transport_for(self, client):
+        """在执行器线程中调用：应用客户端的串口参数，返回该客户端的收发层"""
+        settings = self.settings.get(client)
+        if settings and settings != self.current_settings:
+            self.MyCom.apply_settings(settings)
+            self.current_settings = settings
+        transport = self.transports.get(client)
+        if transport is None:
+            # 按客户端的波特率计算帧间隔，因此在应用参数之后创建
+            transport = FrameTransport(self.MyCom, **self.transport_options.get(client, {}))
+            self.transports[client] = transport
+        return transport
+
+    def bind_io_thread(self):
+        self.io_thread = threading.get_ident()
+
+    def in_io_thread(self):
+        return threading.get_ident() == self.io_thread
+
+    def execute(self, request):
+        if request.job is not None:
+            return request.job()
+        if request.send_only:
+            return self.send(request.client, request.frame, request.turnaround, request.enqueued)
+        return self.transact(request.client, request.frame, request.response_length, request.enqueued)
+
+    def transact(self, client, frame, responseLength, enqueued=None):
+        """在收发线程中直接收发一帧并记录统计（驱动的轮询作业内的收发也由此完成）"""
+        start = time.monotonic()
+        result = self.transport_for(client).transact(frame, responseLength)
+        end = time.monotonic()
+        self.stats.record(end - start, end - (start if enqueued is None else enqueued))
+        return result
+
+    def send(self, client, frame, turnaround=0.0, enqueued=None):
+        start = time.monotonic()
+        self.transport_for(client).send(frame, turnaround)
+        end = time.monotonic()
+        self.stats.record(end - start, end - (start if enqueued is None else enqueued))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self.next_request()
+            if request.future.done():
+                # 调用方已取消或已超时，不再占用总线
+                self.stats.cancelled += 1
+                continue
+            try:
+                result = await loop.run_in_executor(self.executor, self.execute, request)
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+                continue
+            if not request.future.done():
+                request.future.set_result(result)
+
+    async def next_request(self):
+        return await self.arbiter.get()
+
+    def put(self, request):
+        self.arbiter.put(request)
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class SerialEngine:
+    """
+    异步串口引擎：在后台线程运行一个asyncio事件循环，每个注册的串口一个任务。
+    协程中使用await engine.request(...)，普通线程中使用engine.transact(...)（阻塞）
+    或engine.submit(...)（返回concurrent.futures.Future），每个请求可单独设置超时。
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.ports = {}
+        self.thread = threading.Thread(target=self.run_loop, name='serial-engine', daemon=True)
+        self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def call(self, func, *args):
+        """在事件循环线程中执行func并等待结果"""
+        async def wrapper():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(wrapper(), self.loop).result()
+
+    def register_port(self, name, serialPort, **transportOptions):
+        """注册已打开的串口，transportOptions传给FrameTransport（如exceptionLength=None）"""
+        def register():
+            port = SerialPortTask(self, name, serialPort, **transportOptions)
+            port.task = self.loop.create_task(port.run())
+            self.ports[name] = port
+            return port
+        if name in self.ports:
+            return self.ports[name]
+        return self.call(register)
+
+    def client(self, portName, clientName, priority=PRIORITY_SETPOINT, baudRate=9600, dataBits=serial.EIGHTBITS,
+               parity=serial.PARITY_NONE, stopBits=serial.STOPBITS_ONE, timeout=None, **transportOptions):
+        """
+        以clientName的身份使用物理串口portName：串口由引擎持有，首次使用时打开，
+        多个驱动（客户端）共享同一串口时由BusArbiter按优先级和轮转仲裁。
+        返回EngineTransport，可传给MFCComm/AIBUSParam的transport参数
+        """
+        settings = {'baudrate': int(baudRate), 'bytesize': dataBits, 'parity': parity, 'stopbits': stopBits}
+        if portName not in self.ports:
+            serialPort = serial.Serial(port=portName, timeout=0.15, write_timeout=0.15, **settings)
+            self.register_port(portName, serialPort)
+        port = self.ports[portName]
+        self.call(lambda: port.add_client(clientName, priority, settings, **transportOptions))
+        return EngineTransport(self, portName, timeout=timeout, client=clientName)
+
+    def release_client(self, portName, clientName):
+        """客户端断开，最后一个客户端断开时关闭串口"""
+        port = self.ports.get(portName)
+        if port is None:
+            return
+        print(f'serial {portName} {clientName} disconnected, port stats: {self.stats(portName)}')
+        remaining = self.call(port.remove_client, clientName)
+        if not remaining:
+            self.unregister_port(portName)
+            port.MyCom.close()
+
+    def unregister_port(self, name):
+        port = self.ports.pop(name, None)
+        if port:
+            self.loop.call_soon_threadsafe(port.close)
+        return port
+
+    async def request(self, name, frame, responseLength=None, timeout=None, sendOnly=False, turnaround=0.0,
+                      client=DEFAULT_CLIENT):
+        """
+        协程接口：发送一帧并等待应答。responseLength为None时按Modbus功能码推算。
+        timeout（s）包括排队时间，超时抛出asyncio.TimeoutError，请求若尚未发送则不再发送
+        """
+        port = self.ports[name]
+        if responseLength is None and not sendOnly:
+            responseLength = response_length(frame)
+        future = self.loop.create_future()
+        port.put(SerialRequest(frame, responseLength, future, sendOnly, turnaround, client))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            port.stats.timeouts += 1
+            raise
+
+    async def run_job(self, name, job, client=DEFAULT_CLIENT):
+        """协程接口：阻塞的作业经该串口的BusArbiter排队后在收发线程中执行，返回作业的结果"""
+        future = self.loop.create_future()
+        self.ports[name].put(SerialRequest(None, None, future, client=client, job=job))
+        return await future
+
+    def attach(self, driver):
+        """
+        在引擎上运行一个EngineBridge驱动，返回concurrent.futures.Future，驱动停止并关闭后完成。
+        驱动不再占用自己的线程：轮询由事件循环调度，在串口的收发线程中执行
+        """
+        def create_event():
+            wake = asyncio.Event()
+            driver.wake_callback = lambda: self.loop.call_soon_threadsafe(wake.set)
+            return wake
+        wake = self.call(create_event)
+        return asyncio.run_coroutine_threadsafe(self.drive(driver, wake), self.loop)
+
+    async def drive(self, driver, wake):
+        name, client = driver.transport.name, driver.transport.client
+        loop = asyncio.get_running_loop()
+        try:
+            while not driver.stop and name in self.ports:
+                wake.clear()
+                try:
+                    delay = await self.run_job(name, driver.poll, client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f'An error occurred when polling {client} on {name}: {e}')
+                    delay = 1.0
+                if driver.stop:
+                    break
+                if delay > 0:
+                    # 等到下一次轮询时间，期间有写命令（wake()）时提前执行
+                    try:
+                        await asyncio.wait_for(wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            driver.wake_callback = None
+            port = self.ports.get(name)
+            # 关闭驱动（注销客户端、最后一个客户端关闭串口）同样在收发线程中执行，不与其他收发交错；
+            # 串口已被注销时在默认执行器中关闭
+            try:
+                await loop.run_in_executor(port.executor if port is not None else None, driver.shutdown)
+            except Exception as e:
+                print(f'An error occurred when shutting down {client} on {name}: {e}')
+
+    def submit(self, name, frame, responseLength=None, timeout=None, sendOnly=False, turnaround=0.0,
+               client=DEFAULT_CLIENT):
+        """线程安全的提交接口，返回concurrent.futures.Future，可调用cancel()取消"""
+        return asyncio.run_coroutine_threadsafe(
+            self.request(name, frame, responseLength, timeout, sendOnly, turnaround, client), self.loop)
+
+    def transact(self, name, frame, responseLength=None, timeout=None, client=DEFAULT_CLIENT):
+        """阻塞接口，供驱动和工作线程使用；超时返回空的bytearray，与FrameTransport一致"""
+        try:
+            return self.submit(name, frame, responseLength, timeout, client=client).result()
+        except (asyncio.TimeoutError, TimeoutError):
+            return bytearray()
+
+    def stats(self, name=None):
+        """串口统计，包括排队深度和各客户端的等待时间"""
+        if name is None:
+            return {port_name: self.stats(port_name) for port_name in list(self.ports)}
+        port = self.ports[name]
+        stats = port.stats.snapshot()
+        stats['depth'] = port.arbiter.depth()
+        stats['clients'] = port.arbiter.stats()
+        return stats
+
+    def close(self):
+        async def shutdown():
+            tasks = []
+            for name in list(self.ports):
+                port = self.ports.pop(name)
+                port.close()
+                tasks.append(port.task)
+            await asyncio.gather(*[task for task in tasks if task], return_exceptions=True)
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(2)
+        except Exception as e:
+            print(f'An error occurred when close serial engine: {e}')
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+
+class PortHandle:
+    """驱动持有的串口句柄：close()时从引擎注销并关闭串口，共享串口时只注销该客户端"""
+    def __init__(self, engine, name, client=DEFAULT_CLIENT):
+        self.engine = engine
+        self.name = name
+        self.client = client
+        self.closed = False
+
+    @property
+    def is_open(self):
+        port = self.engine.ports.get(self.name)
+        return not self.closed and port is not None and port.MyCom.is_open
+
+    def isOpen(self):
+        return self.is_open
+
+    @property
+    def baudrate(self):
+        return self.engine.ports[self.name].MyCom.baudrate
+
+    def close(self):
+        self.closed = True
+        if self.client != DEFAULT_CLIENT:
+            self.engine.release_client(self.name, self.client)
+            return
+        port = self.engine.unregister_port(self.name)
+        if port is not None:
+            port.MyCom.close()
+
+
+class EngineTransport:
+    """
+    与FrameTransport接口一致的收发层，请求经由SerialEngine发送，
+    可作为MFCComm/AIBUSParam的transport参数
+    """
+    def __init__(self, engine, name, timeout=None, client=DEFAULT_CLIENT):
+        self.engine = engine
+        self.name = name
+        self.timeout = timeout
+        self.client = client
+        self.last_duration = 0
+        # 驱动的DisConnect()会关闭MyCom，这里给出注销串口的句柄
+        self.MyCom = PortHandle(engine, name, client)
+
+    def transact(self, request, responseLength):
+        start = time.perf_counter()
+        port = self.engine.ports.get(self.name)
+        if port is not None and port.in_io_thread():
+            # 已在该串口的收发线程中（驱动的轮询作业），直接收发，不再经过事件循环
+            buffer = port.transact(self.client, request, responseLength)
+        else:
+            buffer = self.engine.transact(self.name, request, responseLength, self.timeout, self.client)
+        self.last_duration = time.perf_counter() - start
+        return buffer
+
+    def transact_modbus(self, request):
+        return self.transact(request, response_length(request))
+
+    def send(self, request, turnaround=0.0):
+        start = time.perf_counter()
+        port = self.engine.ports.get(self.name)
+        if port is not None and port.in_io_thread():
+            port.send(self.client, request, turnaround)
+        else:
+            self.engine.submit(self.name, request, timeout=self.timeout, sendOnly=True, turnaround=turnaround,
+                               client=self.client).result()
+        self.last_duration = time.perf_counter() - start
+
+
+class EngineBridge(QObject):
+    """
+    在SerialEngine上运行的设备驱动与Qt之间的桥接，MFCWorker、TempWorker等驱动继承它，不再各自占用一个QThread。
+    start()后引擎按poll()返回的秒数调度轮询，poll()经该串口的BusArbiter排队后在收发线程中执行，
+    其中的收发直接使用串口；结果由子类的pyqtSignal发出，跨线程emit时Qt自动排队到界面线程。
+    写命令入队后调用wake()，引擎立即安排一次轮询；stop_run()后在收发线程中调用shutdown()关闭驱动
+    """
+    def __init__(self):
+        super().__init__()
+        self.transport = None
+        self.stop = False
+        self.future = None
+        self.wake_callback = None
+
+    def poll(self):
+        """执行一次轮询，返回距下一次轮询的秒数"""
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+    def start(self):
+        if not isinstance(self.transport, EngineTransport):
+            raise ValueError('EngineBridge drivers need a transport from SerialEngine.client()')
+        self.stop = False
+        self.future = self.transport.engine.attach(self)
+
+    def wake(self):
+        callback = self.wake_callback
+        if callback is not None:
+            callback()
+
+    def stop_run(self):
+        self.stop = True
+        self.wake()
+
+    def isRunning(self):
+        return self.future is not None and not self.future.done()
+
+    def wait(self, timeout=None):
+        """等待驱动停止并关闭（timeout单位为s），返回是否已停止"""
+        if self.future is None:
+            return True
+        concurrent.futures.wait([self.future], timeout)
+        return self.future.done()
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def shared_engine():
+    """进程内共享的串口引擎，各驱动通过它共享物理串口"""
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = SerialEngine()
+        return _shared_engine
@@ -0,0 +1,101 @@
+import os
+import select
+import threading
+import time
+
+from program.SerialDev.frameTransport import char_time
+
+
+class LoopbackSerial:
+    """
+    进程内回环串口，接口与serial.Serial中被MFCComm/AIBUSParam/FrameTransport使用的部分一致。
+    bank为模拟从站总线，需提供handle(request)返回应答帧（或None）和应答延迟latency。
+    应答在 请求时刻 + 从站延迟 + 按波特率计算的传输时间 后才可读取，模拟真实总线耗时
+    """
+    def __init__(self, bank, baudrate=9600, timeout=0.15):
+        self.bank = bank
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.inter_byte_timeout = None
+        self.write_timeout = timeout
+        self.is_open = True
+        self.name = 'loopback'
+        self.rx = bytearray()
+        self.ready_time = 0
+
+    def isOpen(self):
+        return self.is_open
+
+    def close(self):
+        self.is_open = False
+
+    def reset_input_buffer(self):
+        self.rx = bytearray()
+
+    def flush(self):
+        pass
+
+    def apply_settings(self, settings):
+        self.baudrate = settings.get('baudrate', self.baudrate)
+
+    def write(self, data):
+        data = bytes(data)
+        sent = time.monotonic() + len(data) * char_time(self.baudrate)
+        response = self.bank.handle(data)
+        if response:
+            self.rx += response
+            self.ready_time = sent + self.bank.latency + len(response) * char_time(self.baudrate)
+        return len(data)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 1)
+        if not self.rx or self.ready_time > deadline:
+            # 无应答：等待整个超时
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            return b''
+        time.sleep(max(0.0, self.ready_time - time.monotonic()))
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+
+class PtySimServer:
+    """
+    通过伪终端对暴露模拟总线：MFCComm/AIBUSParam(portName=server.port_name)像打开真实串口一样连接。
+    主端线程按帧间隔切分请求帧并应答（仅限Linux/macOS）
+    """
+    def __init__(self, bank, frameGap=0.003):
+        self.bank = bank
+        self.frame_gap = frameGap
+        self.master, self.slave = os.openpty()
+        self.port_name = os.ttyname(self.slave)
+        self.stop = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        buffer = bytearray()
+        while not self.stop:
+            readable, _, _ = select.select([self.master], [], [], self.frame_gap if buffer else 0.1)
+            if readable:
+                try:
+                    buffer += os.read(self.master, 256)
+                except OSError:
+                    break
+                continue
+            if not buffer:
+                continue
+            response = self.bank.handle(buffer)
+            buffer = bytearray()
+            if response:
+                time.sleep(self.bank.latency)
+                os.write(self.master, response)
+
+    def close(self):
+        self.stop = True
+        self.thread.join(1)
+        os.close(self.master)
+        os.close(self.slave)
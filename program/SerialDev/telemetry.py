@@ -0,0 +1,46 @@
+class TelemetryRecord:
+    """
+    一次读取得到的设备状态。使用__slots__，创建后不可修改，
+    worker线程和界面线程可以直接共享同一个对象而无需复制
+    """
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class SnapshotBuffer:
+    """
+    设备状态快照：worker在一个预先分配的列表中写入各设备的最新记录，publish()返回它的元组快照。
+    记录本身不可修改，每次发布只复制记录的引用（16项）；
+    发送给界面的元组不会被之后的写入覆盖，界面可以一直持有到下一次刷新
+    """
+    def __init__(self, size):
+        self.records = [None] * size
+        self.published = tuple(self.records)
+        self.seq = 0
+
+    def write(self, index, record):
+        # 未重新读取的设备保留上一次的记录
+        self.records[index] = record
+
+    def publish(self):
+        # 只由worker线程调用
+        self.seq += 1
+        self.published = tuple(self.records)
+        return self.published
+
+    def read(self):
+        """最近一次发布的快照，可在其他线程中调用"""
+        return self.published
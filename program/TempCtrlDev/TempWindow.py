@@ -3,15 +3,20 @@ import os
 import sys
 from queue import Queue
 import time
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal
 
 from PyQt5.QtWidgets import QMessageBox, QDialog, QVBoxLayout, QDialogButtonBox, \
     QTableWidget, QPushButton, QTableWidgetItem, QFileDialog, QComboBox, QHBoxLayout
+from program.SerialDev.commandQueue import CommandQueue, PRIORITY_CONTROL, PRIORITY_SETPOINT
+from program.SerialDev.serialEngine import EngineBridge
+from program.SerialDev.telemetry import SnapshotBuffer, TelemetryRecord
 from program.TempCtrlDev.tempdev import AIBUSParam
 
 BASE_DIR = os.path.dirname(os.path.realpath(sys.argv[0]))
 config_directory_path = os.path.join(BASE_DIR, 'config')
 temp_config_path = os.path.join(BASE_DIR, 'config', 'temp_config')
+# 参数27运行状态：0运行、1停止、2暂停
+ZONE_STATE_STOP = 1
 
 
 class TempInputData:
@@ -21,92 +26,112 @@ class TempInputData:
         self.iDevAdd = iDevAdd
 
 
+class TempProgramUpload:
+    """一次程序上传：从startParam开始的连续程序参数（温度、时间交替）"""
+    def __init__(self, iDevAdd=None, values=None, startParam=80):
+        self.iDevAdd = iDevAdd
+        self.values = values
+        self.startParam = startParam
+
+
 class TempProgramData:
     def __init__(self, temp_seg, time_seg):
         self.temp_seg = temp_seg
         self.time_seg = time_seg
 
 
-class TempOutputData:
-    def __init__(self, pv=None, sv=None, mv=None, step=None, tim=None, state=None):
-        self.pv = pv
-        self.sv = sv
-        self.mv = mv
-        self.step = step
-        self.tim = tim
-        self.state = state
+class TempOutputData(TelemetryRecord):
+    """一个温区一次读取的状态，timestamp为读取时刻（time.time()）"""
+    __slots__ = ('pv', 'sv', 'mv', 'step', 'tim', 'state', 'alarm', 'timestamp')
 
+    def __init__(self, pv=None, sv=None, mv=None, step=None, tim=None, state=None, alarm=0, timestamp=None):
+        super().__init__(pv=pv, sv=sv, mv=mv, step=step, tim=tim, state=state, alarm=alarm,
+                         timestamp=time.time() if timestamp is None else timestamp)
 
-class TempWorker(QThread):
-    result_signal = pyqtSignal([list])
+
+class TempWorker(EngineBridge):
+    result_signal = pyqtSignal(object)
     program_signal = pyqtSignal([list])
+    ack_signal = pyqtSignal(dict)
 
-    def __init__(self, portName, baudRate):
+    def __init__(self, portName, baudRate, port=None, transport=None):
         super().__init__()
-        self.aiBUSParam = AIBUSParam(portName=portName, baudRate=baudRate)
+        self.aiBUSParam = AIBUSParam(portName=portName, baudRate=baudRate, port=port, transport=transport)
+        # 由串口引擎调度轮询，见EngineBridge
+        self.transport = transport
         self.start_time = time.time()
         self.stop = False
-        self.result = [None for _ in range(2)]
-        self.data_queue = Queue()
+        # 温区状态快照，发送给界面的是不可变的元组快照
+        self.snapshot = SnapshotBuffer(2)
+        self.data_queue = CommandQueue()
         self.program_req = Queue()
-
-    def run(self):
+        # 两个温区共六帧，一轮读取约0.2s，轮询间隔随之缩短
+        self.poll_interval = 0.5
+        self.next_read = 0
+        # 各温控器程序参数80-179的原始值缓存{参数号: 原始值}，来自整段读取或校验过的写入，跨多轮上传保留。
+        # 写入或校验失败、通讯中断、非本机命令引起的运行状态变化（如面板操作）时使该温控器的缓存失效
+        self.program_cache = {1: {}, 2: {}}
+        self.zone_state = {1: None, 2: None}
+        self.commanded_state = {1: None, 2: None}
+        # 程序上传期间只发送控制命令，新的上传和设定值写入留到本次上传结束后
+        self.uploading = False
+        # 写命令应答延迟统计，超过slow_ack（s）的命令才打印
+        self.slow_ack = 0.5
+        self.ack_count = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+
+    def poll(self):
+        """
+        由串口引擎在收发线程中调用：发送待处理的写命令和程序读取请求，到读取时间时读取两个温区，
+        返回距下一次读取的秒数；两次读取之间入队的写命令通过wake()立即发送
+        """
         try:
+            self.drain_commands()
             while True:
-                if self.stop:
-                    self.aiBUSParam.DisConnect()
-                    self.aiBUSParam = None
+                if self.program_req.empty() or not self.data_queue.empty():
                     break
-                while True:
-                    if self.data_queue.empty():
-                        break
-                    else:
-                        data = self.data_queue.get()
-                        print(f'data: {[data.Value, data.iDevAdd, data.iParamNo]}')
-                        self.write_comm(data)
-                while True:
-                    if self.program_req.empty() or not self.data_queue.empty():
-                        break
-                    data = self.program_req.get()
-                    program = self.read_program()
-                    if program:
-                        self.program_signal.emit(program)
+                data = self.program_req.get()
+                program = self.read_program()
+                if program:
+                    self.program_signal.emit(program)
+            if time.monotonic() >= self.next_read:
                 result = self.read_comm()
+                self.next_read = time.monotonic() + self.poll_interval
                 if result:
                     self.result_signal.emit(result)
-                self.sleep(1)
         except Exception as e:
             print(f'An error occurred when emit temp data: {e}')
+        return max(0, self.next_read - time.monotonic())
+
+    def shutdown(self):
+        if self.aiBUSParam:
+            self.aiBUSParam.DisConnect()
+            self.aiBUSParam = None
 
     def read_comm(self):
         if self.aiBUSParam:
             try:
                 for i in range(2):
-                    self.aiBUSParam.ReadParam(iParamNo=74, iDevAdd=i+1)
-                    pv = self.aiBUSParam.ParamValue
-                    self.aiBUSParam.ReadParam(iParamNo=75, iDevAdd=i+1)
-                    sv = self.aiBUSParam.ParamValue
-                    self.aiBUSParam.ReadParam(iParamNo=76, iDevAdd=i+1)
-                    mv = self.aiBUSParam.ParamValue
-                    self.aiBUSParam.ReadParam(iParamNo=46, iDevAdd=i+1)
-                    step = self.aiBUSParam.ParamValue
-                    self.aiBUSParam.ReadParam(iParamNo=47, iDevAdd=i+1)
-                    tim = self.aiBUSParam.ParamValue
-                    self.aiBUSParam.ReadParam(iParamNo=27, iDevAdd=i+1)
-                    state = self.aiBUSParam.ParamValue
-                    # pv = 60
-                    # sv = 80
-                    # mv = 0
-                    # step = -1
-                    # tim = 1.5
-                    # state = 0
-                    if None in [pv, sv, mv, step, tim, state]:
-                        self.result[i] = None
-                    else:
-                        self.result[i] = TempOutputData(pv, sv, mv, step, tim, state)
+                    self.snapshot.write(i, self.read_zone(i+1))
             except Exception as e:
                 print(f'An error occurred when reading temp params: {e}')
-        return self.result
+        return self.snapshot.publish()
+
+    def read_zone(self, iDevAdd):
+        """
+        每个温区读取三帧（46段号、47段时间、27运行状态），PV/SV/MV和报警位取自应答本身，
+        替代逐项读取74/75/76的六帧。每帧之前先发送待处理的写命令
+        """
+        snapshot = self.aiBUSParam.ReadZone(iDevAdd, beforeFrame=self.drain_commands)
+        if snapshot is None:
+            # 通讯中断期间温控器可能重新上电或被修改，恢复后重新读取程序
+            self.invalidate_program(iDevAdd)
+            self.zone_state[iDevAdd] = None
+            return None
+        self.check_zone_state(iDevAdd, snapshot[27])
+        return TempOutputData(snapshot['pv'], snapshot['sv'], snapshot['mv'], snapshot[46], snapshot[47], snapshot[27],
+                              snapshot['alarm'])
 
     def read_program(self):
         print(f'reading programs')
@@ -118,8 +143,10 @@ class TempWorker(QThread):
                 pgm_times = []
                 i = 0
                 while i < 50:
-                    temp_a = self.aiBUSParam.ReadParam(iParamNo=i * 2 + 80, iDevAdd=idev)
-                    time_a = self.aiBUSParam.ReadParam(iParamNo=i * 2 + 81, iDevAdd=idev)
+                    self.drain_commands()
+                    # 缓存中已有的参数不再读取
+                    temp_a = self.read_program_param(i * 2 + 80, idev)
+                    time_a = self.read_program_param(i * 2 + 81, idev)
                     if temp_a and time_a:
                         pgm_temps.append(float(temp_a/10))
                         pgm_times.append(float(time_a/10))
@@ -139,17 +166,154 @@ class TempWorker(QThread):
             print(e)
             return None
 
-    def write_comm(self, data: TempInputData):
-        self.aiBUSParam.SetParam(iParamNo=data.iParamNo, Value=data.Value, iDevAdd=data.iDevAdd)
+    def drain_commands(self):
+        """发送待处理的写命令；程序上传期间只发送控制命令，避免在一次上传中嵌套执行另一次上传"""
+        if self.uploading:
+            return self.data_queue.drain(self.handle_command, PRIORITY_CONTROL)
+        return self.data_queue.drain(self.handle_command)
+
+    def check_zone_state(self, iDevAdd, state):
+        """
+        运行状态变化不是本机写入参数27引起的（程序结束自动停止除外），
+        说明有人在面板上操作过，程序也可能被修改，使缓存失效
+        """
+        previous = self.zone_state[iDevAdd]
+        self.zone_state[iDevAdd] = state
+        if previous is None or state == previous:
+            return
+        if state != self.commanded_state[iDevAdd] and state != ZONE_STATE_STOP:
+            print(f'temp dev {iDevAdd} state changed {previous} -> {state} outside this program, reload program')
+            self.invalidate_program(iDevAdd)
+        self.commanded_state[iDevAdd] = None
+
+    def invalidate_program(self, iDevAdd=None):
+        """使程序参数缓存失效，下次读取或上传时重新从设备读取；iDevAdd为None时两个温控器都失效"""
+        for idev in ([iDevAdd] if iDevAdd is not None else list(self.program_cache)):
+            self.program_cache[idev].clear()
+
+    def read_program_param(self, iParamNo, iDevAdd):
+        cache = self.program_cache[iDevAdd]
+        if iParamNo not in cache:
+            value = self.aiBUSParam.ReadParam(iParamNo=iParamNo, iDevAdd=iDevAdd)
+            if value is None:
+                return None
+            cache[iParamNo] = value
+        return cache[iParamNo]
+
+    def upload_program(self, data: TempProgramUpload):
+        """
+        差分上传程序：缓存中没有的参数先从设备读取一次，与缓存比较后只写入变化的参数，再只读回写入过的参数校验。
+        返回写入并校验通过的参数个数，校验失败时返回None
+        """
+        self.uploading = True
+        try:
+            return self.upload_program_params(data)
+        finally:
+            self.uploading = False
+
+    def upload_program_params(self, data: TempProgramUpload):
+        start = time.perf_counter()
+        frame_time = []
+        changed = []
+        failed = []
+        cache = self.program_cache[data.iDevAdd]
+        seeded = 0
+        for i in range(len(data.values)):
+            iParamNo = data.startParam + i
+            if iParamNo not in cache:
+                self.drain_commands()
+                value = self.aiBUSParam.ReadParam(iParamNo=iParamNo, iDevAdd=data.iDevAdd)
+                frame_time.append(self.aiBUSParam.transport.last_duration)
+                seeded += 1
+                if value is not None:
+                    cache[iParamNo] = value
+        for i, value in enumerate(data.values):
+            iParamNo = data.startParam + i
+            try:
+                raw = int(value * 10) & 0xFFFF  # 与SetParam相同的换算，读回为无符号16位
+            except Exception as e:
+                print(f'invalid program value {value} for param {iParamNo}: {e}')
+                continue
+            if cache.get(iParamNo) != raw:
+                changed.append((iParamNo, value, raw))
+        for iParamNo, value, raw in changed:
+            self.drain_commands()
+            cache.pop(iParamNo, None)
+            if self.aiBUSParam.SetParam(iParamNo=iParamNo, Value=value, iDevAdd=data.iDevAdd) is None:
+                failed.append(iParamNo)
+            frame_time.append(self.aiBUSParam.transport.last_duration)
+        for iParamNo, value, raw in changed:
+            read = self.aiBUSParam.ReadParam(iParamNo=iParamNo, iDevAdd=data.iDevAdd)
+            frame_time.append(self.aiBUSParam.transport.last_duration)
+            if read == raw:
+                cache[iParamNo] = raw
+            elif iParamNo not in failed:
+                failed.append(iParamNo)
+        # 全量上传每个参数需要写一帧、读回一帧；这里的帧数包括缓存缺失时的预读
+        print(f'temp program dev {data.iDevAdd}: read {seeded}, wrote {len(changed)}/{len(data.values)} params, '
+              f'{len(frame_time)} frames (full upload {2 * len(data.values)}) in {time.perf_counter() - start:.2f} s')
+        if failed:
+            print(f'temp program dev {data.iDevAdd}: verify failed on params {failed}')
+            # 设备上的程序状态不确定，下次整段重新读取
+            self.invalidate_program(data.iDevAdd)
+            return None
+        return len(changed)
+
+    def handle_command(self, command):
+        data = command.payload
+        if isinstance(data, TempProgramUpload):
+            result = self.upload_program(data)
+            latency = command.acknowledge(result is not None)
+            self.ack_signal.emit({'iParamNo': data.startParam, 'iDevAdd': data.iDevAdd, 'Value': data.values,
+                                  'ok': command.ok, 'latency': latency})
+            return
+        result = self.write_comm(data)
+        latency = command.acknowledge(result is not None)
+        self.ack_count += 1
+        self.ack_total += latency
+        self.ack_max = max(self.ack_max, latency)
+        if latency > self.slow_ack:
+            print(f'temp param {data.iParamNo} dev={data.iDevAdd} slow ack in {latency * 1000:.1f} ms')
+        self.ack_signal.emit({'iParamNo': data.iParamNo, 'iDevAdd': data.iDevAdd, 'Value': data.Value,
+                              'ok': command.ok, 'latency': latency})
+
+    def ack_stats(self):
+        return {'count': self.ack_count, 'latency_avg': self.ack_total / self.ack_count if self.ack_count else 0.0,
+                'latency_max': self.ack_max}
 
-    def write_data(self, data: TempInputData):
-        self.data_queue.put(data)
+    def write_comm(self, data: TempInputData):
+        try:
+            if 80 <= data.iParamNo <= 179:
+                # 单独写入程序参数后缓存失效，下次读取程序时重新读取
+                self.program_cache[data.iDevAdd].pop(data.iParamNo, None)
+            if data.iParamNo == 27:
+                self.commanded_state[data.iDevAdd] = int(data.Value)
+            return self.aiBUSParam.SetParam(iParamNo=data.iParamNo, Value=data.Value, iDevAdd=data.iDevAdd)
+        except Exception as e:
+            print(f'An error occurred when write temp param: {e}')
+            return None
 
-    def read_program_settings(self):
+    def write_data(self, data: TempInputData, priority=None):
+        """写命令入队，运行/暂停/停止（参数27）优先于程序段写入"""
+        if priority is None:
+            priority = PRIORITY_CONTROL if data.iParamNo == 27 else PRIORITY_SETPOINT
+        command = self.data_queue.put(data, priority)
+        self.wake()
+        return command
+
+    def write_program(self, iDevAdd, values, startParam=80):
+        """程序参数整体入队，由工作线程差分上传"""
+        command = self.data_queue.put(TempProgramUpload(iDevAdd=iDevAdd, values=list(values), startParam=startParam),
+                                      PRIORITY_SETPOINT)
+        self.wake()
+        return command
+
+    def read_program_settings(self, refresh=False):
+        """请求读取两个温控器的程序，refresh为True时忽略缓存重新读取（如面板上修改过程序）"""
+        if refresh:
+            self.invalidate_program()
         self.program_req.put("req")
-
-    def stop_run(self):
-        self.stop = True
+        self.wake()
 
 
 class TempProgramTableDialog(QDialog):
@@ -0,0 +1,219 @@
+import struct
+import threading
+import time
+
+from program.SerialDev.simPort import LoopbackSerial
+
+CMD_READ = 82
+CMD_WRITE = 67
+
+# 运行状态（参数27）
+STATE_RUN = 0
+STATE_STOP = 1
+STATE_HOLD = 2
+
+PROGRAM_FIRST = 80
+PROGRAM_LAST = 179
+PROGRAM_END = -1210  # 时间写入-121（原始值-1210）表示程序结束，读回为6432.6
+
+
+class SimAIBUS:
+    """
+    单台模拟温控器：参数表 + 程序执行 + 一阶热惯性模型。
+    程序第i段温度为参数80+2(i-1)，时间（min）为参数81+2(i-1)，
+    段内设定值从本段温度线性变化到下一段温度；参数27写0运行、1停止、2暂停。
+    炉温按 dPV/dt = (ambient + gain*MV/100 - PV) / tau 变化，MV由PI调节器给出
+    """
+    def __init__(self, ambient=25.0, gain=1200.0, tau=120.0, kp=4.0, ki=0.05):
+        self.ambient = ambient
+        self.gain = gain
+        self.tau = tau
+        self.kp = kp
+        self.ki = ki
+        self.params = {}
+        self.pv = ambient
+        self.sv = ambient
+        self.mv = 0.0
+        self.integral = 0.0
+        self.state = STATE_STOP
+        self.step = 1
+        self.seg_elapsed = 0.0  # 当前段已运行时间（min）
+        self.alarm = 0
+
+    # ---------- 参数读写 ----------
+
+    def program_value(self, iParamNo):
+        return self.params.get(iParamNo, 0)
+
+    def read_param(self, iParamNo):
+        """返回参数的原始值（与应答字节6-7一致）"""
+        if iParamNo == 74:
+            return int(round(self.pv * 10))
+        if iParamNo == 75:
+            return int(round(self.sv * 10))
+        if iParamNo == 76:
+            return int(round(self.mv))
+        if iParamNo == 27:
+            return self.state
+        if iParamNo == 46:
+            return self.step
+        if iParamNo == 47:
+            return int(self.seg_elapsed * 10)
+        return self.params.get(iParamNo, 0)
+
+    def write_param(self, iParamNo, value):
+        if iParamNo == 27:
+            self.set_state(value)
+        elif iParamNo == 46:
+            self.step = max(1, value)
+            self.seg_elapsed = 0.0
+        else:
+            self.params[iParamNo] = value
+        return self.read_param(iParamNo)
+
+    def set_state(self, state):
+        if state not in (STATE_RUN, STATE_STOP, STATE_HOLD):
+            return
+        if state == STATE_RUN and self.state == STATE_STOP:
+            # 从停止状态运行时从当前段起点开始，并以当前炉温作为起点温度
+            self.seg_elapsed = 0.0
+        if state == STATE_STOP:
+            self.step = 1
+            self.seg_elapsed = 0.0
+        self.state = state
+
+    # ---------- 程序与热模型 ----------
+
+    def segment(self, step):
+        index = PROGRAM_FIRST + 2 * (step - 1)
+        if index + 1 > PROGRAM_LAST:
+            return None, PROGRAM_END
+        return self.program_value(index) / 10, self.program_value(index + 1)
+
+    def advance_program(self, minutes):
+        if self.state != STATE_RUN:
+            return
+        self.seg_elapsed += minutes
+        while True:
+            temp, raw_time = self.segment(self.step)
+            if temp is None or raw_time == PROGRAM_END or raw_time <= 0:
+                # 程序结束：停止并回到第一段
+                if temp is not None:
+                    self.sv = temp
+                self.set_state(STATE_STOP)
+                return
+            duration = raw_time / 10
+            if self.seg_elapsed < duration:
+                next_temp, _ = self.segment(self.step + 1)
+                if next_temp is None:
+                    next_temp = temp
+                self.sv = temp + (next_temp - temp) * self.seg_elapsed / duration
+                return
+            self.seg_elapsed -= duration
+            self.step += 1
+
+    def update(self, seconds):
+        """推进seconds秒（模拟时间），热模型按不超过1s的步长积分"""
+        while seconds > 0:
+            dt = min(seconds, 1.0)
+            seconds -= dt
+            self.advance_program(dt / 60)
+            if self.state == STATE_STOP:
+                self.mv = 0.0
+                self.integral = 0.0
+            else:
+                error = self.sv - self.pv
+                self.integral = min(max(self.integral + self.ki * error * dt, 0.0), 100.0)
+                self.mv = min(max(self.kp * error + self.integral, 0.0), 100.0)
+            self.pv += (self.ambient + self.gain * self.mv / 100 - self.pv) * dt / self.tau
+        # 正偏差/负偏差报警（位2/3），偏差超过10℃
+        self.alarm = 0
+        if self.state != STATE_STOP:
+            if self.pv - self.sv > 10:
+                self.alarm |= 1 << 2
+            elif self.sv - self.pv > 10:
+                self.alarm |= 1 << 3
+
+
+class AIBUSSimBus:
+    """
+    模拟一条总线上的多台AIBUS温控器（地址从1开始）。
+    accel为时间加速倍数：真实1秒对应模拟accel秒，便于加速测试升降温程序
+    """
+    def __init__(self, count=2, latency=0.02, accel=1.0, **model):
+        self.devices = {addr: SimAIBUS(**model) for addr in range(1, count + 1)}
+        self.latency = latency
+        self.accel = accel
+        self.lock = threading.Lock()
+        self.last_update = time.monotonic()
+        self.frames = 0
+
+    def update(self):
+        now = time.monotonic()
+        seconds = (now - self.last_update) * self.accel
+        self.last_update = now
+        for device in self.devices.values():
+            device.update(seconds)
+
+    def handle(self, request):
+        """处理一帧8字节请求，返回10字节应答；地址不存在或校验错误时不应答"""
+        request = bytes(request)
+        self.frames += 1
+        if len(request) != 8 or request[0] != request[1] or request[0] < 0x80:
+            return None
+        addr = request[0] - 0x80
+        command, iParamNo = request[2], request[3]
+        value = struct.unpack_from('<h', request, 4)[0]
+        with self.lock:
+            device = self.devices.get(addr)
+            if device is None:
+                return None
+            if command == CMD_READ:
+                parity = iParamNo * 256 + CMD_READ + addr
+            elif command == CMD_WRITE:
+                parity = iParamNo * 256 + CMD_WRITE + value + addr
+            else:
+                return None
+            if struct.unpack_from('<H', request, 6)[0] != parity & 0xFFFF:
+                return None
+            self.update()
+            if command == CMD_WRITE:
+                result = device.write_param(iParamNo, value)
+            else:
+                result = device.read_param(iParamNo)
+            return self.response(device, addr, result)
+
+    @staticmethod
+    def response(device, addr, value):
+        data = struct.pack('<HHBBH', int(round(device.pv * 10)) & 0xFFFF, int(round(device.sv * 10)) & 0xFFFF,
+                           int(device.mv) & 0xFF, device.alarm & 0xFF, value & 0xFFFF)
+        words = struct.unpack('<4H', data)
+        return data + struct.pack('<H', (sum(words) + addr) & 0xFFFF)
+
+
+if __name__ == "__main__":
+    # 基准：两个温区快照读取耗时，以及加速600倍运行一段升温程序
+    from program.TempCtrlDev.tempdev import AIBUSParam
+
+    bus = AIBUSSimBus(count=2, latency=0.02, accel=600)
+    aibus = AIBUSParam(portName=None, baudRate=9600, port=LoopbackSerial(bus, baudrate=9600))
+
+    start = time.perf_counter()
+    for idev in (1, 2):
+        for iParamNo in (74, 75, 76, 46, 47, 27):
+            aibus.ReadParam(iParamNo=iParamNo, iDevAdd=idev)
+    print(f'six-frame read, 2 zones   {(time.perf_counter() - start) * 1000:8.1f} ms')
+    start = time.perf_counter()
+    for idev in (1, 2):
+        aibus.ReadZone(idev)
+    print(f'zone snapshot, 2 zones    {(time.perf_counter() - start) * 1000:8.1f} ms')
+
+    # 25℃起，10min升到300℃，保温10min后结束
+    program = [25, 10, 300, 10, 300, -121]
+    for i, value in enumerate(program):
+        aibus.SetParam(iParamNo=80 + i, Value=value, iDevAdd=1)
+    aibus.SetParam(iParamNo=27, Value=0, iDevAdd=1)
+    for _ in range(25):
+        time.sleep(0.1)
+        zone = aibus.ReadZone(1)
+        print(f"step={zone[46]} t={zone[47]} state={zone[27]} pv={zone['pv']} sv={zone['sv']} mv={zone['mv']}")
@@ -1,23 +1,42 @@
 import math
 import struct
 import sys
-import time
 
 import serial
 
+from program.SerialDev.frameTransport import FrameTransport
+
+# 区域快照需要单独读取的参数：程序段号、段运行时间、运行状态。
+# PV/SV/MV和报警位包含在每一帧应答中，不必再读74/75/76
+ZONE_PARAMS = (46, 47, 27)
+
 
 class AIBUSParam:
-    def __init__(self, portName, baudRate=9600, dataBits=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopBits=serial.STOPBITS_ONE):
+    def __init__(self, portName, baudRate=9600, dataBits=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopBits=serial.STOPBITS_ONE,
+                 port=None, transport=None):
         self.ActualValue = None
         self.SetValue = None
+        self.OutputValue = None
+        self.AlarmBits = 0
         self.ParamValue = None
         self.HiAL = False
         self.LoAL = False
         self.dHAL = False
         self.dLAL = False
         self.orAL = False
-        self.MyCom = serial.Serial(port=portName, baudrate=baudRate, bytesize=dataBits, parity=parity,
-                                   stopbits=stopBits, timeout=0.15)
+        if transport is not None:
+            # 使用外部收发层（如serialEngine.EngineTransport，注册串口时需传exceptionLength=None）
+            self.transport = transport
+            self.MyCom = transport.MyCom
+            return
+        if port is not None:
+            # 传入已打开的串口对象（如aibusSim的回环串口），用于无硬件测试
+            self.MyCom = port
+        else:
+            self.MyCom = serial.Serial(port=portName, baudrate=baudRate, bytesize=dataBits, parity=parity,
+                                       stopbits=stopBits, timeout=0.15)
+        # AIBUS应答固定10字节，没有Modbus的异常应答帧
+        self.transport = FrameTransport(self.MyCom, exceptionLength=None)
 
     def IsConnect(self):
 
@@ -46,16 +65,33 @@ class AIBUSParam:
         data[4] = 0
         data[5] = 0
         data[6], data[7] = self.GetReadParity(iParamNo, iDevAdd)
-        write_len = self.MyCom.write(data)
-        time.sleep(0.08)
-        buffer = bytearray(10)
-        self.MyCom.readinto(buffer)
+        buffer = self.transport.transact(data, 10)
 
         if self.CheckResult(buffer, iDevAdd):
             return self.AnalyseParam(buffer, iParamNo)
 
         return None
 
+    def ReadZone(self, iDevAdd, iParamNos=ZONE_PARAMS, beforeFrame=None):
+        """
+        读取一个温区的快照：只读取iParamNos中的参数，PV/SV/MV和报警位取自最后一帧应答。
+        beforeFrame在每帧发送前调用（用于插入待发送的写命令）。
+        返回{'pv', 'sv', 'mv', 'alarm', 参数号: 值}，任一帧失败时返回None
+        """
+        snapshot = {}
+        for iParamNo in iParamNos:
+            if beforeFrame is not None:
+                beforeFrame()
+            value = self.ReadParam(iParamNo=iParamNo, iDevAdd=iDevAdd)
+            if value is None:
+                return None
+            snapshot[iParamNo] = value
+        snapshot['pv'] = self.ActualValue
+        snapshot['sv'] = self.SetValue
+        snapshot['mv'] = self.OutputValue
+        snapshot['alarm'] = self.AlarmBits
+        return snapshot
+
     def CheckResult(self, result, devld):
         if result != None and len(result) == 10:
             res = 0
@@ -73,6 +109,8 @@ class AIBUSParam:
         try:
             self.ActualValue = round((result[1] * 256 + result[0]) / 10, 1)
             self.SetValue = round((result[3] * 256 + result[2]) / 10, 1)
+            self.OutputValue = result[4]
+            self.AlarmBits = result[5]
             self.HiAL = self.GetBitFromByte(result[5], 0)
             if self.HiAL:
                 print(f'上限报警')
@@ -133,10 +171,7 @@ class AIBUSParam:
         data[4] = b[0]
         data[5] = b[1]
         data[6], data[7] = self.GetWriteParity(iParamNo, Value, iDevAdd)
-        self.MyCom.write(data)
-        time.sleep(0.05)
-        buffer = bytearray(10)
-        self.MyCom.readinto(buffer)
+        buffer = self.transport.transact(data, 10)
 
         if self.CheckResult(buffer, iDevAdd):
             return self.AnalyseParam(buffer, iParamNo)
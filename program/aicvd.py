@@ -16,7 +16,7 @@ import numpy as np
 import pandas as pd
 import qdarktheme
 import serial
-from PyQt5.QtCore import QTimer, QSignalBlocker, Qt, pyqtSignal, QUrl, QCoreApplication, QPoint, QLineF, QSize, QTime, \
+from PyQt5.QtCore import QTimer, QSignalBlocker, Qt, pyqtSignal, QUrl, QCoreApplication, QPoint, QLineF, QSize, \
     QObject, QEventLoop
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QFont, QColor
 from PyQt5.QtWidgets import (QMainWindow, QMessageBox, QMenu, QAction, QApplication, QDialog, QFileDialog,
@@ -26,14 +26,22 @@ from matplotlib import pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.ticker import MultipleLocator, FormatStrFormatter
 from modbus_tk import modbus_rtu
-from openpyxl.styles import Font, Alignment, PatternFill
 from serial.tools import list_ports
 
 from program.Flask import FlaskThread
 from program.MassFlowController.MFCWindow import MFCWorker, MFCInputData, MFCProgramTableDialog
+from program.MassFlowController.mfcSchedule import MFCScheduleEngine
 from program.MicroscopeDev import toupcam
 from program.MicroscopeDev.FocusWorker import FocusWorker
 from program.MicroscopeDev.ImageLabel import DrawableLabel
+from program.MicroscopeDev.frameGrabber import FrameGrabber
+from program.MicroscopeDev.overlaySprite import build_overlay
+from program.MicroscopeDev.videoEncoder import VideoEncoder
+from program.Plotting.lodPlot import HistoryChart
+from program.Plotting.ringPlot import RingChart
+from program.Recording.telemetryExport import TelemetryExportWorker
+from program.Recording.telemetryStore import TelemetryStore
+from program.SerialDev.serialEngine import shared_engine
 from program.TaskManagement.TaskManager import TaskManagerTableDialog
 from program.TempCtrlDev.TempWindow import TempProgramTableDialog, TempWorker, TempInputData
 from program.Ui_MainWindow import Ui_MainWindow
@@ -64,9 +72,15 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
     def __init__(self, parent=None):
         super(AICVD, self).__init__(parent)
-        self.cacheTempData = np.empty((0, 5))
-        self.cacheMFCData = np.empty((0, 3))
-        self.combinedData = None
+        # 记录期间的温度和流量采样写入磁盘遥测记录，内存中只保留尚未落盘的部分
+        self.telemetry_store = None
+        self.telemetry_dir = None
+        self.mfc_logged_time = [None for _ in range(16)]
+        # 停止记录后导出的格式，可选'xlsx'、'csv'、'parquet'、'feather'（后两种需要pyarrow）
+        self.export_formats = ('xlsx',)
+        # 导出时各通道对齐到温度记录的时刻，时间差超过该值（s）的通道留空
+        self.export_tolerance = 3.0
+        self.export_worker = None
         self.qimage = None
         self.num = 0
         self.buf =None
@@ -365,10 +379,11 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.onStopA()
         self.onStopB()
         # 停止流量计
-        for idev in range(self.mfc_dev_num):
-            if self.mfc_worker:
-                self.mfc_worker.write_data('switch',
-                                           MFCInputData(value=True, id=idev, addr=0))
+        self.stopMFCProgram()
+        if self.mfc_worker:
+            # 只发给在线设备：离线地址每个要等约150ms超时；偶发超时不会使设备离线（连续失败才判为离线），
+            # 站号0是0号设备，不能使用广播
+            self.mfc_worker.write_group(addr=0, value=True)
         self.IsLaunched = False
         self.BT_launch_experiment.setText("启动实验")
         print(f'停止实验')
@@ -434,15 +449,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 # 将参数写入对应设备
                 # 将温度程序参数写入温控设备
                 if self.temp_worker:
-                    for i in range(len(self.temperature_program_a)):
-                        iparam = 80 + i
-                        self.temp_worker.write_data(
-                            TempInputData(iParamNo=iparam, Value=self.temperature_program_a[i], iDevAdd=1))
+                    # 只上传与上一轮不同的程序段
+                    self.temp_worker.write_program(1, self.temperature_program_a)
                     self.lbl_buffer_a.setText(f'{self.temperature_program_name_a}')
-                    for i in range(len(self.temperature_program_b)):
-                        iparam = 80 + i
-                        self.temp_worker.write_data(
-                            TempInputData(iParamNo=iparam, Value=self.temperature_program_b[i], iDevAdd=2))
+                    self.temp_worker.write_program(2, self.temperature_program_b)
                     self.lbl_buffer_b.setText(f'{self.temperature_program_name_b}')
                     self.program_a = (self.temperature_program_a[0::2], self.temperature_program_a[1::2])
                     self.program_b = (self.temperature_program_b[0::2], self.temperature_program_b[1::2])
@@ -585,7 +595,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
         """保存快照并处理计数器和循环逻辑"""
         try:
             # 保存快照
-            if self.hcam and self.pData is not None and hasattr(self, 'auto_focus_dir'):
+            image = self.grab_image('focus')
+            if self.hcam and image is not None and hasattr(self, 'auto_focus_dir'):
                 # 获取当前年月日并格式化为字符串
                 current_date = datetime.now().strftime("%Y%m%d")
                 # 获取当前时分秒并格式化为字符串
@@ -598,7 +609,6 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 # 确保目录存在
                 os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-                image = QImage(self.pData, self.imgWidth, self.imgHeight, QImage.Format_RGB888)
                 image.save(filename)
                 gray_img = np.array(Image.open(filename).convert('L'))
 
@@ -794,6 +804,9 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.mfc_worker = None
         self.mfc_dev_num = 16
         self.mfcData = [None for _ in range(self.mfc_dev_num)]
+        # 设备在线表（由MFCWorker发布）以及界面上各槽位当前显示的连接状态
+        self.mfcPresence = [False for _ in range(self.mfc_dev_num)]
+        self.mfc_slot_connected = [None for _ in range(self.mfc_dev_num)]
         self.mfc_schedules = [{} for _ in range(self.mfc_dev_num)]
         self.button_group = None
         self.mfc_comm = None
@@ -811,7 +824,14 @@ class AICVD(QMainWindow, Ui_MainWindow):
             radio_button = self.findChild(QRadioButton, f'RB_mfc_{i}')
             if radio_button:
                 self.button_group.addButton(radio_button, i)
+        self.button_group.buttonClicked.connect(self.onSelectMFC)
         self.BT_connect_mfc.clicked.connect(self.onConnectMFC)
+        # 手动刷新设备元数据（满量程、单位、型号）
+        self.BT_mfc_refresh = QPushButton("刷新")
+        self.BT_mfc_refresh.setMinimumSize(QSize(60, 23))
+        self.BT_mfc_refresh.setEnabled(False)
+        self.BT_mfc_refresh.clicked.connect(self.onRefreshMFCMeta)
+        self.horizontalLayout_9.addWidget(self.BT_mfc_refresh)
         self.BT_set_mfc_sv.clicked.connect(self.onSetMFCSV)
         self.RB_mfc_vctrl.clicked.connect(self.onValueCtrl)
         self.RB_mfc_clean.clicked.connect(self.onSwitchClean)
@@ -824,8 +844,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
         self.timer_mfc_window = QTimer(self)
         self.timer_mfc_window.timeout.connect(self.updateMFCData)
-        self.timer_mfc_program = QTimer(self)
-        self.timer_mfc_program.timeout.connect(self.checkTime)
+        # 流量计程序执行线程，斜坡模式下相邻设定点之间按mfc_ramp_resolution秒线性插值
+        self.mfc_schedule_engine = None
+        self.mfc_ramp = False
+        self.mfc_ramp_resolution = 1.0
 
     def onSetMFCProgram(self):
         try:
@@ -850,11 +872,31 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
     def onLaunchMFCProgram(self):
         if self.mfc_worker:
-            for idev in range(self.mfc_dev_num):
-                self.mfc_worker.write_data('switch', MFCInputData(value=True, id=idev, addr=1))
-                self.mfc_worker.write_data('switch', MFCInputData(value=True, id=idev, addr=3))
+            # 全部设备切换到阀控、数字控制模式
+            self.mfc_worker.write_group(addr=1, value=True)
+            self.mfc_worker.write_group(addr=3, value=True)
             self.mfc_launch_time = time.time()
-            self.timer_mfc_program.start(1000)
+            self.stopMFCProgram()
+            engine = MFCScheduleEngine(self.mfc_worker, self.mfc_schedules, ramp=self.mfc_ramp,
+                                       rampResolution=self.mfc_ramp_resolution)
+            engine.finished_signal.connect(lambda: self.onMFCProgramFinished(engine))
+            self.mfc_schedule_engine = engine
+            engine.start()
+            self.BT_mfc_launchProgram.setText("重新启动")
+
+    def onMFCProgramFinished(self, engine):
+        # 程序执行完毕或被停止；重新启动后旧程序的完成信号不影响新程序
+        print(f'mfc schedule finished, max late {engine.max_late * 1000:.0f} ms')
+        if self.mfc_schedule_engine is engine:
+            self.mfc_schedule_engine = None
+        if self.mfc_schedule_engine is None:
+            self.BT_mfc_launchProgram.setText("启动")
+
+    def stopMFCProgram(self):
+        if self.mfc_schedule_engine:
+            self.mfc_schedule_engine.stop_run()
+            self.mfc_schedule_engine.wait()
+            self.mfc_schedule_engine = None
 
     def writeMFCProgram(self):
         try:
@@ -874,24 +916,6 @@ class AICVD(QMainWindow, Ui_MainWindow):
         except Exception as e:
             print(e)
 
-    def checkTime(self):
-        try:
-            time_since_launch = round(time.time() - self.mfc_launch_time)
-            for idev in range(self.mfc_dev_num):
-                for t in self.mfc_schedules[idev].keys():
-                    diff = t - time_since_launch
-                    if diff <= 0 and abs(diff) < 1:
-                        value = self.mfc_schedules[idev][t]
-                        self.writeToMFC(idev, value)
-        except Exception as e:
-            print(f'{e}')
-
-    def writeToMFC(self, idev, value):
-        # 写入设备
-        if self.mfc_worker:
-            print(f"Writing value {value} to device {idev} at {QTime.currentTime().toString('HH:mm:ss')}")
-            self.mfc_worker.write_data('sv', MFCInputData(value=value, id=idev))
-
     def createMFCFig(self):
         # 创建一个Figure和FigureCanvas
         self.figure_mfc, self.ax_mfc = plt.subplots(constrained_layout=False)
@@ -906,15 +930,15 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.mfc_time_range = 20
         self.xticks_interval = 4
         self.ax_mfc.xaxis.set_major_locator(MultipleLocator(self.xticks_interval))
-        ctime = time.time()
-        self.ax_mfc.set_xlim(ctime, ctime + self.mfc_time_range)
-        tick_locs = self.ax_mfc.get_xticks()
-        xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in tick_locs]
-        self.ax_mfc.set_xticks(tick_locs)
-        self.ax_mfc.set_xticklabels(xlabels)
-        self.ax_mfc.set_ylim(0, 100)  # 设置y轴的范围
-        self.line_mfc_pv = [self.ax_mfc.plot([], [], 'r-')[0] for _ in range(self.mfc_dev_num)]
-        self.line_mfc_sv = [self.ax_mfc.plot([], [], 'b-')[0] for _ in range(self.mfc_dev_num)]
+        self.ax_mfc.set_ylim(-1, 100)  # 设置y轴的范围
+        self.line_mfc_pv = [self.ax_mfc.plot([], [], 'r-', visible=False)[0] for _ in range(self.mfc_dev_num)]
+        self.line_mfc_sv = [self.ax_mfc.plot([], [], 'b-', visible=False)[0] for _ in range(self.mfc_dev_num)]
+        # 环形缓冲区+blit刷新，时间窗每次向前滚动1/4
+        self.mfc_chart = RingChart(self.canvas_mfc, self.ax_mfc, self.mfc_time_range, self.mfc_fps, yMin=-1,
+                                   growY=False)
+        for i in range(self.mfc_dev_num):
+            self.mfc_chart.add_series(('pv', i), self.line_mfc_pv[i])
+            self.mfc_chart.add_series(('sv', i), self.line_mfc_sv[i])
 
     def onConnectMFC(self):
         if self.mfc_worker:
@@ -925,19 +949,26 @@ class AICVD(QMainWindow, Ui_MainWindow):
     def startMFC(self):
         try:
             print(f'CBB_mfc_port:{self.CBB_mfc_port.currentText()}')
+            # 串口由共享引擎持有，流量计与温控器可接在同一个485适配器上
+            transport = shared_engine().client(self.CBB_mfc_port.currentText(), 'mfc',
+                                               baudRate=self.CBB_mfc_buadrate.currentText(),
+                                               stopBits=serial.STOPBITS_TWO)
             self.mfc_worker = MFCWorker(portName=self.CBB_mfc_port.currentText(),
-                                        baudRate=self.CBB_mfc_buadrate.currentText())
+                                        baudRate=self.CBB_mfc_buadrate.currentText(), transport=transport)
         except Exception as e:
             print(f"An error occurred connect to mfc comm: {e}")
             QMessageBox.critical(self, "Error", f"An error occurred connect to mfc comm: {e}")
         if self.mfc_worker:
             self.timer_mfc_window.start(self.mfc_time_interval)
             self.mfc_worker.result_signal.connect(self.handle_result_mfc)
+            self.mfc_worker.presence_signal.connect(self.handle_presence_mfc)
+            self.mfc_worker.set_selected(self.button_group.checkedId())
             self.mfc_worker.start()
             self.GB_mfc_setSV.setEnabled(True)
             self.GB_mfc_switch.setEnabled(True)
             self.GB_mfc_crtlmode.setEnabled(True)
             self.GB_mfc_dev.setEnabled(True)
+            self.BT_mfc_refresh.setEnabled(True)
             self.createMFCFig()
             self.BT_connect_mfc.setText("断开")
 
@@ -951,6 +982,7 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.GB_mfc_switch.setEnabled(False)
         self.GB_mfc_crtlmode.setEnabled(False)
         self.GB_mfc_dev.setEnabled(False)
+        self.BT_mfc_refresh.setEnabled(False)
         for i in range(self.mfc_dev_num):
             rb_mfc = self.findChild(QRadioButton, f'RB_mfc_{i}')
             rb_mfc.setEnabled(False)
@@ -960,15 +992,39 @@ class AICVD(QMainWindow, Ui_MainWindow):
             lbl_pv_mfc.setText("")
             lbl_sv_mfc = self.findChild(QLabel, f'lbl_sv_mfc_{i}')
             lbl_sv_mfc.setText("")
+        self.stopMFCProgram()
         if self.mfc_worker:
+            print(f'mfc command acks: {self.mfc_worker.ack_stats()}')
             self.mfc_worker.stop_run()
         self.mfc_worker = None
+        self.mfcPresence = [False for _ in range(self.mfc_dev_num)]
+        self.mfc_slot_connected = [None for _ in range(self.mfc_dev_num)]
         self.BT_connect_mfc.setText("连接")
 
+    def onSelectMFC(self, button):
+        # 选中的设备提高轮询频率
+        if self.mfc_worker:
+            self.mfc_worker.set_selected(self.button_group.checkedId())
+
+    def onRefreshMFCMeta(self):
+        if self.mfc_worker:
+            self.mfc_worker.refresh_meta()
+
     def handle_result_mfc(self, result):
-        self.mfcData = copy.deepcopy(result)
+        # 记录不可修改，直接使用worker发布的快照
+        self.mfcData = result
+        # 记录期间每台流量计的每次新读数都写入遥测记录，并标记当时选中的设备
+        if self.recordFlag and self.telemetry_store:
+            selected = self.button_group.checkedId()
+            for i, data in enumerate(result):
+                if data and data.timestamp != self.mfc_logged_time[i]:
+                    self.mfc_logged_time[i] = data.timestamp
+                    self.telemetry_store.append('mfc', data.timestamp, i, data.pv, data.sv, i == selected)
         # print(f'mfc result updated')
 
+    def handle_presence_mfc(self, presence):
+        self.mfcPresence = presence
+
     def onSetMFCSV(self):
         print(f'set value')
         try:
@@ -1003,11 +1059,21 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
     def updateMFCData(self):
         current_time = time.time()
-        points_num = int(self.mfc_time_range * self.mfc_fps)
 
         # 显示流量设定值和实际值
         for i in range(self.mfc_dev_num):
             try:
+                # 未连接的槽位只在状态变化时刷新一次界面
+                if not self.mfcPresence[i]:
+                    if self.mfc_slot_connected[i] is not False:
+                        rb_mfc = self.findChild(QRadioButton, f'RB_mfc_{i}')
+                        rb_mfc.setText(f'{i}: 未连接')
+                        rb_mfc.setEnabled(False)
+                        self.mfc_chart.set_visible(('pv', i), False)
+                        self.mfc_chart.set_visible(('sv', i), False)
+                        self.mfc_slot_connected[i] = False
+                    continue
+                self.mfc_slot_connected[i] = True
                 if self.mfcData[i]:
                     rb_mfc = self.findChild(QRadioButton, f'RB_mfc_{i}')
                     rb_mfc.setEnabled(True)
@@ -1021,14 +1087,6 @@ class AICVD(QMainWindow, Ui_MainWindow):
                         self.lbl_mfc_sv.setText(f'{self.mfcData[i].sv} {self.mfcData[i].unit}')
                         self.lbl_mfc_pv.setText(f'{self.mfcData[i].pv} {self.mfcData[i].unit}')
 
-                        # 统计最新的流量值
-                        if self.recordFlag:
-                            timestamp = int(time.time())
-                            mfc_pv = self.mfcData[i].pv
-                            mfc_sv = self.mfcData[i].sv
-                            new_row = np.array([[timestamp, mfc_pv, mfc_sv]])
-                            self.cacheMFCData = np.vstack((self.cacheMFCData, new_row))
-
                     # 显示控制模式
                     if self.button_group.checkedId() == i:
                         if self.mfcData[i].ctrl_mode == -1:
@@ -1059,57 +1117,23 @@ class AICVD(QMainWindow, Ui_MainWindow):
                             self.BT_set_mfc_sv.setEnabled(False)
                         self.lbl_mfc_sv_unit.setText(str(self.mfcData[i].unit))
 
-                    # 更新line_mfc_pv
-                    pv = self.mfcData[i].pv
-                    xdata_mfc_pv, ydata_mfc_pv = self.line_mfc_pv[i].get_data()
-                    xdata_mfc_pv = np.append(xdata_mfc_pv, current_time)
-                    ydata_mfc_pv = np.append(ydata_mfc_pv, pv)
-                    # 限制数据点数量，避免内存无限增长
-                    if len(xdata_mfc_pv) > points_num:  # 保留最近数据点
-                        xdata_mfc_pv = xdata_mfc_pv[-points_num:]
-                        ydata_mfc_pv = ydata_mfc_pv[-points_num:]
-                    # 更新line_mfc_sv
-                    sv = self.mfcData[i].sv
-                    xdata_mfc_sv, ydata_mfc_sv = self.line_mfc_sv[i].get_data()
-                    xdata_mfc_sv = np.append(xdata_mfc_sv, current_time)
-                    ydata_mfc_sv = np.append(ydata_mfc_sv, sv)
-                    # 限制数据点数量，避免内存无限增长
-                    if len(xdata_mfc_sv) > points_num:
-                        xdata_mfc_sv = xdata_mfc_sv[-points_num:]
-                        ydata_mfc_sv = ydata_mfc_sv[-points_num:]
-                    # 更新图表
-                    self.line_mfc_pv[i].set_data(xdata_mfc_pv, ydata_mfc_pv)
-                    self.line_mfc_sv[i].set_data(xdata_mfc_sv, ydata_mfc_sv)
-                    try:
-                        if self.button_group.checkedId() == i:
-                            self.line_mfc_pv[i].set_visible(True)
-                            self.line_mfc_sv[i].set_visible(True)
-                            tick_locs = self.ax_mfc.get_xticks()
-                            x_min = max(0, xdata_mfc_pv[-1] - self.mfc_time_range)
-                            x_max = xdata_mfc_pv[-1]
-                            if tick_locs[0] < x_min:
-                                tick_locs = tick_locs + self.xticks_interval
-                            xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in tick_locs]
-                            self.ax_mfc.set_xticks(tick_locs)
-                            self.ax_mfc.set_xticklabels(xlabels)
-                            self.ax_mfc.set_xlim(x_min, x_max)
-                            self.ax_mfc.relim()  # 重新计算轴的限制
-                            self.ax_mfc.autoscale_view()  # 自动缩放视图
-                            max_flow = max(self.mfcData[i].fs, self.mfcData[i].pv, self.mfcData[i].sv) * 1.4
-                            self.ax_mfc.set_ylim(-1, max_flow)
-                        else:
-                            self.line_mfc_pv[i].set_visible(False)
-                            self.line_mfc_sv[i].set_visible(False)
-                    except Exception as e:
-                        print(e)
+                    # 写入环形缓冲区，只显示选中设备的曲线
+                    self.mfc_chart.append(('pv', i), current_time, self.mfcData[i].pv)
+                    self.mfc_chart.append(('sv', i), current_time, self.mfcData[i].sv)
+                    selected = self.button_group.checkedId() == i
+                    self.mfc_chart.set_visible(('pv', i), selected)
+                    self.mfc_chart.set_visible(('sv', i), selected)
+                    if selected:
+                        max_flow = max(self.mfcData[i].fs, self.mfcData[i].pv, self.mfcData[i].sv) * 1.4
+                        self.mfc_chart.set_ylim(-1, max_flow)
                 else:
                     rb_mfc = self.findChild(QRadioButton, f'RB_mfc_{i}')
                     rb_mfc.setText(f'{i}: 未连接')
                     rb_mfc.setEnabled(False)
             except Exception as e:
                 print(e)
-        # 绘制更新后的图表
-        self.canvas_mfc.draw()
+        # 只重绘变化的曲线，坐标范围变化时才整图重绘
+        self.mfc_chart.redraw(current_time)
 
     # TEMPERATURE RELATED
     def init_tempctrl_ui(self):
@@ -1285,21 +1309,24 @@ class AICVD(QMainWindow, Ui_MainWindow):
         idev = current_index + 1
         try:
             if self.temp_worker:
-                for row in range(self.dialog.tableWidget.rowCount()):
-                    row_data = []
-                    for column in range(self.dialog.tableWidget.columnCount()):
-                        # 检查项是否存在，如果不存在则添加空字符串
-                        item = self.dialog.tableWidget.item(row, column) if self.dialog.tableWidget.item(row, column) else None
-                        row_data.append(item.text() if item else '')
-                        print(f'item: {item.text() if item else ""}, row: {row}, column: {column}')
-                        if item:
-                            if column != 0 and item.text():
-                                iparam = row * 2 + column + 79
-                                value = float(item.text())
-                                print(f'iparam: {iparam}, value: {value}')
-                                self.temp_worker.write_data(TempInputData(iParamNo=iparam, Value=value, iDevAdd=idev))
-                        else:
-                            break
+                table = self.dialog.tableWidget
+                cells = []
+                for row in range(table.rowCount()):
+                    for column in range(1, table.columnCount()):
+                        item = table.item(row, column)
+                        cells.append((row, column, item.text().strip() if item else ''))
+                # 末尾的空单元格不属于程序；程序中间的空单元格会让其后的程序段全部丢失，直接拒绝写入
+                while cells and not cells[-1][2]:
+                    cells.pop()
+                blank = [(row, column) for row, column, text in cells if not text]
+                if blank:
+                    row, column = blank[0]
+                    header = table.horizontalHeaderItem(column).text()
+                    print(f'blank program cell at row {row + 1}, column {header}')
+                    QMessageBox.critical(self, "Error", f"第{row + 1}段的“{header}”为空，请填写或删除该段后再写入")
+                    return
+                values = [float(text) for _, _, text in cells]
+                self.temp_worker.write_program(idev, values)
                 if idev == 1:
                     self.lbl_buffer_a.setText(f'{self.dialog.filename}')
                 else:
@@ -1320,7 +1347,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
     def start_temp(self):
         try:
             print(f'CBB_temp_port:{self.CBB_temp_port.currentText()}')
-            self.temp_worker = TempWorker(portName=f"{self.CBB_temp_port.currentText()}", baudRate=9600)
+            transport = shared_engine().client(f"{self.CBB_temp_port.currentText()}", 'temp', baudRate=9600,
+                                               stopBits=serial.STOPBITS_ONE, exceptionLength=None)
+            self.temp_worker = TempWorker(portName=f"{self.CBB_temp_port.currentText()}", baudRate=9600,
+                                          transport=transport)
         except Exception as e:
             print(f"An error occurred connect to temperature control device: {e}")
             QMessageBox.critical(self, "Error", f"An error occurred connect to temperature control device: {e}")
@@ -1344,6 +1374,7 @@ class AICVD(QMainWindow, Ui_MainWindow):
     def close_temp(self):
         try:
             self.timer_temperature_window.stop()
+            print(f'temp command acks: {self.temp_worker.ack_stats()}')
             self.temp_worker.stop_run()
             self.temp_worker=None
             self.figure_a.clf()
@@ -1389,15 +1420,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
         if self.total_set_time_a and self.total_set_time_b:
             self.temp_time_range = max(self.total_set_time_a, self.total_set_time_b) * 60
             ctime = time.time()
-            self.ax_a.set_xlim(ctime, ctime + self.temp_time_range - 1)
-            xticks = [ctime + i * self.temp_time_range / 4 for i in range(5)]
-            xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in xticks]
-            self.ax_a.set_xticks(xticks, xlabels)
-
-            self.ax_b.set_xlim(ctime, ctime + self.temp_time_range - 1)
-            xticks = [ctime + i * self.temp_time_range / 4 for i in range(5)]
-            xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in xticks]
-            self.ax_b.set_xticks(xticks, xlabels)
+            self.temp_chart_a.set_time_range(self.temp_time_range, ctime)
+            self.temp_chart_b.set_time_range(self.temp_time_range, ctime)
 
     def onSetTempThreshold(self):
         if self.IsThresholdSet:
@@ -1471,7 +1495,11 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.set_temp_xlim()
 
     def handle_result_temp(self, result):
-        self.tempdevData = copy.deepcopy(result)
+        # 记录不可修改，直接使用worker发布的快照
+        self.tempdevData = result
+        if self.recordFlag and self.telemetry_store and result[0] and result[1]:
+            self.telemetry_store.append('temp', result[0].timestamp, result[0].pv, result[0].sv, result[1].pv,
+                                        result[1].sv)
         # print(f'temp result updated')
 
     def onRunA(self):
@@ -1569,71 +1597,20 @@ class AICVD(QMainWindow, Ui_MainWindow):
             if self.tempdevData[0]:
                 # 绘制ZoneA温度曲线
                 if self.total_set_time_a and self.total_set_time_b:
-                    self.temp_time_range = max(self.total_set_time_a, self.total_set_time_b) * 60
-                x_data_pv_a, y_data_pv_a = self.line_pv_a.get_data()
-                if len(x_data_pv_a) > self.temp_time_range * self.temp_fps:
-                    x_data_pv_a = []
-                    y_data_pv_a = []
-                    self.ax_a.set_xlim(ctime, ctime + self.temp_time_range - 1)
-                    xticks = [ctime + i * self.temp_time_range / 4 for i in range(5)]
-                    xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in xticks]
-                    self.ax_a.set_xticks(xticks, xlabels)
-                x_data_pv_a = np.append(x_data_pv_a, ctime)
-                y_data_pv_a = np.append(y_data_pv_a, self.tempdevData[0].pv)
-
-                x_data_sv_a, y_data_sv_a = self.line_sv_a.get_data()
-                if len(x_data_sv_a) > self.temp_time_range * self.temp_fps:
-                    x_data_sv_a = []
-                    y_data_sv_a = []
-                x_data_sv_a = np.append(x_data_sv_a, ctime)
-                y_data_sv_a = np.append(y_data_sv_a, self.tempdevData[0].sv)
-                # 更新图形
-                self.line_pv_a.set_data(x_data_pv_a, y_data_pv_a)
-                self.line_sv_a.set_data(x_data_sv_a, y_data_sv_a)
-                self.max_temperature_a = max(self.max_temperature_a, max(self.tempdevData[0].pv,
-                                                                         self.tempdevData[0].sv) * 1.4)
-                self.ax_a.set_ylim(-5, self.max_temperature_a)
-                self.ax_a.relim()  # 重新计算坐标轴的界限
-                self.ax_a.autoscale_view(True, True, True)  # 自动缩放
-                self.canvas_a.draw()  # 重绘画布
+                    time_range = max(self.total_set_time_a, self.total_set_time_b) * 60
+                    if time_range != self.temp_time_range:
+                        self.temp_time_range = time_range
+                        self.temp_chart_a.set_time_range(time_range)
+                        self.temp_chart_b.set_time_range(time_range)
+                self.temp_chart_a.append('pv', ctime, self.tempdevData[0].pv)
+                self.temp_chart_a.append('sv', ctime, self.tempdevData[0].sv)
+                self.temp_chart_a.redraw(ctime)
             if self.tempdevData[1]:
                 # 绘制ZoneB温度曲线
-                x_data_pv_b, y_data_pv_b = self.line_pv_b.get_data()
-                if len(x_data_pv_b) > self.temp_time_range * self.temp_fps:
-                    x_data_pv_b = []
-                    y_data_pv_b = []
-                    self.ax_b.set_xlim(ctime, ctime + self.temp_time_range - 1)
-                    xticks = [ctime + i * self.temp_time_range / 4 for i in range(5)]
-                    xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in xticks]
-                    self.ax_b.set_xticks(xticks, xlabels)
-                x_data_pv_b = np.append(x_data_pv_b, ctime)
-                y_data_pv_b = np.append(y_data_pv_b, self.tempdevData[1].pv)
-
-                x_data_sv_b, y_data_sv_b = self.line_sv_b.get_data()
-                if len(x_data_sv_b) > self.temp_time_range * self.temp_fps:
-                    x_data_sv_b = []
-                    y_data_sv_b = []
-                x_data_sv_b = np.append(x_data_sv_b, ctime)
-                y_data_sv_b = np.append(y_data_sv_b, self.tempdevData[1].sv)
-                # 更新图形
-                self.line_pv_b.set_data(x_data_pv_b, y_data_pv_b)
-                self.line_sv_b.set_data(x_data_sv_b, y_data_sv_b)
-                self.max_temperature_b = max(self.max_temperature_b, max(self.tempdevData[1].pv,
-                                                                         self.tempdevData[1].sv) * 1.4)
-                self.ax_b.set_ylim(-5, self.max_temperature_b)
-                self.ax_b.relim()  # 重新计算坐标轴的界限
-                self.ax_b.autoscale_view(True, True, True)  # 自动缩放
-                self.canvas_b.draw()  # 重绘画布
-
-                # 点击记录按钮，开始搜集温度数据
-                if self.recordFlag:
-                    timestamp = int(time.time())
-                    pv_a = self.line_pv_a.get_ydata()[-1]
-                    sv_a = self.line_sv_a.get_ydata()[-1]
-                    pv_b = self.line_pv_b.get_ydata()[-1]
-                    sv_b = self.line_sv_b.get_ydata()[-1]
-                    new_row = np.array([[timestamp, pv_a, sv_a, pv_b, sv_b]])
-                    self.cacheTempData = np.vstack((self.cacheTempData, new_row))
+                self.temp_chart_b.append('pv', ctime, self.tempdevData[1].pv)
+                self.temp_chart_b.append('sv', ctime, self.tempdevData[1].sv)
+                self.temp_chart_b.redraw(ctime)
+                self.update_video_overlay()
 
             # 绘制进度条
             try:
@@ -1693,17 +1670,19 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.label_date_b = QLabel("date")
         self.VLayout_tempDisplay_b.addWidget(self.canvas_b)
 
-        # 设置时间轴的刻度和显示
+        # 设置时间轴的刻度和显示：时间窗为整个程序时长，超出后向右扩展并保留全程历史（降采样显示），
+        # 滚轮缩放到最近一段，双击恢复全程
         self.temp_time_range = 1200
-        ctime = time.time()
-        xticks = [ctime + i * self.temp_time_range / 4 + 1 for i in range(5)]
-        xlabels = [datetime.fromtimestamp(ts).strftime('%H:%M:%S') for ts in xticks]
-        self.ax_a.set_xlim(ctime + 1, ctime + self.temp_time_range)
-        self.ax_a.set_xticks(xticks, xlabels)
         self.ax_a.yaxis.set_major_formatter(FormatStrFormatter('%.1f'))
-        self.ax_b.set_xlim(ctime + 1, ctime + self.temp_time_range)
-        self.ax_b.set_xticks(xticks, xlabels)
         self.ax_b.yaxis.set_major_formatter(FormatStrFormatter('%.1f'))
+        self.ax_a.set_ylim(-5, self.max_temperature_a)
+        self.ax_b.set_ylim(-5, self.max_temperature_b)
+        self.temp_chart_a = HistoryChart(self.canvas_a, self.ax_a, self.temp_time_range, self.temp_fps, yMin=-5)
+        self.temp_chart_a.add_series('pv', self.line_pv_a)
+        self.temp_chart_a.add_series('sv', self.line_sv_a)
+        self.temp_chart_b = HistoryChart(self.canvas_b, self.ax_b, self.temp_time_range, self.temp_fps, yMin=-5)
+        self.temp_chart_b.add_series('pv', self.line_pv_b)
+        self.temp_chart_b.add_series('sv', self.line_sv_b)
 
     # MICROSCOPE RELATED
     def init_microscope_ui(self):
@@ -1713,10 +1692,12 @@ class AICVD(QMainWindow, Ui_MainWindow):
         self.out_video_path2 = None
         self.video_writer = None
         self.video_writer2 = None
+        self.video_overlay = None
         self.timer_camera = QTimer(self)
         self.imgWidth = 0
         self.imgHeight = 0
-        self.pData = None
+        # 取帧线程，界面、录像和对焦各自从中取最新帧
+        self.frame_grabber = None
         self.res = 0
         self.temp = toupcam.TOUPCAM_TEMP_DEF
         self.tint = toupcam.TOUPCAM_TINT_DEF
@@ -1768,7 +1749,15 @@ class AICVD(QMainWindow, Ui_MainWindow):
             try:
                 nFrame, nTime, nTotalFrame = self.hcam.get_FrameRate()
                 if nTime != 0:
-                    self.lbl_frame.setText("{}, fps = {:.1f}".format(nTotalFrame, nFrame * 1000.0 / nTime))
+                    text = "{}, fps = {:.1f}".format(nTotalFrame, nFrame * 1000.0 / nTime)
+                    if self.frame_grabber:
+                        display = self.frame_grabber.stats()['consumers'].get('display')
+                        if display:
+                            text += ", drop = {}".format(display['dropped'])
+                    if self.is_recording and self.video_writer2:
+                        stats = self.video_writer2.stats()
+                        text += ", rec queue = {}, rec drop = {}".format(stats['depth'], stats['dropped'])
+                    self.lbl_frame.setText(text)
             except Exception as e:
                 print(f'An error occurred when set nFrame: {e}')
             self.updateImage()
@@ -1779,9 +1768,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
         try:
             if self.hcam:
                 self.stop_recording()
+                # 先停止取帧线程，避免其在关闭中的句柄上调用PullImageV3
+                self.stop_frame_grabber()
                 self.hcam.Close()
                 self.hcam = None
-                self.pData = None
                 self.btn_open.setText("打开")
                 self.timer_camera.stop()
                 self.lbl_frame.clear()
@@ -1804,6 +1794,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
     def onResolutionChanged(self, index):
         try:
             if self.hcam:  #step 1: stop camera
+                # 取帧线程和旧尺寸的缓冲池先停用，再停止相机、修改分辨率
+                self.stop_frame_grabber()
                 self.hcam.Stop()
 
             self.res = index
@@ -1873,7 +1865,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
     def startCamera(self):
         try:
-            self.pData = bytes(toupcam.TDIBWIDTHBYTES(self.imgWidth * 24) * self.imgHeight)
+            # 每次启动（包括切换分辨率）按当前分辨率重新分配缓冲池
+            self.stop_frame_grabber()
+            self.frame_grabber = FrameGrabber(self.hcam, self.imgWidth, self.imgHeight)
+            self.frame_grabber.start()
             uimin, uimax, uidef = self.hcam.get_ExpTimeRange()
             self.slider_expoTime.setRange(uimin, uimax)
             self.slider_expoTime.setValue(uidef)
@@ -1954,8 +1949,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
             try:
                 self.autoFocusFlag = False
                 if 0 == self.cur.model.still:    # not support still image capture
-                    if self.pData is not None:
-                        image = QImage(self.pData, self.imgWidth, self.imgHeight, QImage.Format_RGB888)
+                    image = self.grab_image('snap')
+                    if image is not None:
                         self.count += 1
                         dtime = datetime.fromtimestamp(time.time()).strftime('%H%M%S')
                         out_image_path = os.path.join(image_directory_path, f'{self.exp_id}_{self.order}_{dtime}_{self.count}.jpg')
@@ -1995,8 +1990,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
             try:
                 self.autoFocusFlag = True
                 if 0 == self.cur.model.still:  # not support still image capture
-                    if self.pData is not None:
-                        image = QImage(self.pData, self.imgWidth, self.imgHeight, QImage.Format_RGB888)
+                    image = self.grab_image('snap')
+                    if image is not None:
                         self.count += 1
                         dtime = datetime.fromtimestamp(time.time()).strftime('%H%M%S')
                         out_image_path = os.path.join(image_directory_path,
@@ -2047,8 +2042,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
     def onBtnSnap2(self):
         try:
             if self.hcam:
-                if self.pData is not None:
-                    image = QImage(self.pData, self.imgWidth, self.imgHeight, QImage.Format_RGB888)
+                image = self.grab_image('snap')
+                if image is not None:
                     self.count += 1
                     painter = QPainter(image)
                     # 设置笔刷颜色和字体
@@ -2082,66 +2077,30 @@ class AICVD(QMainWindow, Ui_MainWindow):
 
     def saveToVideo(self, cv_img):
         try:
-            if self.figure_a and self.figure_b:
-                frame_a = np.frombuffer(self.canvas_a.buffer_rgba(), dtype=np.uint8).reshape(self.canvas_a.height(), self.canvas_a.width(), 4)
-                frame_b = np.frombuffer(self.canvas_b.buffer_rgba(), dtype=np.uint8).reshape(self.canvas_b.height(), self.canvas_b.width(), 4)
-                frame_c = cv_img
-                height1, width1 = frame_a.shape[:2]
-                height2, width2 = frame_b.shape[:2]
-                height3, width3 = frame_c.shape[:2]
-                # scale_factor_a = int(0.5*width3/width1)
-                # scale_factor_b = int(0.5*width3/width2)
-                scale_factor_a = 0.5*width3/width1
-                scale_factor_b = 0.5*width3/width2
-                frame_a = cv2.resize(frame_a, None, fx=scale_factor_a, fy=scale_factor_a)
-                frame_b = cv2.resize(frame_b, None, fx=scale_factor_b, fy=scale_factor_b)
-                height1, width1 = frame_a.shape[:2]
-                height2, width2 = frame_b.shape[:2]
-                # 定义小图要覆盖到大图的位置
-                big_image = self.overlay_image(frame_c, frame_a, (width3-width1-width2, 30))
-                big_image = self.overlay_image(big_image, frame_b, (width3-width2, 30))
-                self.video_writer2.write(big_image)
+            # 叠加图在曲线刷新时预先生成，这里只把帧和当前叠加图交给编码线程
+            self.video_writer2.write((cv_img, self.video_overlay))
         except Exception as e:
-            self.video_writer2.release()
             print(f'An error occurred when save video: {e}')
             traceback.print_exc()
 
-    def overlay_image(self, big_image, small_image, position):
-        """
-        将小图覆盖到大图的指定位置，考虑透明度。
-
-        :param big_image: 大图，numpy数组
-        :param small_image: 小图，numpy数组
-        :param position: 元组，表示小图左上角在大图上的位置(x, y)
-        :return: 覆盖后的大图，numpy数组
-        """
-        x, y = position
-        # 获取小图的尺寸
-        small_height, small_width = small_image.shape[:2]
-
-        # 检查小图是否具有透明度通道
-        if len(small_image.shape) == 3 and small_image.shape[2] == 4:
-            # 分离透明度通道
-            alpha_s = small_image[:, :, 3] / 255.0
-            alpha_l = 1 - alpha_s
-
-            # 提取小图的RGB通道
-            small_image_rgb = small_image[:, :, :3]
-
-            # 提取大图的覆盖区域
-            big_image_roi = big_image[y:y + small_height, x:x + small_width]
-
-            # 根据透明度合并图像
-            for c in range(3):
-                big_image_roi[:, :, c] = (alpha_s * small_image_rgb[:, :, c] +
-                                          alpha_l * big_image_roi[:, :, c])
+    def update_video_overlay(self):
+        """温度曲线刷新后重新生成录像叠加图（每秒一次），每帧不再重复读取画布和缩放"""
+        if not (self.is_recording and self.figure_a and self.figure_b and self.imgWidth):
+            return
+        try:
+            self.video_overlay = build_overlay([np.asarray(self.canvas_a.buffer_rgba()),
+                                                np.asarray(self.canvas_b.buffer_rgba())], self.imgWidth)
+        except Exception as e:
+            print(f'An error occurred when build video overlay: {e}')
 
-            # 将合并后的区域放回大图
-            big_image[y:y + small_height, x:x + small_width] = big_image_roi
-        else:
-            # 如果小图没有透明度通道，直接覆盖
-            big_image[y:y + small_height, x:x + small_width] = small_image
-        return big_image
+    def compose_video_frame(self, frames):
+        """合成录像画面：显微图像右上角叠加两个温区的曲线（在编码线程中调用）"""
+        cv_img, overlay = frames
+        if overlay is None:
+            return cv_img
+        # 第一路录像可能还在编码同一帧，叠加前先复制
+        frame = cv_img.copy()
+        return overlay.blend(frame)
 
     def onBtnSave(self):
         if self.is_recording:
@@ -2162,6 +2121,10 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 dtime = datetime.fromtimestamp(time.time()).strftime('%H%M%S')
                 self.out_video_path = os.path.join(video_directory_path, f'{self.exp_id}_{self.order}_{dtime}.mp4')
                 self.out_video_path2 = os.path.join(video_directory_path, f'{self.exp_id}_{self.order}_{dtime}_mix.mp4')
+                # 温度和流量数据边记录边写入磁盘，异常退出后数据仍保留在telemetry目录中
+                self.telemetry_dir = os.path.join(BASE_DIR, 'export', today_folder,
+                                                  f'telemetry_{self.exp_id}_{self.order}_{dtime}')
+                self.start_telemetry(self.telemetry_dir)
 
                 # x264供平台和大模型侧使用，日常使用mp4v格式
                 fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -2169,8 +2132,11 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 nFrame, nTime, nTotalFrame = self.hcam.get_FrameRate()
                 frame_rate = nFrame * 1000.0 / nTime
                 resolution = (self.imgWidth, self.imgHeight)
-                self.video_writer = cv2.VideoWriter(self.out_video_path, fourcc, frame_rate, resolution)
-                self.video_writer2 = cv2.VideoWriter(self.out_video_path2, fourcc, frame_rate, resolution)
+                # 两路录像各自在编码线程中写入，队列满时丢弃最早的帧，界面线程不等待编码
+                self.video_writer = VideoEncoder(self.out_video_path, fourcc, frame_rate, resolution, name='raw')
+                self.video_writer2 = VideoEncoder(self.out_video_path2, fourcc, frame_rate, resolution,
+                                                  transform=self.compose_video_frame, name='mix')
+                self.update_video_overlay()
                 # 开启自动对焦
                 self.startAutoFocus()
                 self.autoFocusFlag = True
@@ -2184,101 +2150,75 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 self.btn_save.setStyleSheet(self.default_color)
                 self.video_writer.release()
                 self.video_writer2.release()
+                self.video_overlay = None
+                for writer in (self.video_writer, self.video_writer2):
+                    stats = writer.stats()
+                    print(f"video {writer.stream_name}: {stats['written']} frames, {stats['dropped']} dropped, "
+                          f"encode avg {stats['encode_avg'] * 1000:.1f} ms max {stats['encode_max'] * 1000:.1f} ms, "
+                          f"max queue {stats['max_depth']}")
 
                 # 停止记录后导出温度和流量excel
-                self.recordFlag = False
-                max_rows = max(self.cacheTempData.shape[0], self.cacheMFCData.shape[0])
-                # 填充行数不足的数组
-                padded_temp = np.pad(self.cacheTempData, ((0, max_rows - self.cacheTempData.shape[0]), (0, 0)),
-                                     mode='constant')
-                padded_mfc = np.pad(self.cacheMFCData, ((0, max_rows - self.cacheMFCData.shape[0]), (0, 0)),
-                                    mode='constant')
-                self.combinedData = np.hstack((padded_temp, padded_mfc))  # 结果形状为 (max_rows, 8)
-                self.exportExcel()
-                self.cacheTempData = np.empty((0, 5))
-                self.cacheMFCData = np.empty((0, 3))
-                self.combinedData = None
+                self.stop_telemetry()
+                if self.telemetry_dir:
+                    self.exportTelemetry(self.telemetry_dir)
                 # 关闭自动对焦
                 self.stopAutoFocus()
                 self.autoFocusFlag = False
 
-    def exportExcel(self):
+    def start_telemetry(self, directory):
+        """开始记录温度和流量数据到磁盘"""
         try:
-            timestamps_temp = self.combinedData[:, 0]
-            abs_time_temp = [pd.Timestamp(ts, unit='s').strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-                        for ts in timestamps_temp]
-            rel_time_temp = [round(ts - timestamps_temp[0], 3) for ts in timestamps_temp]
-
-            timestamps_mfc = self.combinedData[:, 5]
-            abs_time_mfc = [pd.Timestamp(ts, unit='s').strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-                        for ts in timestamps_mfc]
-            rel_time_mfc = [round(ts - timestamps_mfc[0], 3) for ts in timestamps_mfc]
-
-            pv_a = self.combinedData[:, 1]
-            sv_a = self.combinedData[:, 2]
-            pv_b = self.combinedData[:, 3]
-            sv_b = self.combinedData[:, 4]
-            mfc_pv = self.combinedData[:, 6]
-            mfc_sv = self.combinedData[:, 7]
-            df = pd.DataFrame({
-                "温度绝对时间": abs_time_temp,
-                "温度相对时间(s)": rel_time_temp,
-                "PV_ZoneA": pv_a,
-                "SV_ZoneA": sv_a,
-                "PV_ZoneB": pv_b,
-                "SV_ZoneB": sv_b,
-                "流量绝对时间": abs_time_mfc,
-                "流量相对时间(s)": rel_time_mfc,
-                "mfc_pv": mfc_pv,
-                "mfc_sv": mfc_sv
+            self.stop_telemetry()
+            self.telemetry_store = TelemetryStore(directory, {
+                'temp': [('timestamp', np.float64), ('pv_a', np.float32), ('sv_a', np.float32),
+                         ('pv_b', np.float32), ('sv_b', np.float32)],
+                'mfc': [('timestamp', np.float64), ('id', np.uint8), ('pv', np.float32), ('sv', np.float32),
+                        ('selected', np.bool_)],
             })
-
-            # 路径管理（参考网页1的目录结构）
-            today = pd.Timestamp.now().strftime("%Y-%m-%d")
-            save_dir = os.path.join(BASE_DIR, 'export', today)
-            os.makedirs(save_dir, exist_ok=True)
-
-            # 生成文件名
-            filename = f"温区流量_{pd.Timestamp.now().strftime('%H%M%S')}.xlsx"
-            excel_path = os.path.join(save_dir, filename)
-
-            # 使用openpyxl引擎导出
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='双区温度', index=False)
-
-                # 获取工作表对象
-                workbook = writer.book
-                worksheet = writer.sheets['双区温度']
-
-                # 设置标题格式（参考网页5的样式配置）
-                header_font = Font(bold=True, color="FFFFFF")
-                header_fill = PatternFill(start_color='4F81BD', end_color='4F81BD', fill_type='solid')
-                for cell in worksheet[1]:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center')
-
-                # 设置列宽（参考网页4的列宽配置）
-                worksheet.column_dimensions['A'].width = 25
-                worksheet.column_dimensions['B'].width = 15
-
-            print(f"数据已导出至：{excel_path}")
+            self.mfc_logged_time = [None for _ in range(16)]
+            self.recordFlag = True
         except Exception as e:
-            print(f"导出异常：{str(e)}")
-            print(traceback.format_exc())
+            print(f'An error occurred when opening telemetry store: {e}')
+
+    def stop_telemetry(self):
+        self.recordFlag = False
+        if self.telemetry_store:
+            self.telemetry_store.close()
+            self.telemetry_store = None
+
+    def exportTelemetry(self, telemetryDir):
+        """在后台线程中从磁盘遥测记录导出数据，界面不再等待"""
+        if self.export_worker and self.export_worker.isRunning():
+            print('上一次导出尚未完成')
+            return
+        save_dir = os.path.join(BASE_DIR, 'export', datetime.now().strftime("%Y-%m-%d"))
+        base_name = f"温区流量_{datetime.now().strftime('%H%M%S')}"
+        self.export_worker = TelemetryExportWorker(telemetryDir, save_dir, base_name, self.export_formats,
+                                                   tolerance=self.export_tolerance)
+        self.export_worker.done_signal.connect(self.handle_export_done)
+        self.export_worker.start()
+
+    def handle_export_done(self, result):
+        if result['ok']:
+            for path in result['paths'].values():
+                print(f"数据已导出至：{path}")
+            print(f"{result['rows']} rows exported in {result['seconds']:.2f} s")
+        else:
+            print(f"导出异常：{result['error']}")
 
     @staticmethod
     def eventCallBack(nEvent, self):
         """callbacks come from toupcam.dll/so internal threads, so we use qt signal to post this event to the UI
-        thread"""
-        self.evtCallback.emit(nEvent)
+        thread; image events go straight to the frame grabber thread"""
+        if toupcam.TOUPCAM_EVENT_IMAGE == nEvent and self.frame_grabber:
+            self.frame_grabber.notify()
+        else:
+            self.evtCallback.emit(nEvent)
 
     def onevtCallback(self, nEvent):
         """this run in the UI thread"""
         if self.hcam:
-            if toupcam.TOUPCAM_EVENT_IMAGE == nEvent:
-                self.handleImageEvent()
-            elif toupcam.TOUPCAM_EVENT_EXPOSURE == nEvent:
+            if toupcam.TOUPCAM_EVENT_EXPOSURE == nEvent:
                 self.handleExpoEvent()
             elif toupcam.TOUPCAM_EVENT_TEMPTINT == nEvent:
                 self.handleTempTintEvent()
@@ -2291,20 +2231,40 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 self.closeCamera()
                 QMessageBox.warning(self, "Warning", "Camera disconnect.")
 
-    def handleImageEvent(self):
+    def stop_frame_grabber(self):
+        if self.frame_grabber:
+            self.frame_grabber.stop_run()
+            self.frame_grabber.wait()
+            self.frame_grabber = None
+
+    def grab_image(self, consumer, newOnly=False):
+        """从取帧线程取最新一帧并复制为QImage，没有图像时返回None"""
+        if not self.frame_grabber:
+            return None
+        frame = self.frame_grabber.acquire(consumer, newOnly)
+        if frame is None:
+            return None
         try:
-            self.hcam.PullImageV3(self.pData, 0, 24, 0, None)
-        except toupcam.HRESULTException:
-            pass
+            return QImage(frame.data, frame.width, frame.height, QImage.Format_RGB888).copy()
+        finally:
+            self.frame_grabber.release(frame)
 
     def updateImage(self):
-        image = QImage(self.pData, self.imgWidth, self.imgHeight, QImage.Format_RGB888)
-        newimage = image.scaled(self.lbl_video.width(), self.lbl_video.height(), Qt.KeepAspectRatio,
-                                Qt.FastTransformation)
-        self.lbl_video.setPixmap(QPixmap.fromImage(newimage))
+        # 只在有新帧时刷新显示，缩放结果是新图像，缩放完即可归还缓冲区
+        frame = self.frame_grabber.acquire('display') if self.frame_grabber else None
+        if frame is not None:
+            try:
+                image = QImage(frame.data, frame.width, frame.height, QImage.Format_RGB888)
+                newimage = image.scaled(self.lbl_video.width(), self.lbl_video.height(), Qt.KeepAspectRatio,
+                                        Qt.FastTransformation)
+            finally:
+                self.frame_grabber.release(frame)
+            self.lbl_video.setPixmap(QPixmap.fromImage(newimage))
         if self.is_recording:
             try:
-                qimage = image.convertToFormat(QImage.Format_RGB888)
+                qimage = self.grab_image('record')
+                if qimage is None:
+                    return
                 # 获取当前日期和时间
                 if self.tempdevData[0] and self.tempdevData[1]:
                     info = (f'{datetime.now().strftime("%Y-%m-%d %H:%M:%S")} '
@@ -2320,7 +2280,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
                 self.saveToVideo(cv_image)
             except Exception as e:
                 print(f'An error occurred when save video: {e}')
-                self.video_writer.release()
+                # 关闭两路录像并复位录像状态，避免之后每帧继续写入已关闭的编码器
+                self.stop_recording()
 
     def handleExpoEvent(self):
         time = self.hcam.get_ExpoTime()
@@ -2630,6 +2591,8 @@ class AICVD(QMainWindow, Ui_MainWindow):
         if self.video_writer:
             self.video_writer.release()
             self.video_writer = None
+        # 关闭前把尚未落盘的温度和流量数据写完
+        self.stop_telemetry()
         if self.hcam:
             self.closeCamera()
         if self.api_thread:
@@ -0,0 +1,42 @@
+import pytest
+
+from program.SerialDev.simPort import LoopbackSerial
+from program.TempCtrlDev.aibusSim import AIBUSSimBus, STATE_HOLD
+from program.TempCtrlDev.tempdev import AIBUSParam
+
+
+@pytest.fixture
+def bus():
+    return AIBUSSimBus(count=2, latency=0.001)
+
+
+@pytest.fixture
+def aibus(bus):
+    return AIBUSParam(portName=None, baudRate=115200, port=LoopbackSerial(bus, baudrate=115200, timeout=0.05))
+
+
+def test_read_zone_takes_pv_sv_mv_from_the_replies(bus, aibus):
+    device = bus.devices[1]
+    device.pv, device.sv, device.mv = 123.4, 200.0, 55
+    device.state = STATE_HOLD
+    snapshot = aibus.ReadZone(1)
+    assert snapshot[27] == STATE_HOLD and snapshot[46] == device.step
+    # 模拟炉温每帧都在变化，取值为最后一帧应答时的状态
+    assert snapshot['pv'] == pytest.approx(device.pv, abs=0.1)
+    assert snapshot['sv'] == 200.0
+    assert snapshot['mv'] == int(round(device.mv))
+    assert snapshot['alarm'] == aibus.AlarmBits
+
+
+def test_read_zone_params_and_before_frame(aibus):
+    calls = []
+    snapshot = aibus.ReadZone(2, iParamNos=(27,), beforeFrame=lambda: calls.append(True))
+    assert set(snapshot) == {27, 'pv', 'sv', 'mv', 'alarm'}
+    assert calls == [True]
+    aibus.ReadZone(2, beforeFrame=lambda: calls.append(True))
+    # 默认三帧，每帧之前调用一次
+    assert len(calls) == 4
+
+
+def test_read_zone_absent_device(aibus):
+    assert aibus.ReadZone(3) is None
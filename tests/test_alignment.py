@@ -0,0 +1,38 @@
+import numpy as np
+
+from program.Recording.alignment import align_telemetry, asof_indices
+
+TEMP = np.dtype([('timestamp', 'f8'), ('pv_a', 'f4'), ('sv_a', 'f4'), ('pv_b', 'f4'), ('sv_b', 'f4')])
+MFC = np.dtype([('timestamp', 'f8'), ('id', 'u1'), ('pv', 'f4'), ('sv', 'f4'), ('selected', '?')])
+
+
+def rows(dtype, values):
+    return np.array([tuple(v) for v in values], dtype=dtype)
+
+
+def test_asof_directions_and_tolerance():
+    source = [0.0, 1.0, 2.0, 10.0]
+    target = [-0.5, 0.4, 0.6, 2.0, 6.5, 20.0]
+    assert asof_indices(source, target, 1.0, 'backward').tolist() == [-1, 0, 0, 2, -1, -1]
+    assert asof_indices(source, target, 1.0, 'forward').tolist() == [0, 1, 1, 2, -1, -1]
+    assert asof_indices(source, target, 1.0, 'nearest').tolist() == [0, 0, 1, 2, -1, -1]
+    assert asof_indices(source, target, None, 'nearest').tolist() == [0, 0, 1, 2, 3, 3]
+    assert asof_indices([], target).tolist() == [-1] * len(target)
+
+
+def test_align_telemetry_per_device_columns():
+    temp = rows(TEMP, [(100.0, 20, 25, 30, 35), (101.0, 21, 25, 31, 35), (102.0, 22, 25, 32, 35)])
+    mfc = rows(MFC, [(100.1, 1, 5.0, 10.0, True), (101.9, 1, 6.0, 10.0, True), (96.0, 4, 1.0, 2.0, False)])
+    df = align_telemetry(temp, mfc, tolerance=0.5)
+    assert df['相对时间(s)'].tolist() == [0.0, 1.0, 2.0]
+    assert df['PV_ZoneB'].tolist() == [30, 31, 32]
+    assert df['MFC1_PV'].tolist()[0] == 5.0 and np.isnan(df['MFC1_PV'].iloc[1]) and df['MFC1_PV'].iloc[2] == 6.0
+    # 4号设备的记录超出容差，整列为空
+    assert df['MFC4_SV'].isna().all()
+
+
+def test_align_telemetry_unsorted_and_period():
+    temp = rows(TEMP, [(102.0, 22, 25, 32, 35), (100.0, 20, 25, 30, 35)])
+    df = align_telemetry(temp, rows(MFC, []), period=1.0)
+    assert df['绝对时间'].tolist() == [100.0, 101.0, 102.0]
+    assert df['PV_ZoneA'].tolist() == [20, 20, 22]
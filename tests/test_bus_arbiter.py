@@ -0,0 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import Future
+
+from program.SerialDev.busArbiter import BusArbiter
+from program.SerialDev.commandQueue import PRIORITY_CONTROL, PRIORITY_SETPOINT
+
+
+class Request:
+    def __init__(self, client, tag, age=0.0):
+        self.client = client
+        self.tag = tag
+        self.enqueued = time.monotonic() - age
+        self.future = Future()
+
+
+def drain(arbiter):
+    order = []
+    while True:
+        request = arbiter.pick()
+        if request is None:
+            return order
+        order.append(request.tag)
+
+
+def test_priority_then_round_robin():
+    arbiter = BusArbiter()
+    arbiter.register('temp', PRIORITY_SETPOINT)
+    arbiter.register('mfc', PRIORITY_SETPOINT)
+    arbiter.register('valve', PRIORITY_CONTROL)
+    for i in range(2):
+        arbiter.put(Request('temp', f't{i}'))
+        arbiter.put(Request('mfc', f'm{i}'))
+    arbiter.put(Request('valve', 'v0'))
+    assert drain(arbiter) == ['v0', 't0', 'm0', 't1', 'm1']
+    assert arbiter.stats()['temp']['served'] == 2
+
+
+def test_starving_request_goes_first():
+    arbiter = BusArbiter(maxWait=0.5)
+    arbiter.register('valve', PRIORITY_CONTROL)
+    arbiter.register('temp', PRIORITY_SETPOINT)
+    arbiter.put(Request('valve', 'v0'))
+    arbiter.put(Request('temp', 't0', age=1.0))
+    assert drain(arbiter) == ['t0', 'v0']
+    assert arbiter.stats()['temp']['wait_max'] >= 1.0
+
+
+def test_unregister_cancels_queued_requests():
+    arbiter = BusArbiter()
+    request = Request('mfc', 'm0')
+    arbiter.put(request)
+    assert arbiter.depth() == 1
+    arbiter.unregister('mfc')
+    assert request.future.cancelled()
+    assert arbiter.depth() == 0
+
+
+def test_get_waits_for_put():
+    async def main():
+        arbiter = BusArbiter()
+        getter = asyncio.ensure_future(arbiter.get())
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+        arbiter.put(Request('mfc', 'm0'))
+        return (await asyncio.wait_for(getter, 1)).tag
+    assert asyncio.run(main()) == 'm0'
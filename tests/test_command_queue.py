@@ -0,0 +1,47 @@
+import threading
+import time
+
+from program.SerialDev.commandQueue import CommandQueue, PRIORITY_CONTROL, PRIORITY_SETPOINT, PRIORITY_BACKGROUND
+
+
+def test_drain_by_priority_then_fifo():
+    queue = CommandQueue()
+    queue.put('sv1', PRIORITY_SETPOINT)
+    queue.put('refresh', PRIORITY_BACKGROUND)
+    queue.put('sv2', PRIORITY_SETPOINT)
+    queue.put('close', PRIORITY_CONTROL)
+    sent = []
+    assert queue.drain(lambda command: sent.append(command.payload)) == 4
+    assert sent == ['close', 'sv1', 'sv2', 'refresh']
+    assert queue.empty()
+
+
+def test_drain_max_priority_keeps_the_rest_in_order():
+    queue = CommandQueue()
+    queue.put('sv1', PRIORITY_SETPOINT)
+    queue.put('stop', PRIORITY_CONTROL)
+    queue.put('sv2', PRIORITY_SETPOINT)
+    sent = []
+    assert queue.drain(lambda command: sent.append(command.payload), PRIORITY_CONTROL) == 1
+    assert sent == ['stop']
+    assert queue.qsize() == 2
+    queue.drain(lambda command: sent.append(command.payload))
+    assert sent == ['stop', 'sv1', 'sv2']
+
+
+def test_acknowledge_records_latency():
+    queue = CommandQueue()
+    command = queue.put('sv')
+    assert command.latency is None
+    assert command.acknowledge(False) >= 0
+    assert command.ok is False
+
+
+def test_wait_handles_commands_and_stops_early():
+    queue = CommandQueue()
+    sent = []
+    threading.Timer(0.05, lambda: queue.put('sv')).start()
+    start = time.monotonic()
+    queue.wait(2, lambda command: sent.append(command.payload), lambda: bool(sent))
+    assert sent == ['sv']
+    assert time.monotonic() - start < 1
@@ -0,0 +1,37 @@
+from program.MassFlowController.mfcSim import MFCSimBank
+from program.SerialDev import modbusCodec as codec
+from program.SerialDev.frameTransport import FrameTransport
+from program.SerialDev.simPort import LoopbackSerial
+
+
+class CountingSerial(LoopbackSerial):
+    """记录超时设置次数的回环串口，pyserial每次设置超时都要重新配置串口"""
+    def __init__(self, *args, **kwargs):
+        self.timeout_sets = 0
+        super().__init__(*args, **kwargs)
+
+    def __setattr__(self, name, value):
+        if name in ('timeout', 'inter_byte_timeout'):
+            self.timeout_sets += 1
+        super().__setattr__(name, value)
+
+
+def test_timeouts_set_only_for_the_frame_tail_and_restored_once():
+    serialPort = CountingSerial(MFCSimBank(ids=[1], latency=0.001), baudrate=115200, timeout=0.05)
+    transport = FrameTransport(serialPort)
+    serialPort.timeout_sets = 0
+    request = codec.build_read_holding_registers(1, 0x10, 1)
+    for _ in range(3):
+        response = transport.transact_modbus(request)
+        assert codec.check_crc(response)
+        assert serialPort.timeout == 0.05 and serialPort.inter_byte_timeout is None
+    # 每次收发：剩余字节的超时和字节间隔各设置一次，结束时各恢复一次
+    assert serialPort.timeout_sets == 3 * 4
+
+
+def test_no_response_leaves_timeouts_untouched():
+    serialPort = CountingSerial(MFCSimBank(ids=[1], latency=0.001), baudrate=115200, timeout=0.02)
+    transport = FrameTransport(serialPort)
+    serialPort.timeout_sets = 0
+    assert transport.transact_modbus(codec.build_read_holding_registers(5, 0x10, 1)) == bytearray()
+    assert serialPort.timeout_sets == 0
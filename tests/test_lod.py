@@ -0,0 +1,36 @@
+import numpy as np
+
+from program.Plotting.lodPlot import MinMaxPyramid
+
+
+def build(n, spike=None):
+    pyramid = MinMaxPyramid(factor=4, depth=8)
+    for i in range(n):
+        pyramid.append(float(i), 100.0 if i == spike else 1.0)
+    return pyramid
+
+
+def test_query_limits_points_and_keeps_spike():
+    pyramid = build(20000, spike=12345)
+    x, y = pyramid.query(0, 20000, 1000)
+    assert len(x) <= 1000 + 4 * 8  # 最细可用层加上尚未合并的尾部
+    assert y.max() == 100.0
+    assert np.all(np.diff(x) >= 0)
+
+
+def test_query_small_range_returns_raw_points():
+    pyramid = build(1000)
+    x, y = pyramid.query(100, 110, 1000)
+    assert x[0] <= 100 and x[-1] >= 110
+    assert np.all(np.diff(x) == 1)
+
+
+def test_query_includes_unmerged_tail():
+    pyramid = build(1001)
+    x, _ = pyramid.query(0, 1000, 100)
+    assert x[-1] == 1000.0
+
+
+def test_empty_query():
+    x, y = MinMaxPyramid().query(0, 1, 10)
+    assert len(x) == len(y) == 0
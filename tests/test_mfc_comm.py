@@ -0,0 +1,81 @@
+import pytest
+
+from program.MassFlowController.MFCWindow import MFCWorker
+from program.MassFlowController.mfcSim import MFCSimBank
+from program.MassFlowController.mfcdev import MFCComm
+from program.SerialDev.simPort import LoopbackSerial
+
+
+@pytest.fixture
+def bank():
+    # tau=0：PV立即等于目标值，便于断言
+    return MFCSimBank(ids=[1, 2], latency=0.001, tau=0, fullScale=500)
+
+
+def loopback(bank):
+    return LoopbackSerial(bank, baudrate=115200, timeout=0.02)
+
+
+def test_read_batch_matches_single_reads(bank):
+    device = bank.devices[1]
+    device.write_coil(1, True)  # 阀控
+    device.write_register(0x11, 2048)
+    comm = MFCComm(portName=None, port=loopback(bank))
+    assert comm.meta[1].fs == 500
+    pv, sv, ctrl_mode, switch_state, unit, fs = comm.read_batch(1)
+    assert fs == 500
+    assert sv == comm.read_sv(1) == round(2048 * 500 / 4095, 1)
+    assert pv == comm.read_pv(1)
+    assert switch_state == 0b010
+    assert ctrl_mode == 1
+    assert unit == comm.read_unit(1)
+
+
+def test_read_batch_absent_device(bank):
+    comm = MFCComm(portName=None, port=loopback(bank))
+    assert comm.meta[3] is None
+    assert comm.read_batch(3) is None
+
+
+@pytest.mark.parametrize('multiCoil', [False, True])
+def test_write_switch_group(bank, multiCoil):
+    comm = MFCComm(portName=None, port=loopback(bank), multiCoil=multiCoil)
+    results = comm.write_switch_group([1, 2, 5], 1, [True, False, True])
+    assert results[1] is not None and results[2] is not None
+    assert results[5] is None
+    for id in (1, 2):
+        assert bank.devices[id].coils[1:4] == [True, False, True]
+
+
+def test_write_group_addresses_only_present_devices(bank):
+    worker = MFCWorker(portName=None, baudRate=115200, port=loopback(bank))
+    acks = []
+    worker.ack_signal.connect(acks.append)
+    worker.write_group(addr=1, value=True)
+    worker.data_queue.drain(worker.handle_command)
+    assert acks[0]['id'] == [1, 2] and acks[0]['ok']
+    assert bank.devices[1].coils[1] and bank.devices[2].coils[1]
+
+
+def test_presence_debounce_and_probe_backoff(bank):
+    worker = MFCWorker(portName=None, baudRate=115200, port=loopback(bank))
+    snapshot = worker.read_comm()
+    assert worker.presence[1] and worker.presence[2] and not worker.presence[3]
+    assert snapshot[1] is not None
+    bank.devices.pop(1)
+    # 连续失败未达到阈值之前保留元数据和上一次的状态
+    for failures in range(1, worker.absent_threshold):
+        worker.next_poll[1] = 0
+        worker.read_comm()
+        assert worker.presence[1] and worker.failures[1] == failures
+        assert worker.snapshot.read()[1] is not None
+        assert worker.mfc_comm.meta[1] is not None
+    worker.next_poll[1] = 0
+    worker.read_comm()
+    assert not worker.presence[1]
+    assert worker.snapshot.read()[1] is None
+    assert worker.mfc_comm.meta[1] is None
+    # 离线后重新探测的间隔按指数退避
+    interval = worker.probe_interval[1]
+    worker.mark_absent(1)
+    assert worker.probe_interval[1] == min(interval * 2, worker.probe_interval_max)
@@ -0,0 +1,62 @@
+import heapq
+import time
+
+from program.MassFlowController.mfcSchedule import MFCScheduleEngine, compile_schedules
+
+
+class StallingWorker:
+    """记录设定值写入的假worker，第一次写入时卡顿stall秒"""
+    def __init__(self, stall=0.0):
+        self.stall = stall
+        self.writes = []
+        self.step_times = {}
+
+    def set_step_times(self, id, times):
+        self.step_times[id] = times
+
+    def write_data(self, datatype, data):
+        if not self.writes:
+            time.sleep(self.stall)
+        self.writes.append((data.id, data.value))
+
+
+def pop_all(heap):
+    return [heapq.heappop(heap) for _ in range(len(heap))]
+
+
+def test_compile_orders_steps_across_devices():
+    steps = pop_all(compile_schedules([{'10': '5', 0: 1}, {5: 2}]))
+    assert [(step.due, step.id, step.value) for step in steps] == [(0, 0, 1), (5, 1, 2), (10, 0, 5)]
+    assert not any(step.ramp for step in steps)
+
+
+def test_compile_ramp_interpolates_between_points():
+    steps = pop_all(compile_schedules([{0: 0, 4: 8}], ramp=True, rampResolution=1.0))
+    assert [(step.due, step.value, step.ramp) for step in steps] == [
+        (0, 0, False), (1, 2, True), (2, 4, True), (3, 6, True), (4, 8, False)]
+
+
+def test_stall_sends_only_latest_due_step_per_device():
+    worker = StallingWorker(stall=0.35)
+    engine = MFCScheduleEngine(worker, [{0: 0, 0.5: 5}, {0: 1}], ramp=True, rampResolution=0.1)
+    engine.run()
+    dev0 = [value for id, value in worker.writes if id == 0]
+    assert dev0[0] == 0 and dev0[-1] == 5
+    # 卡顿期间到期的0.1-0.3s斜坡点合并为一次写入
+    assert len(dev0) < 6
+    assert dev0 == sorted(dev0)
+    assert [value for id, value in worker.writes if id == 1] == [1]
+    # 迟到时间按实际写入的步骤计算
+    assert 0 < engine.max_late < 0.35
+    # 设定点（不含斜坡中间点）交给worker提前加快轮询
+    assert len(worker.step_times[0]) == 2
+
+
+def test_stop_run_ends_schedule():
+    worker = StallingWorker()
+    engine = MFCScheduleEngine(worker, [{0: 1, 60: 2}])
+    finished = []
+    engine.finished_signal.connect(lambda: finished.append(True))
+    engine.stop_event.set()
+    engine.run()
+    assert finished and worker.writes == []
@@ -0,0 +1,53 @@
+from program.SerialDev import modbusCodec as codec
+
+
+def test_crc_matches_known_frame():
+    # mfcdev.read_pv文档中的读PV请求帧
+    frame = bytes.fromhex('01 03 00 10 00 01 85 CF')
+    assert codec.append_crc(frame[:-2]) == frame
+    assert codec.check_crc(frame)
+    assert codec.calc_crc16(frame[:-2]) == [0x85, 0xCF]
+
+
+def test_check_crc_rejects_corrupt_and_short_frames():
+    frame = bytearray(codec.build_read_holding_registers(1, 0x10, 2))
+    frame[3] ^= 0x01
+    assert not codec.check_crc(frame)
+    assert not codec.check_crc(b'\x01\x03')
+    assert not codec.check_crc(None)
+
+
+def test_response_length():
+    assert codec.response_length(codec.build_read_holding_registers(1, 0x10, 2)) == 9
+    assert codec.response_length(codec.build_read_coils(1, 0, 8)) == 6
+    assert codec.response_length(codec.build_read_coils(1, 0, 9)) == 7
+    assert codec.response_length(codec.build_write_single_coil(1, 0, True)) == 8
+    assert codec.response_length(codec.build_write_multiple_coils(1, 0, [True] * 4)) == 8
+    assert codec.response_length(b'\x01') is None
+
+
+def test_parse_read_registers():
+    response = codec.append_crc(bytes([1, codec.READ_HOLDING_REGISTERS, 4, 0x01, 0x02, 0xFF, 0xFE]))
+    assert codec.parse_read_registers(response, 1, 2) == (0x0102, 0xFFFE)
+
+
+def test_parse_read_bits():
+    response = codec.append_crc(bytes([2, codec.READ_COILS, 1, 0b00001010]))
+    assert codec.parse_read_bits(response, 2, 8) == [False, True, False, True, False, False, False, False]
+
+
+def test_parse_write_echo():
+    request = codec.build_write_single_register(3, 0x11, 0x0200)
+    assert codec.parse_write_echo(request, request) == (0x11, 0x0200)
+
+
+def test_parse_errors_are_structured():
+    assert codec.parse_read_registers(b'', 1, 2).kind == 'timeout'
+    response = bytearray(codec.append_crc(bytes([1, codec.READ_HOLDING_REGISTERS, 2, 0, 1])))
+    response[-1] ^= 0xFF
+    assert codec.parse_read_registers(response, 1, 1).kind == 'crc'
+    error = codec.parse_read_registers(codec.append_crc(bytes([1, 0x83, 0x02])), 1, 1)
+    assert error.kind == 'exception' and error.code == 0x02
+    assert not error
+    other_slave = codec.append_crc(bytes([2, codec.READ_HOLDING_REGISTERS, 2, 0, 1]))
+    assert codec.parse_read_registers(other_slave, 1, 1).kind == 'mismatch'
@@ -0,0 +1,56 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from program.Plotting.ringPlot import RingBuffer, RingChart
+
+
+def test_ring_buffer_wraps_and_keeps_contiguous_view():
+    ring = RingBuffer(3)
+    assert ring.last() is None
+    for i in range(5):
+        ring.append(i, i * 10)
+    x, y = ring.view()
+    assert list(x) == [2, 3, 4] and list(y) == [20, 30, 40]
+    assert ring.last() == (4, 40)
+    assert len(ring) == 3
+    # 视图是内部数组的切片，不复制
+    assert x.base is ring.x
+    ring.clear()
+    assert len(ring) == 0 and len(ring.view()[0]) == 0
+
+
+def make_chart(**kwargs):
+    figure, ax = plt.subplots()
+    canvas = FigureCanvasAgg(figure)
+    line, = ax.plot([], [])
+    chart = RingChart(canvas, ax, timeRange=10, fps=2, **kwargs)
+    chart.add_series('pv', line)
+    return chart, ax, line
+
+
+def test_chart_scrolls_and_grows_y():
+    chart, ax, line = make_chart()
+    start = ax.get_xlim()[0]
+    chart.append('pv', start + 1, 50)
+    assert ax.get_ylim()[1] >= 50 * chart.y_margin
+    chart.redraw(start + 1)
+    assert not chart.full_draw and chart.background is not None
+    chart.redraw(start + 11)
+    # 超出时间窗后按1/4窗长滚动
+    assert ax.get_xlim()[0] == start + 2.5
+    assert len(chart.series['pv'][1]) == 1
+
+
+def test_chart_page_mode_clears_and_resize_keeps_data():
+    chart, ax, line = make_chart(mode='page')
+    start = ax.get_xlim()[0]
+    for i in range(30):
+        chart.append('pv', start + i * 0.5, i)
+    assert len(chart.series['pv'][1]) == chart.capacity()
+    chart.set_time_range(20, start)
+    assert len(chart.series['pv'][1]) == 21
+    chart.follow(start + 25)
+    assert ax.get_xlim()[0] == start + 25
+    assert len(chart.series['pv'][1]) == 0
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+from PyQt5.QtCore import Qt
+
+from program.MassFlowController.MFCWindow import MFCWorker, MFCInputData
+from program.MassFlowController.mfcSim import MFCSimBank
+from program.SerialDev.serialEngine import SerialEngine
+from program.SerialDev.simPort import LoopbackSerial
+
+
+@pytest.fixture
+def engine():
+    engine = SerialEngine()
+    yield engine
+    engine.close()
+
+
+def wait_until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_worker_runs_on_engine(engine):
+    bank = MFCSimBank(ids=[1], latency=0.001, tau=0, fullScale=500)
+    serialPort = LoopbackSerial(bank, baudrate=115200, timeout=0.02)
+    engine.register_port('sim', serialPort)
+    transport = engine.client('sim', 'mfc', baudRate=115200)
+    worker = MFCWorker(portName='sim', baudRate=115200, transport=transport)
+    results, acks = [], []
+    # 直接连接：信号在收发线程中发出，测试中没有Qt事件循环
+    worker.result_signal.connect(results.append, Qt.DirectConnection)
+    worker.ack_signal.connect(acks.append, Qt.DirectConnection)
+    worker.start()
+    assert worker.isRunning()
+    assert wait_until(lambda: results)
+    assert results[-1][1].fs == 500
+
+    worker.write_data('switch', MFCInputData(value=True, id=1, addr=1))
+    assert wait_until(lambda: acks)
+    assert acks[0]['ok'] and bank.devices[1].coils[1]
+    # 写命令通过wake()立即发送，不等到下一次轮询
+    assert acks[0]['latency'] < worker.poll_normal
+
+    worker.stop_run()
+    assert worker.wait(2)
+    assert worker.mfc_comm is None
+    # 最后一个客户端断开后串口关闭并从引擎注销
+    assert not serialPort.is_open
+    assert 'sim' not in engine.ports
+    assert engine.stats() == {}
+
+
+def test_start_needs_engine_transport():
+    bank = MFCSimBank(ids=[1], latency=0.001, tau=0, fullScale=500)
+    worker = MFCWorker(portName=None, baudRate=115200, port=LoopbackSerial(bank, baudrate=115200, timeout=0.02))
+    with pytest.raises(ValueError):
+        worker.start()
@@ -0,0 +1,26 @@
+import pytest
+
+from program.SerialDev.telemetry import SnapshotBuffer, TelemetryRecord
+
+
+class Record(TelemetryRecord):
+    __slots__ = ('pv',)
+
+
+def test_publish_keeps_unread_devices_and_earlier_snapshots():
+    buffer = SnapshotBuffer(2)
+    buffer.write(0, Record(pv=1))
+    buffer.write(1, Record(pv=2))
+    first = buffer.publish()
+    buffer.write(0, Record(pv=3))
+    second = buffer.publish()
+    assert [record.pv for record in first] == [1, 2]
+    assert [record.pv for record in second] == [3, 2]
+    assert second[1] is first[1]
+    assert buffer.read() is second
+    assert buffer.seq == 2
+
+
+def test_records_are_read_only():
+    with pytest.raises(AttributeError):
+        Record(pv=1).pv = 2
@@ -0,0 +1,29 @@
+import numpy as np
+
+from program.Recording.telemetryExport import export_telemetry, format_timestamps
+from program.Recording.telemetryStore import TelemetryStore
+
+TEMP = np.dtype([('timestamp', 'f8'), ('pv_a', 'f4'), ('sv_a', 'f4'), ('pv_b', 'f4'), ('sv_b', 'f4')])
+MFC = np.dtype([('timestamp', 'f8'), ('id', 'u1'), ('pv', 'f4'), ('sv', 'f4'), ('selected', '?')])
+
+
+def test_format_timestamps():
+    assert format_timestamps(np.array([0.0, 1.2345])).tolist()[0].endswith('.000')
+    assert len(format_timestamps(np.array([]))) == 0
+
+
+def test_export_empty_recording(tmp_path):
+    TelemetryStore(str(tmp_path), {'temp': TEMP.descr, 'mfc': MFC.descr}).close()
+    assert export_telemetry(str(tmp_path), str(tmp_path / 'out'), 'run', formats=('csv',)) == ({}, 0)
+
+
+def test_export_csv(tmp_path):
+    store = TelemetryStore(str(tmp_path), {'temp': TEMP.descr, 'mfc': MFC.descr})
+    store.append('temp', 100.0, 20, 25, 30, 35)
+    store.append('mfc', 100.2, 2, 5.0, 10.0, True)
+    store.close()
+    paths, count = export_telemetry(str(tmp_path), str(tmp_path / 'out'), 'run', formats=('csv',))
+    assert count == 1
+    with open(paths['csv'], encoding='utf-8-sig') as f:
+        header = f.readline().strip().split(',')
+    assert header[:3] == ['绝对时间', '相对时间(s)', 'PV_ZoneA'] and header[-2:] == ['MFC2_PV', 'MFC2_SV']
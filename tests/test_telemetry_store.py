@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from program.Recording.telemetryStore import TelemetryStore, read_stream
+
+STREAMS = {
+    'temp': [('timestamp', np.float64), ('pv_a', np.float32), ('sv_a', np.float32)],
+    'mfc': [('timestamp', np.float64), ('id', np.uint8), ('pv', np.float32)],
+}
+
+
+def open_store(directory):
+    # 后台线程只在close()时写盘，测试结果不依赖定时
+    return TelemetryStore(str(directory), STREAMS, flushInterval=60, fsyncInterval=60, chunk=4)
+
+
+def test_append_close_and_read(tmp_path):
+    store = open_store(tmp_path)
+    for i in range(10):
+        store.append('temp', 100.0 + i, 20 + i, 25)
+    store.append('mfc', 100.5, 3, 1.5)
+    store.close()
+    temp = read_stream(str(tmp_path), 'temp')
+    assert len(temp) == 10
+    assert np.array_equal(temp['timestamp'], 100.0 + np.arange(10))
+    assert temp['pv_a'][-1] == 29
+    mfc = read_stream(str(tmp_path), 'mfc')
+    assert mfc['id'].tolist() == [3] and mfc['pv'][0] == np.float32(1.5)
+
+
+def test_torn_record_is_ignored_and_truncated_on_reopen(tmp_path):
+    store = open_store(tmp_path)
+    for i in range(3):
+        store.append('temp', float(i), i, i)
+    store.close()
+    path = os.path.join(str(tmp_path), 'temp.bin')
+    # 模拟写到一半时断电
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    assert len(read_stream(str(tmp_path), 'temp')) == 3
+
+    store = open_store(tmp_path)
+    assert store.row_count('temp') == 3
+    store.append('temp', 3.0, 3, 3)
+    store.close()
+    temp = read_stream(str(tmp_path), 'temp')
+    assert os.path.getsize(path) == 4 * temp.dtype.itemsize
+    assert temp['timestamp'].tolist() == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_empty_stream(tmp_path):
+    open_store(tmp_path).close()
+    assert len(read_stream(str(tmp_path), 'mfc')) == 0
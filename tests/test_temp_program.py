@@ -0,0 +1,109 @@
+import pytest
+
+from program.SerialDev.simPort import LoopbackSerial
+from program.TempCtrlDev.TempWindow import TempInputData, TempProgramUpload, TempWorker
+from program.TempCtrlDev.aibusSim import AIBUSSimBus, CMD_WRITE, STATE_HOLD, STATE_RUN
+
+PROGRAM = [25, 10, 300, 10, 300, -121]
+
+
+class CountingBus(AIBUSSimBus):
+    """记录写参数帧的模拟总线"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = []
+
+    def handle(self, request):
+        if len(request) == 8 and request[2] == CMD_WRITE:
+            self.writes.append(request[3])
+        return super().handle(request)
+
+
+@pytest.fixture
+def bus():
+    return CountingBus(count=2, latency=0.001)
+
+
+@pytest.fixture
+def worker(bus):
+    return TempWorker(portName=None, baudRate=115200, port=LoopbackSerial(bus, baudrate=115200, timeout=0.05))
+
+
+def test_upload_writes_only_changed_params(bus, worker):
+    assert worker.upload_program(TempProgramUpload(1, PROGRAM)) == len(PROGRAM)
+    assert worker.upload_program(TempProgramUpload(1, PROGRAM)) == 0
+    bus.writes.clear()
+    assert worker.upload_program(TempProgramUpload(1, PROGRAM[:2] + [350] + PROGRAM[3:])) == 1
+    assert bus.writes == [82]
+
+
+def test_upload_seeds_cache_from_device(bus, worker):
+    # 设备上已有同样的程序，缓存为空时先读取一次，不再重写
+    for i, value in enumerate(PROGRAM):
+        bus.devices[2].write_param(80 + i, int(value * 10) & 0xFFFF)
+    assert worker.upload_program(TempProgramUpload(2, PROGRAM)) == 0
+    assert bus.writes == []
+
+
+def test_cache_kept_across_rounds(bus, worker):
+    worker.upload_program(TempProgramUpload(1, PROGRAM))
+    bus.writes.clear()
+    frames = bus.frames
+    assert worker.upload_program(TempProgramUpload(1, PROGRAM)) == 0
+    assert bus.frames == frames
+
+
+def test_explicit_invalidate_shows_front_panel_edit(bus, worker):
+    worker.upload_program(TempProgramUpload(1, PROGRAM))
+    bus.devices[1].write_param(80, 500)
+    assert worker.read_program()[0][0][0] == 25.0
+    worker.invalidate_program(1)
+    assert worker.read_program()[0][0][0] == 50.0
+
+
+def test_uncommanded_state_change_invalidates_cache(bus, worker):
+    worker.upload_program(TempProgramUpload(1, PROGRAM))
+    worker.read_zone(1)
+    # 本机发出的运行命令不使缓存失效
+    worker.write_comm(TempInputData(iParamNo=27, Value=STATE_RUN, iDevAdd=1))
+    worker.read_zone(1)
+    assert worker.program_cache[1]
+    # 面板上暂停并修改程序
+    bus.devices[1].set_state(STATE_HOLD)
+    bus.devices[1].write_param(80, 700)
+    worker.read_zone(1)
+    assert worker.read_program()[0][0][0] == 70.0
+
+
+def test_lost_zone_invalidates_cache(bus, worker):
+    worker.upload_program(TempProgramUpload(2, PROGRAM))
+    device = bus.devices.pop(2)
+    assert worker.read_zone(2) is None
+    assert not worker.program_cache[2]
+    bus.devices[2] = device
+
+
+def test_upload_defers_queued_uploads_but_sends_control(bus, worker):
+    queued = worker.write_program(1, [30, 5])
+    control = worker.write_data(TempInputData(iParamNo=27, Value=0, iDevAdd=1))
+    worker.upload_program(TempProgramUpload(2, PROGRAM))
+    assert control.ok
+    assert queued.ok is None
+    assert worker.data_queue.qsize() == 1
+    worker.drain_commands()
+    assert queued.ok
+
+
+def test_param_acks_are_counted_and_only_slow_ones_logged(worker, capsys):
+    acks = []
+    worker.ack_signal.connect(acks.append)
+    worker.write_data(TempInputData(iParamNo=27, Value=STATE_RUN, iDevAdd=1))
+    worker.data_queue.drain(worker.handle_command)
+    assert acks[0]['ok']
+    assert worker.ack_stats()['count'] == 1
+    assert 'ack' not in capsys.readouterr().out
+    worker.slow_ack = 0
+    worker.write_data(TempInputData(iParamNo=27, Value=STATE_HOLD, iDevAdd=1))
+    worker.data_queue.drain(worker.handle_command)
+    assert 'slow ack' in capsys.readouterr().out
+    assert worker.ack_stats()['count'] == 2